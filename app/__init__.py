@@ -3,7 +3,7 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 from flask import Flask, session, redirect, url_for, request
 from app.routes import main_bp, api_bp, auth_bp
-from app.utils.data_manager import DataManager
+from app.utils.data_manager import create_data_manager
 from functools import wraps
 
 # 全局应用实例，用于调度器在无上下文时访问
@@ -68,8 +68,8 @@ def create_app():
     app.logger = logger
     app.logger.info("应用初始化开始...")
     
-    # 初始化数据管理器
-    data_manager = DataManager()
+    # 初始化数据管理器，存储后端由环境变量 STORAGE_BACKEND 选择
+    data_manager = create_data_manager()
     app.config['DATA_MANAGER'] = data_manager
     
     # 初始化应用(包括调度器)
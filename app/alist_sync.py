@@ -1,12 +1,17 @@
 import http.client
 import json
 import re
+import select
+import time
 from datetime import datetime, timedelta
 import os
 import logging
-from typing import List, Dict, Optional, Union
+import threading
+import contextvars
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Union, Iterable, Iterator, NamedTuple, Tuple, Pattern
 from logging.handlers import TimedRotatingFileHandler
-from typing import List, Tuple, Pattern
 from urllib.parse import unquote
 
 def normalize_filename(name: str) -> str:
@@ -57,6 +62,23 @@ def setup_logger():
 # 初始化日志记录器
 logger = setup_logger()
 
+# 目录遍历默认并发数
+DEFAULT_MAX_WORKERS = 4
+# 每个服务器地址默认保持的长连接数
+DEFAULT_POOL_SIZE = 8
+# 单次请求默认超时时间（秒）
+DEFAULT_REQUEST_TIMEOUT = 30
+# 连接异常时的默认重试次数
+DEFAULT_MAX_RETRY = 3
+# 可以安全重发的 POST 接口（只读或重复执行结果相同），其他 POST 请求发送后出错时不重试
+IDEMPOTENT_POST_PATHS = frozenset(("/api/auth/login", "/api/fs/list", "/api/fs/get"))
+# 单次 copy/move/remove 请求合并的默认名称数
+DEFAULT_BATCH_SIZE = 100
+# 未完成复制任务列表的刷新间隔（秒）
+DEFAULT_UNDONE_TASK_TTL = 30
+# 未完成复制任务列表最多被查询多少次后刷新
+DEFAULT_UNDONE_TASK_MAX_LOOKUPS = 1000
+
 
 def parse_time_and_adjust_utc(date_str: str) -> datetime:
     """
@@ -84,11 +106,737 @@ def parse_time_and_adjust_utc(date_str: str) -> datetime:
     return None
 
 
-class AlistSync:
+class HTTPConnectionPool:
+    """
+    按服务器地址复用的HTTP(S)长连接池
+
+    - 最多保持 pool_size 个keep-alive连接，超出时请求排队等待
+    - 取出空闲连接前做健康检查，已被服务端关闭或空闲过久的连接会被丢弃重建
+    - 连接断开、超时等传输异常时丢弃该连接，仅在请求确定未到达服务端或请求幂等时使用新连接重试
+    """
+
+    # 传输层异常，发生时连接已不可用
+    TRANSPORT_ERRORS = (http.client.HTTPException, ConnectionError, TimeoutError, OSError)
+    # 复用的连接已被服务端关闭时发送或读取响应抛出的异常
+    STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT, max_idle: float = 60):
+        match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", base_url or "")
+        if not match:
+            raise ValueError("Invalid base URL format")
+        self.base_url = base_url
+        self.is_https = base_url.startswith("https://")
+        self.host = match.group(1)
+        self.port = int(match.group(2)) if match.group(2) else (443 if self.is_https else 80)
+        self.pool_size = max(1, int(pool_size or 1))
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []  # [(连接, 最后使用时间)]
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+    def resize(self, pool_size: int):
+        """调整连接池容量，仅允许扩大"""
+        with self._condition:
+            if pool_size and pool_size > self.pool_size:
+                self.pool_size = pool_size
+                self._condition.notify_all()
+
+    def _new_connection(self, timeout: float) -> Union[http.client.HTTPConnection, http.client.HTTPSConnection]:
+        """创建HTTP(S)连接"""
+        logger.debug(f"创建连接 - 主机: {self.host}, 端口: {self.port}")
+        if self.is_https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _is_healthy(self, connection, last_used: float) -> bool:
+        """检查空闲连接是否可复用"""
+        if time.monotonic() - last_used > self.max_idle:
+            return False
+        sock = connection.sock
+        if sock is None:
+            return True
+        try:
+            # 空闲连接上不应有可读数据，可读说明服务端已关闭连接
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _acquire(self, timeout: float):
+        """取出一个可用连接，连接数已满时等待"""
+        with self._condition:
+            while self._in_use >= self.pool_size:
+                self._condition.wait()
+            self._in_use += 1
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if self._is_healthy(connection, last_used):
+                    return connection, True
+                connection.close()
+        return self._new_connection(timeout), False
+
+    def _release(self, connection, reusable: bool):
+        """归还连接，不可复用的连接直接关闭"""
+        with self._condition:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                connection.close()
+            self._condition.notify()
+
+    def request(self, method: str, path: str, body: str = None, headers: Dict = None,
+                timeout: float = None, max_retry: int = DEFAULT_MAX_RETRY,
+                idempotent: bool = None) -> Tuple[int, bytes]:
+        """
+        发送请求并返回 (状态码, 响应体)
+
+        请求分为建立连接、发送、读取响应三个阶段，传输异常时按阶段决定是否重试:
+            - 建立连接失败: 请求未到达服务端，最多重试 max_retry 次
+            - 复用的连接在发送时失败: 视为陈旧连接，立即换新连接重试，不计入重试次数（最多 pool_size 次）
+            - 新连接发送失败或发送后失败（如读取响应超时）: 服务端可能已处理该请求，仅幂等请求重试，
+              非幂等请求（如 copy/move/remove）直接抛出异常，避免重复执行
+
+        参数:
+            idempotent: 请求是否幂等，默认仅 GET/HEAD 请求幂等
+
+        返回:
+            (状态码, 响应体)，无法重试时抛出最后一次异常
+        """
+        timeout = timeout or self.timeout
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        attempt = 0
+        stale_retries = 0
+        while True:
+            connection, reused = self._acquire(timeout)
+            reusable = False
+            phase = "connect"
+            try:
+                connection.timeout = timeout
+                if connection.sock is None:
+                    connection.connect()
+                connection.sock.settimeout(timeout)
+                phase = "send"
+                connection.request(method, path, body=body, headers=headers or {})
+                phase = "response"
+                response = connection.getresponse()
+                data = response.read()
+                reusable = not response.will_close
+                return response.status, data
+            except self.TRANSPORT_ERRORS as e:
+                stale = reused and isinstance(e, self.STALE_ERRORS) and (phase == "send" or idempotent)
+                if stale and stale_retries < self.pool_size:
+                    stale_retries += 1
+                    logger.debug(f"连接已失效，重新建立连接 - 路径: {path}")
+                    continue
+                if not idempotent and (phase == "response" or (phase == "send" and not reused)):
+                    logger.error(f"请求可能已到达服务端，不再重试 - 方法: {method}, 路径: {path}, 错误: {str(e)}")
+                    raise
+                if attempt >= max_retry:
+                    raise
+                attempt += 1
+                logger.warning(f"请求异常，第{attempt}次重试 - 方法: {method}, 路径: {path}, 错误: {str(e)}")
+                time.sleep(min(0.5 * attempt, 5))
+            finally:
+                self._release(connection, reusable)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+
+_connection_pools: Dict[str, HTTPConnectionPool] = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(base_url: str, pool_size: int = DEFAULT_POOL_SIZE,
+                        timeout: float = DEFAULT_REQUEST_TIMEOUT) -> HTTPConnectionPool:
+    """获取服务器地址对应的共享连接池，不存在时创建"""
+    key = (base_url or "").rstrip("/")
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            pool = HTTPConnectionPool(key, pool_size, timeout)
+            _connection_pools[key] = pool
+            logger.info(f"创建连接池 - 主机: {pool.host}, 端口: {pool.port}, 连接数: {pool.pool_size}")
+        else:
+            pool.resize(pool_size)
+        return pool
+
+
+def close_connection_pool(base_url: str):
+    """移除并关闭服务器地址对应的共享连接池（连接被修改或删除时调用），正在使用它的同步作业不受影响"""
+    key = (base_url or "").rstrip("/")
+    with _connection_pools_lock:
+        pool = _connection_pools.pop(key, None)
+    if pool is not None:
+        pool.close()
+        logger.info(f"关闭连接池 - 主机: {pool.host}, 端口: {pool.port}")
+
+
+def close_connection_pools():
+    """关闭所有共享连接池的空闲连接"""
+    with _connection_pools_lock:
+        pools = list(_connection_pools.values())
+        _connection_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class UndoneTaskIndex:
+    """
+    未完成复制任务索引
+
+    AList 复制任务名称格式为 "copy [源挂载路径](源文件路径) to [目标挂载路径](目标目录)"，
+    解析后按 (源目录, 目标目录, 文件名) 建立索引；无法解析的名称保留原有的子串匹配方式。
+    超过刷新间隔或查询次数上限后 begin_refresh() 返回True，由同步引擎重新获取任务列表。
+    """
+
+    TASK_NAME_PATTERN = re.compile(r"^copy \[(.*?)\]\((.*)\) to \[(.*?)\]\((.*)\)$")
+
+    def __init__(self, ttl: float = DEFAULT_UNDONE_TASK_TTL, max_lookups: int = DEFAULT_UNDONE_TASK_MAX_LOOKUPS):
+        self.ttl = ttl
+        self.max_lookups = max_lookups
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._unparsed: List[str] = []
+        self._loaded_at = 0.0
+        self._lookups = 0
+        self._refreshing = False
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        path = re.sub(r"/+", "/", path or "")
+        return path.rstrip("/") or "/"
+
+    def begin_refresh(self) -> bool:
+        """判断是否需要刷新，返回True时调用方负责获取任务列表并调用 update()"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            if time.time() - self._loaded_at > self.ttl or self._lookups >= self.max_lookups:
+                self._refreshing = True
+                return True
+            return False
+
+    def update(self, task_names: Optional[List[str]]):
+        """用任务名称列表重建索引，task_names 为None（获取失败）时保留原索引"""
+        keys, unparsed = set(), []
+        for name in task_names or []:
+            match = self.TASK_NAME_PATTERN.match(name)
+            if match:
+                src_file = self._normalize(f"{match.group(1)}/{match.group(2)}")
+                src_parent, _, file_name = src_file.rpartition("/")
+                dst_dir = self._normalize(f"{match.group(3)}/{match.group(4)}")
+                keys.add((src_parent or "/", dst_dir, file_name))
+            else:
+                unparsed.append(name.replace("](", ""))
+        with self._lock:
+            if task_names is not None:
+                self._keys, self._unparsed = keys, unparsed
+            self._loaded_at = time.time()
+            self._lookups = 0
+            self._refreshing = False
+
+    def contains(self, src_dir: str, dst_dir: str, name: str) -> bool:
+        """文件是否在未完成的复制任务中"""
+        src_path = self._normalize(f"{src_dir}/{name}")
+        with self._lock:
+            self._lookups += 1
+            if (self._normalize(src_dir), self._normalize(dst_dir), name) in self._keys:
+                return True
+            unparsed = self._unparsed
+        for task_item in unparsed:
+            if src_dir in task_item and dst_dir in task_item and src_path in task_item:
+                return True
+        return False
+
+
+class MountPathTrie:
+    """存储挂载路径前缀树，按路径分段做最长前缀匹配"""
+
+    def __init__(self, mount_paths: List[str] = None):
+        self._root: Dict = {}
+        for mount_path in mount_paths or []:
+            self.insert(mount_path)
+
+    @staticmethod
+    def _parts(path: str) -> List[str]:
+        return [part for part in (path or "").split("/") if part]
+
+    def insert(self, mount_path: str):
+        node = self._root
+        for part in self._parts(mount_path):
+            node = node.setdefault(part, {})
+        node[None] = mount_path
+
+    def longest_prefix(self, path: str) -> Optional[str]:
+        """返回包含该路径的最长挂载路径，没有匹配时返回None"""
+        node = self._root
+        found = node.get(None)
+        for part in self._parts(path):
+            node = node.get(part)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
+# 同步动作类型
+ACTION_MKDIR = "mkdir"  # 创建目标子目录
+ACTION_COPY = "copy"  # 目标不存在，复制
+ACTION_REPLACE = "replace"  # 目标存在变更，删除后重新复制
+ACTION_DELETE = "delete"  # 删除目标目录多余项
+ACTION_TRASH = "trash"  # 目标目录多余项移至回收站
+ACTION_REMOVE_SOURCE = "remove_source"  # 移动模式下删除已同步的源文件
+ACTION_SKIP = "skip"  # 无需处理
+# 计划文件中允许出现的动作
+PLAN_ACTIONS = (ACTION_MKDIR, ACTION_COPY, ACTION_REPLACE, ACTION_DELETE, ACTION_TRASH, ACTION_REMOVE_SOURCE)
+
+
+class SyncAction(NamedTuple):
+    """规划阶段产生的同步动作，name 为 src_dir/dst_dir 下的项目名称"""
+    action: str
+    src_dir: str
+    dst_dir: str
+    name: str
+    reason: str = ""
+
+
+class DirectoryListing(NamedTuple):
+    """列表阶段的输出：一个目录对的源目录内容和目标目录索引"""
+    src_dir: str
+    dst_dir: str
+    src_contents: List[Dict]
+    dst_index: Optional[Dict[str, Dict]]  # 源目录未变化时为None，不再列出目标目录
+    unchanged: bool = False
+
+
+class PendingOperations:
+    """
+    收集单个目录内待执行的文件操作，目录处理结束后合并为批量请求提交
+
+    提交顺序: 处理目标目录多余项 → 删除待覆盖的目标文件 → 复制 → 删除已同步的源文件（移动模式）
+    """
+
+    def __init__(self, src_dir: str, dst_dir: str):
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        self.delete: List[str] = []
+        self.trash: List[str] = []
+        self.replace: List[str] = []  # 目标文件存在变更，需先删除再复制
+        self.copy: List[str] = []
+        self.remove_source: List[str] = []
+
+    def add(self, action: SyncAction):
+        """登记一个同步动作，mkdir 和 skip 不在此处理"""
+        getattr(self, action.action).append(action.name)
+
+    def __bool__(self) -> bool:
+        return bool(self.delete or self.trash or self.replace or self.copy or self.remove_source)
+
+
+class SyncCancelled(BaseException):
+    """
+    同步作业被取消
+
+    继承 BaseException，不会被各阶段按目录处理失败的 except Exception 吞掉，从发出请求处一直传到 run_sync 的调用方。
+    progress 为取消时的部分进度统计，由 run_sync 在连接关闭后填入。
+    """
+
+    def __init__(self, reason: str = "任务已取消", progress: Dict = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.progress = progress or {}
+
+
+class CancelToken:
+    """协作式取消标记：其他线程调用 cancel()，同步引擎在每次请求前检查，已发出的请求执行完后停止"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason: str = "任务已取消"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 SyncCancelled"""
+        if self._event.is_set():
+            raise SyncCancelled(self.reason)
+
+
+class AlistSyncBase:
+    """同步引擎公共部分：保存同步配置，并提供不涉及网络请求的同步判定规则"""
+
+    def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
+                 sync_delete_action: str = "none", exclude_list: List[str] = None, move_file_action: bool = False,
+                 regex_patterns_list=None, regex_pattern=None, size_min: int = None, size_max: int = None,
+                 task_list: List[str] = None, batch_size: int = DEFAULT_BATCH_SIZE, snapshot=None,
+                 plan_writer=None, cancel_token: CancelToken = None, checkpoint=None):
+        from app.sync_checkpoint import NullCheckpoint
+
+        if regex_patterns_list is None:
+            regex_patterns_list = []
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.token = token  # 添加token属性
+        self.sync_delete_action = sync_delete_action.lower()
+        self.sync_delete = self.sync_delete_action in ["move", "delete"]
+        self.task_list = task_list
+        self.undone_tasks = UndoneTaskIndex()
+        # 本次运行内缓存的挂载路径和已确认存在的回收站目录
+        self._mount_trie: Optional[MountPathTrie] = None
+        self._trash_dirs = set()
+        if task_list:
+            self.undone_tasks.update(task_list)
+        self.exclude_list = exclude_list or []
+        self.move_file_action = move_file_action
+        self.regex_patterns_list = regex_patterns_list
+        self.regex_pattern = regex_pattern
+        self.size_min = size_min
+        self.size_max = size_max
+        self.batch_size = int(batch_size) if str(batch_size).strip().isdigit() and int(batch_size) > 0 \
+            else DEFAULT_BATCH_SIZE
+        # 目录快照（SnapshotStore），为None时每次完整比较
+        self.snapshot = snapshot
+        # dry-run 计划写入器（SyncPlanWriter），为None时只在日志中输出同步动作
+        self.plan_writer = plan_writer
+        # 取消标记，每次请求前检查
+        self.cancel_token = cancel_token or CancelToken()
+        # 同步断点（SyncCheckpoint），未传入时不记录目录进度
+        self.checkpoint = checkpoint if checkpoint is not None else NullCheckpoint()
+        # 进度统计: 已列出的目录数、规划的同步动作数、成功和失败的文件操作数
+        self.progress = dict.fromkeys(("dirs_listed", "actions_planned", "operations_succeeded",
+                                       "operations_failed"), 0)
+        self._progress_lock = threading.Lock()
+
+    def _count_progress(self, key: str, count: int = 1):
+        """累加进度统计，执行阶段的多个线程会同时调用"""
+        with self._progress_lock:
+            self.progress[key] += count
+
+    def _count_results(self, results: Dict[str, bool]):
+        """按批量操作的结果累加成功和失败的文件操作数"""
+        succeeded = sum(1 for ok in results.values() if ok)
+        self._count_progress("operations_succeeded", succeeded)
+        self._count_progress("operations_failed", len(results) - succeeded)
+
+    @staticmethod
+    def _join_path(directory: str, name: str) -> str:
+        """拼接目录与名称"""
+        return f"{directory}/{name}".replace('//', '/')
+
+    def _is_excluded(self, src_dir: str) -> bool:
+        """判断源目录是否在排除列表中"""
+        for exclude_item in self.exclude_list:
+            if src_dir.startswith(exclude_item) and exclude_item != '':
+                logger.info(f"排除目录: {src_dir}, 跳过同步")
+                return True
+        return False
+
+    def check_regex(self, path: str) -> bool:
+        """检查文件名是否匹配任一正则表达式"""
+        if self.regex_patterns_list:
+            for regex in self.regex_patterns_list:
+                if regex.match(path):
+                    return True
+        if self.regex_pattern and self.regex_pattern.match(path):
+            return True
+        return False
+
+    def _should_sync_file(self, item: Dict, src_path: str) -> bool:
+        """按文件大小和正则表达式过滤文件，返回是否需要同步"""
+        item_name = item.get('name')
+        file_size = item.get("size")
+        if self.size_min is not None and file_size is not None and file_size < self.size_min:
+            logger.info(f"文件【{item_name}】小于最小传输大小({self.size_min}字节)，跳过同步")
+            return False
+        if self.size_max is not None and file_size is not None and file_size > self.size_max:
+            logger.info(f"文件【{item_name}】大于最大传输大小({self.size_max}字节)，跳过同步")
+            return False
+        if (self.regex_patterns_list or self.regex_pattern) and not self.check_regex(item_name):
+            logger.info(f"不符合正则表达式: {src_path}, 跳过同步")
+            return False
+        return True
+
+    def _is_in_undone_tasks(self, src_dir: str, dst_dir: str, src_path: str) -> bool:
+        """检查文件是否在未完成的复制任务列表中"""
+        return self.undone_tasks.contains(src_dir, dst_dir, src_path.rpartition('/')[2])
+
+    def _compare_with_destination(self, item: Dict, dst_info: Dict) -> str:
+        """
+        比较源文件与已存在的目标文件
+
+        返回:
+            - "same": 大小相同，无需复制
+            - "newer": 目标文件修改时间晚于源文件，无需复制
+            - "changed": 存在变更，需要删除目标文件后重新复制
+        """
+        item_name = item.get('name')
+        if item.get("size") == dst_info.get("size"):
+            logger.info(f"文件【{item_name}】已存在且大小相同，跳过复制")
+            return "same"
+        src_modified = parse_time_and_adjust_utc(item.get("modified") or "")
+        dst_modified = parse_time_and_adjust_utc(dst_info.get("modified") or "")
+        if src_modified and dst_modified and dst_modified > src_modified:
+            logger.info(f"文件【{item_name}】目标文件修改时间晚于源文件，跳过复制")
+            return "newer"
+        logger.info(f"文件【{item_name}】存在变更，删除并重新复制")
+        return "changed"
+
+    @staticmethod
+    def _get_extra_names(src_contents: List[Dict], dst_contents: List[Dict]) -> set:
+        """获取目标目录中存在而源目录中不存在的项目名称"""
+        src_names = {normalize_filename(item["name"]) for item in src_contents or []}
+        dst_names = {normalize_filename(item["name"]) for item in dst_contents or []}
+        return dst_names - src_names
+
+    def _chunk_names(self, names: List[str]) -> List[List[str]]:
+        """按 batch_size 切分名称列表"""
+        return [names[i:i + self.batch_size] for i in range(0, len(names), self.batch_size)]
+
+    @staticmethod
+    def _is_operation_success(response: Optional[Dict]) -> bool:
+        """copy/move/remove 请求是否成功（响应 code 为 200）"""
+        return bool(response) and response.get("code", 200) == 200
+
+    @staticmethod
+    def _build_destination_index(response: Optional[Dict]) -> Optional[Dict[str, Dict]]:
+        """
+        将目标目录的列表响应转换为 名称→项目信息(size, modified, is_dir) 的索引
+
+        返回:
+            目录索引，目录不存在或请求失败时返回None，调用方回退为逐个文件查询
+        """
+        if not response or response.get("code") != 200:
+            return None
+        return {item["name"]: item for item in (response.get("data") or {}).get("content") or []}
+
+    @staticmethod
+    def _index_contains(dst_index: Optional[Dict[str, Dict]], name: str) -> Optional[bool]:
+        """目录索引中是否存在该名称，没有索引时返回None"""
+        return None if dst_index is None else name in dst_index
+
+    @staticmethod
+    def _has_valid_modified(item: Dict) -> bool:
+        """项目是否带有可用的修改时间，部分存储目录的修改时间为空或为零值"""
+        modified = parse_time_and_adjust_utc(item.get("modified") or "")
+        return modified is not None and modified.year > 1970
+
+    def _is_listing_unchanged(self, src_dir: str, dst_dir: str, src_contents: List[Dict]) -> bool:
+        """源目录列表是否与上次成功同步时一致"""
+        if not self.snapshot or not src_contents:
+            return False
+        entry = self.snapshot.get(src_dir, dst_dir)
+        return bool(entry) and entry.get("signature") == self.snapshot.listing_signature(src_contents)
+
+    def _is_subtree_unchanged(self, src_dir: str, dst_dir: str, item: Dict,
+                              dst_index: Optional[Dict[str, Dict]] = None) -> bool:
+        """子目录修改时间与上次成功同步时一致、目标子目录存在且子目录自身有有效快照时，可跳过整个子树"""
+        if not self.snapshot or not self._has_valid_modified(item):
+            return False
+        item_name = item.get("name")
+        if dst_index is not None and item_name not in dst_index:
+            return False
+        parent = self.snapshot.get(src_dir, dst_dir)
+        if not parent or (parent.get("dirs") or {}).get(item_name) != item.get("modified"):
+            return False
+        return self.snapshot.get(self._join_path(src_dir, item_name), self._join_path(dst_dir, item_name)) is not None
+
+    def _resume_from_checkpoint(self, src_dir: str, dst_dir: str,
+                                src_contents: Optional[List[Dict]]) -> List[Tuple[str, str, Optional[bool]]]:
+        """
+        按源根目录的当前列表开始目录对的断点记录
+
+        返回:
+            需要从其开始列出的目录，目录对上次已完成且源根目录未变化时返回空列表
+        """
+        from app.sync_checkpoint import listing_fingerprint
+
+        start_dirs = self.checkpoint.begin_pair(src_dir, dst_dir, listing_fingerprint(src_contents))
+        if not start_dirs:
+            logger.info(f"目录对在上次运行中已完成且源目录未变化，跳过 - 源目录: {src_dir}")
+        elif start_dirs != [(src_dir, dst_dir, None)]:
+            logger.info(f"从断点继续 - 源目录: {src_dir}, 已完成目录: {self.checkpoint.completed_count}, "
+                        f"待处理目录: {len(start_dirs)}")
+        return start_dirs
+
+    def _record_snapshot(self, src_dir: str, dst_dir: str, src_contents: List[Dict]):
+        """暂存已成功处理的目录快照"""
+        if self.snapshot and src_contents:
+            dirs = {item["name"]: item.get("modified") or "" for item in src_contents if item.get("is_dir")}
+            self.snapshot.stage(src_dir, dst_dir, self.snapshot.listing_signature(src_contents), dirs)
+
+    def _finish_snapshot(self, result: bool):
+        """目录对同步成功时写入快照，失败时丢弃本次记录"""
+        if not self.snapshot:
+            return
+        if result:
+            self.snapshot.commit()
+        else:
+            self.snapshot.discard()
+
+    def _plan_item(self, src_dir: str, dst_dir: str, item: Dict,
+                   dst_index: Dict[str, Dict]) -> Iterator[SyncAction]:
+        """规划单个项目的同步动作，目录只判断是否需要创建，不展开子目录"""
+        item_name = item.get('name')
+        if not item_name:
+            logger.error("项目名称为空")
+            return
+        if item.get('is_dir', False):
+            if item_name not in dst_index:
+                yield SyncAction(ACTION_MKDIR, src_dir, dst_dir, item_name)
+            return
+
+        src_path = self._join_path(src_dir, item_name)
+        # 文件大小和正则表达式过滤
+        if not self._should_sync_file(item, src_path):
+            yield SyncAction(ACTION_SKIP, src_dir, dst_dir, item_name, "filtered")
+            return
+        # 检查是否在未完成的任务列表中，如果存在，则跳过
+        if self._is_in_undone_tasks(src_dir, dst_dir, src_path):
+            logger.info(f"文件【{item_name}】在未完成的任务列表中，跳过复制")
+            yield SyncAction(ACTION_SKIP, src_dir, dst_dir, item_name, "undone")
+            return
+
+        dst_info = dst_index.get(item_name)
+        if dst_info is None:
+            logger.info(f"复制文件: {item_name}")
+            yield SyncAction(ACTION_COPY, src_dir, dst_dir, item_name)
+            return
+        result = self._compare_with_destination(item, dst_info)
+        if result == "changed":
+            yield SyncAction(ACTION_REPLACE, src_dir, dst_dir, item_name)
+            return
+        yield SyncAction(ACTION_SKIP, src_dir, dst_dir, item_name, result)
+        # 目标文件无需更新，移动模式下删除源文件
+        if self.move_file_action:
+            yield SyncAction(ACTION_REMOVE_SOURCE, src_dir, dst_dir, item_name)
+
+    def _plan_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict],
+                          dst_index: Dict[str, Dict]) -> Iterator[SyncAction]:
+        """规划目标目录多余项的处理动作"""
+        if not self.sync_delete:
+            return
+        action = ACTION_TRASH if self.sync_delete_action == "move" else ACTION_DELETE
+        for name in sorted(self._get_extra_names(src_contents, list(dst_index.values()))):
+            yield SyncAction(action, src_dir, dst_dir, name)
+
+    def _plan_directory(self, listing: DirectoryListing) -> Iterator[SyncAction]:
+        """规划单个目录的同步动作，只使用列表阶段的结果，不发送请求"""
+        self._count_progress("dirs_listed")
+        if listing.unchanged:
+            return
+        actions = itertools.chain(
+            self._plan_sync_delete(listing.src_dir, listing.dst_dir, listing.src_contents, listing.dst_index),
+            itertools.chain.from_iterable(self._plan_item(listing.src_dir, listing.dst_dir, item, listing.dst_index)
+                                          for item in listing.src_contents))
+        for action in actions:
+            if action.action != ACTION_SKIP:
+                self._count_progress("actions_planned")
+            yield action
+        self._record_snapshot(listing.src_dir, listing.dst_dir, listing.src_contents)
+
+    def plan(self, listings: Iterable[DirectoryListing]) -> Iterator[SyncAction]:
+        """规划阶段：逐个目录消费列表结果并产出同步动作"""
+        for listing in listings:
+            yield from self._plan_directory(listing)
+            self.checkpoint.planned(listing)
+
+    def _sub_directory_pairs(self, listing: DirectoryListing) -> List[Tuple[str, str, Optional[bool]]]:
+        """
+        列表阶段需要继续展开的子目录
+
+        返回:
+            [(源子目录, 目标子目录, 目标子目录是否存在)]，未变化的子树不再展开
+        """
+        sub_dirs = []
+        for item in listing.src_contents:
+            item_name = item.get('name')
+            if not item_name or not item.get('is_dir', False):
+                continue
+            src_path = self._join_path(listing.src_dir, item_name)
+            if self._is_subtree_unchanged(listing.src_dir, listing.dst_dir, item, listing.dst_index):
+                logger.info(f"子目录未变化，跳过: {src_path}")
+                continue
+            sub_dirs.append((src_path, self._join_path(listing.dst_dir, item_name),
+                             self._index_contains(listing.dst_index, item_name)))
+        return sub_dirs
+
+    def _record_plan_action(self, action: SyncAction):
+        """dry-run 时记录一个同步动作"""
+        if self.plan_writer is not None:
+            self.plan_writer.write(action)
+        elif action.action != ACTION_SKIP:
+            logger.info(f"[dry-run] {action.action}: {self._join_path(action.src_dir, action.name)} -> {action.dst_dir}")
+
+    def _check_plan(self, plan_file: str) -> Optional[Dict]:
+        """
+        检查计划文件，返回计划头
+
+        计划文件不存在、版本不符、服务器地址不一致或包含无效动作时返回None
+        """
+        from app.sync_plan import read_plan, read_plan_header
+
+        header = read_plan_header(plan_file)
+        if not header:
+            logger.error(f"计划文件不存在或格式不正确: {plan_file}")
+            return None
+        if header.get("base_url") and header.get("base_url") != self.base_url:
+            logger.error(f"计划文件的服务器地址({header.get('base_url')})与当前连接不一致")
+            return None
+        try:
+            for data in read_plan(plan_file):
+                self._action_from_plan(data)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"计划文件内容无效: {plan_file}, 错误: {str(e)}")
+            return None
+        return header
+
+    @staticmethod
+    def _action_from_plan(data: Dict) -> SyncAction:
+        """将计划文件中的一行转换为同步动作"""
+        if data.get("action") not in PLAN_ACTIONS:
+            raise ValueError(f"未知的同步动作: {data.get('action')}")
+        return SyncAction(data["action"], data["src_dir"], data["dst_dir"], data["name"], data.get("reason") or "")
+
+    def _iter_plan_actions(self, plan_file: str) -> Iterator[SyncAction]:
+        """按写入顺序读取计划文件中的同步动作"""
+        from app.sync_plan import read_plan
+
+        for data in read_plan(plan_file):
+            yield self._action_from_plan(data)
+
+    def _match_trash_dir(self, dst_dir: str) -> Optional[str]:
+        """根据缓存的存储挂载路径计算回收站目录"""
+        mount_path = self._mount_trie.longest_prefix(dst_dir) if self._mount_trie else None
+        if mount_path is None:
+            return None
+        return f"{mount_path}/trash{dst_dir[len(mount_path.rstrip('/')):]}".replace('//', '/')
+
+
+class AlistSync(AlistSyncBase):
     def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
                  sync_delete_action: str = "none", exclude_list: List[str] = None, move_file_action: bool = False,
                  regex_patterns_list=None, regex_pattern=None, size_min: int = None, size_max: int = None,
-                 task_list: List[str] = None):
+                 task_list: List[str] = None, max_workers: int = DEFAULT_MAX_WORKERS, pool_size: int = None,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT, max_retry: int = DEFAULT_MAX_RETRY,
+                 batch_size: int = DEFAULT_BATCH_SIZE, snapshot=None, plan_writer=None,
+                 cancel_token: CancelToken = None, checkpoint=None):
         """
         初始化AlistSync类
         
@@ -108,51 +856,37 @@ class AlistSync:
             size_min: 仅传输大于指定大小的文件（字节，默认关闭）
             size_max: 仅传输小于指定大小的文件（字节，默认关闭）
             task_list: 任务列表
+            max_workers: 目录遍历并发数（每个连接），1 表示顺序遍历
+            pool_size: 连接池长连接数，默认不小于 max_workers
+            timeout: 单次请求超时时间（秒）
+            max_retry: 连接异常时的重试次数
+            batch_size: 单次 copy/move/remove 请求合并的名称数
+            snapshot: 目录快照存储（SnapshotStore），用于跳过未变化的目录
+            plan_writer: dry-run 计划写入器（SyncPlanWriter）
+            cancel_token: 取消标记（CancelToken），取消后下一次请求前抛出 SyncCancelled
+            checkpoint: 同步断点（SyncCheckpoint），记录已完成的目录，中断后从待处理目录继续
         """
-        if regex_patterns_list is None:
-            regex_patterns_list = []
-        self.base_url = base_url
-        self.username = username
-        self.password = password
-        self.token = token  # 添加token属性
-        self.sync_delete_action = sync_delete_action.lower()
-        self.sync_delete = self.sync_delete_action in ["move", "delete"]
-        self.connection = self._create_connection()
-        self.task_list = task_list
-        self.exclude_list = exclude_list
-        self.move_file_action = move_file_action
-        self.regex_patterns_list = regex_patterns_list
-        self.regex_pattern = regex_pattern
-        self.size_min = size_min
-        self.size_max = size_max
-
-    def _create_connection(self) -> Union[http.client.HTTPConnection, http.client.HTTPSConnection]:
-        """创建HTTP(S)连接"""
-        try:
-            match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", self.base_url)
-            if not match:
-                raise ValueError("Invalid base URL format")
-
-            host = match.group(1)
-            port_part = match.group(2)
-            port = int(port_part) if port_part else (443 if self.base_url.startswith("https://") else 80)
-
-            logger.info(f"创建连接 - 主机: {host}, 端口: {port}")
-            return (http.client.HTTPSConnection(host, port)
-                    if self.base_url.startswith("https://")
-                    else http.client.HTTPConnection(host, port))
-        except Exception as e:
-            logger.error(f"创建连接失败: {str(e)}")
-            raise
+        super().__init__(base_url, username, password, token, sync_delete_action, exclude_list, move_file_action,
+                         regex_patterns_list, regex_pattern, size_min, size_max, task_list, batch_size, snapshot,
+                         plan_writer, cancel_token, checkpoint)
+        self.max_workers = max(1, int(max_workers or 1))
+        self.timeout = timeout
+        self.max_retry = int(max_retry) if str(max_retry).strip().isdigit() else DEFAULT_MAX_RETRY
+        # 同一服务器地址的所有实例共享连接池
+        self.pool = get_connection_pool(base_url, max(pool_size or DEFAULT_POOL_SIZE, self.max_workers), timeout)
+        self._trash_lock = threading.Lock()
+        self.listing_failures = 0
 
     def _make_request(self, method: str, path: str, headers: Dict = None,
-                      payload: str = None) -> Optional[Dict]:
-        """发送HTTP请求并返回JSON响应"""
+                      payload: str = None, timeout: float = None) -> Optional[Dict]:
+        """发送HTTP请求并返回JSON响应，作业已取消时抛出 SyncCancelled"""
+        self.cancel_token.raise_if_cancelled()
         try:
             logger.debug(f"发送请求 - 方法: {method}, 路径: {path}")
-            self.connection.request(method, path, body=payload, headers=headers)
-            response = self.connection.getresponse()
-            result = json.loads(response.read().decode("utf-8"))
+            status, data = self.pool.request(method, path, body=payload, headers=headers,
+                                             timeout=timeout or self.timeout, max_retry=self.max_retry,
+                                             idempotent=method == "GET" or path in IDEMPOTENT_POST_PATHS)
+            result = json.loads(data.decode("utf-8"))
             logger.debug(f"请求响应: {result}")
             return result
         except Exception as e:
@@ -235,17 +969,18 @@ class AlistSync:
         return self._make_request(method, path, headers, payload)
 
     def get_copy_task_undone(self):
-        """获取未完成的复制任务"""
+        """获取未完成的复制任务并重建索引"""
         response = self._task_operation("GET", "copy/undone")
-        name_list = []
-        if response and response.get("data", []):
-            for item in response["data"]:
-                name = item["name"]
-                result = name.replace("](", "")
-                name_list.append(result)
-        self.task_list = name_list
+        task_names = [item["name"] for item in response.get("data") or []] if response else None
+        self.undone_tasks.update(task_names)
+        if task_names is not None:
+            self.task_list = [name.replace("](", "") for name in task_names]
         return True
-        # return name_list
+
+    def _refresh_undone_tasks(self):
+        """超过刷新间隔或查询次数上限时重新获取未完成的复制任务"""
+        if self.undone_tasks.begin_refresh():
+            self.get_copy_task_undone()
 
     def get_copy_task_retry_failed(self) -> List[Dict]:
         """获取已完成的复制任务"""
@@ -262,6 +997,10 @@ class AlistSync:
         response = self._directory_operation("list", path=directory_path)
         return response.get("data", {}).get("content", []) if response else []
 
+    def get_destination_index(self, dst_dir: str) -> Optional[Dict[str, Dict]]:
+        """列出目标目录一次并建立名称索引，供该目录下的存在性判断和大小/时间比较使用"""
+        return self._build_destination_index(self._directory_operation("list", path=dst_dir))
+
     def create_directory(self, directory_path: str) -> bool:
         """创建目录"""
         response = self._directory_operation("mkdir", path=directory_path)
@@ -314,6 +1053,79 @@ class AlistSync:
         logger.error("文件复制失败")
         return False
 
+    def _batch_operation(self, operation: str, names: List[str], **kwargs) -> Dict[str, bool]:
+        """
+        批量执行 copy/move/remove 操作，每 batch_size 个名称合并为一次请求
+
+        参数:
+            operation: copy、move 或 remove
+            names: 名称列表
+            kwargs: copy/move 传 src_dir、dst_dir，remove 传 dir
+
+        返回:
+            名称→是否成功，整批失败时逐个重试以确定每个名称的结果
+        """
+        results = {}
+        for chunk in self._chunk_names(names):
+            response = self._directory_operation(operation, names=chunk, **kwargs)
+            if self._is_operation_success(response) or len(chunk) == 1:
+                results.update(dict.fromkeys(chunk, self._is_operation_success(response)))
+                continue
+            logger.warning(f"批量{operation}失败，逐个重试 - 数量: {len(chunk)}")
+            for name in chunk:
+                results[name] = self._is_operation_success(
+                    self._directory_operation(operation, names=[name], **kwargs))
+        self._count_results(results)
+        return results
+
+    def _flush_pending(self, pending: PendingOperations) -> bool:
+        """提交目录内收集的文件操作，返回是否全部成功（目标目录多余项的处理结果不影响返回值）"""
+        success = True
+        if pending.trash:
+            logger.info("差异项处理策略：移至目标目录回收站")
+            trash_dir = self._get_trash_dir(pending.dst_dir)
+            if trash_dir:
+                self._ensure_trash_dir(trash_dir)
+                for name, ok in self._batch_operation("move", pending.trash, src_dir=pending.dst_dir,
+                                                      dst_dir=trash_dir).items():
+                    if ok:
+                        logger.info(f"移动到回收站: {name}")
+                    else:
+                        logger.error(f"移动到回收站失败: {name}")
+            else:
+                logger.warning(f"未找到目标目录所在存储，无法移至回收站: {pending.dst_dir}")
+        if pending.delete:
+            logger.info("差异项处理策略：删除目标目录多余项")
+            for name, ok in self._batch_operation("remove", pending.delete, dir=pending.dst_dir).items():
+                if ok:
+                    logger.info(f"直接删除项目: {name}")
+                else:
+                    logger.error(f"删除项目失败: {name}")
+        copy_names = list(pending.copy)
+        if pending.replace:
+            for name, ok in self._batch_operation("remove", pending.replace, dir=pending.dst_dir).items():
+                if ok:
+                    copy_names.append(name)
+                else:
+                    logger.error(f"删除目标文件失败: {self._join_path(pending.dst_dir, name)}")
+                    success = False
+        if copy_names:
+            for name, ok in self._batch_operation("copy", copy_names, src_dir=pending.src_dir,
+                                                  dst_dir=pending.dst_dir).items():
+                if ok:
+                    logger.info(f"文件【{name}】复制成功")
+                else:
+                    logger.error(f"文件【{name}】复制失败")
+                    success = False
+        if pending.remove_source:
+            for name, ok in self._batch_operation("remove", pending.remove_source, dir=pending.src_dir).items():
+                if ok:
+                    logger.info(f"删除源文件成功: {self._join_path(pending.src_dir, name)}")
+                else:
+                    logger.error(f"删除源文件失败: {self._join_path(pending.src_dir, name)}")
+                    success = False
+        return success
+
     def _move_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
         """移动文件或目录"""
         response = self._directory_operation("move",
@@ -349,29 +1161,36 @@ class AlistSync:
         logger.error("获取存储列表失败")
         return []
 
-    def check_regex(self, path: str) -> bool:
-        if self.regex_patterns_list:
-            for regex in self.regex_patterns_list:
-                if regex.match(path):
-                    return True
-        if self.regex_pattern and self.regex_pattern.match(path):
-            return True
-        return False
+    def sync_directories(self, src_dir: str, dst_dir: str, dry_run: bool = False) -> bool:
+        """
+        同步两个目录
 
-    def sync_directories(self, src_dir: str, dst_dir: str) -> bool:
-        """同步两个目录"""
+        参数:
+            dry_run: 只执行列表和规划阶段，同步动作写入 plan_writer，不修改任何文件
+        """
         try:
-
-            # 重试已失败任务
-            self.get_copy_task_retry_failed()
+            # 重试已失败任务，dry-run 时不提交任何修改
+            if not dry_run:
+                self.get_copy_task_retry_failed()
             # 获取正在运行任务
             self.get_copy_task_undone()
 
-            logger.info(f"开始同步目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+            logger.info(f"开始同步目录 - 源目录: {src_dir}, 目标目录: {dst_dir}{', dry-run' if dry_run else ''}")
             if not self.is_path_exists(src_dir):
                 logger.error(f"源目录【{src_dir}】不存在，停止同步")
                 return False
-            result = self._recursive_copy(src_dir, dst_dir)
+            if dry_run:
+                result = self._write_plan(src_dir, dst_dir)
+                # 计划尚未执行，本次的目录快照不能写入
+                self._finish_snapshot(False)
+                logger.info(f"同步计划生成完成 - 源目录: {src_dir}, 目标目录: {dst_dir}, 结果: {'成功' if result else '失败'}")
+                return result
+            start_dirs = self._begin_checkpoint(src_dir, dst_dir)
+            if not start_dirs:
+                return True
+            result = self._recursive_copy(src_dir, dst_dir, start_dirs)
+            self._finish_snapshot(result)
+            self.checkpoint.finish_pair(src_dir, dst_dir, result)
             # 递归删除空文件夹
             if self.move_file_action:
                 self._remove_empty_folders(src_dir, src_dir)
@@ -382,33 +1201,219 @@ class AlistSync:
             logger.error(f"同步目录失败: {str(e)}")
             return False
 
-    def _recursive_copy(self, src_dir: str, dst_dir: str) -> bool:
-        """递归复制目录内容"""
+    def _begin_checkpoint(self, src_dir: str, dst_dir: str) -> List[Tuple[str, str, Optional[bool]]]:
+        """开始目录对的断点记录，有上次运行的断点时先列出源根目录判断是否变化"""
+        src_contents = self._list_contents(src_dir) if self.checkpoint.saved_pair(src_dir, dst_dir) else None
+        return self._resume_from_checkpoint(src_dir, dst_dir, src_contents)
+
+    def _recursive_copy(self, src_dir: str, dst_dir: str,
+                        start_dirs: List[Tuple[str, str, Optional[bool]]] = None) -> bool:
+        """
+        同步目录树：列表 → 规划 → 执行 三个阶段以生成器串联
+
+        各阶段可单独调用（iter_listings / plan / execute_actions）。某个目录失败时继续处理其余目录，
+        全部完成后返回是否全部成功。start_dirs 为从断点继续时的待处理目录。
+        """
+        success = self.execute_actions(self.plan(self.iter_listings(src_dir, dst_dir, start_dirs)))
+        if self.listing_failures:
+            logger.error(f"有 {self.listing_failures} 个目录列表失败 - 源目录: {src_dir}")
+            return False
+        return success
+
+    def _write_plan(self, src_dir: str, dst_dir: str) -> bool:
+        """dry-run：只执行列表和规划阶段，同步动作写入计划"""
+        for action in self.plan(self.iter_listings(src_dir, dst_dir)):
+            self._record_plan_action(action)
+        if self.listing_failures:
+            logger.error(f"有 {self.listing_failures} 个目录列表失败 - 源目录: {src_dir}")
+            return False
+        return True
+
+    def apply_plan(self, plan_file: str) -> bool:
+        """
+        执行 dry-run 生成的计划文件，不再列出目录
+
+        计划按写入顺序执行，父目录的 mkdir 总在其子目录的动作之前
+        """
         try:
-            for exclude_item in self.exclude_list:
-                if src_dir.startswith(exclude_item) and exclude_item != '':
-                    logger.info(f"排除目录: {src_dir}, 跳过同步")
-                    return True
-            logger.info(f"开始递归复制 - 源目录: {src_dir}, 目标目录: {dst_dir}")
-            src_contents = self.get_directory_contents(src_dir)
+            header = self._check_plan(plan_file)
+            if header is None:
+                return False
+            logger.info(f"开始执行同步计划: {plan_file}")
+            result = self.execute_actions(self._iter_plan_actions(plan_file))
+            if self.move_file_action:
+                for pair in header.get("dir_pairs") or []:
+                    src_dir = pair.split(":")[0].strip()
+                    self._remove_empty_folders(src_dir, src_dir)
+            logger.info(f"同步计划执行完成: {plan_file}, 结果: {'成功' if result else '失败'}")
+            return result
+        except Exception as e:
+            logger.error(f"执行同步计划失败: {str(e)}")
+            return False
+
+    def iter_listings(self, src_dir: str, dst_dir: str,
+                      start_dirs: List[Tuple[str, str, Optional[bool]]] = None) -> Iterator[DirectoryListing]:
+        """
+        列表阶段：用 max_workers 个线程并发列出目录树，按完成顺序产出 DirectoryListing
+
+        待列出的目录后进先出（接近深度优先），待处理目录数随树深度而非宽度增长；
+        同时进行中的列表请求不超过 max_workers，消费者未取走结果时不派发新目录（背压）。
+        列表失败的目录数记录在 listing_failures。
+
+        参数:
+            start_dirs: 从断点继续时的待处理目录，断点中已完成或已登记的子目录不再列出
+        """
+        self.listing_failures = 0
+        stack = list(reversed(start_dirs)) if start_dirs else [(src_dir, dst_dir, None)]
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="alist-lister") as executor:
+            running = set()
+            while stack or running:
+                while stack and len(running) < self.max_workers:
+                    running.add(executor.submit(contextvars.copy_context().run, self._list_directory_pair,
+                                                *stack.pop()))
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    success, listing, sub_dirs = future.result()
+                    if not success:
+                        self.listing_failures += 1
+                    stack.extend(reversed([sub_dir for sub_dir in sub_dirs if self.checkpoint.visit(*sub_dir)]))
+                    if listing is not None:
+                        yield listing
+
+    def _list_directory_pair(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None
+                             ) -> Tuple[bool, Optional[DirectoryListing], List[Tuple[str, str, Optional[bool]]]]:
+        """
+        列出一个目录对
+
+        参数:
+            dst_exists: 目标目录是否存在，False 时不再列出目标目录，None 表示未知
+
+        返回:
+            (是否成功, 目录列表结果, 需要继续展开的子目录)，排除的目录返回 (True, None, [])
+        """
+        try:
+            if self._is_excluded(src_dir):
+                self.checkpoint.complete(src_dir)
+                return True, None, []
+            logger.info(f"开始列出目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+            src_contents = self._list_contents(src_dir)
+            if src_contents is None:
+                logger.error(f"获取源目录内容失败: {src_dir}")
+                return False, None, []
             if not src_contents:
-                logger.info(f"源目录为空或获取内容失败: {src_dir}")
-                # return True
+                logger.info(f"源目录为空: {src_dir}")
 
-            if self.sync_delete:
-                self._handle_sync_delete(src_dir, dst_dir, src_contents)
-            if src_contents:
-                for item in src_contents:
-                    if not self._copy_item_with_check(src_dir, dst_dir, item):
-                        logger.error(f"复制项目失败: {item.get('name', '未知项目')}")
-                        return False
-                logger.info(f"递归复制完成 - 源目录: {src_dir}, 目标目录: {dst_dir}")
-            return True
+            if self._is_listing_unchanged(src_dir, dst_dir, src_contents):
+                logger.info(f"源目录未变化，跳过文件比较: {src_dir}")
+                listing = DirectoryListing(src_dir, dst_dir, src_contents, None, True)
+            else:
+                self._refresh_undone_tasks()
+                dst_index = self._load_destination_index(dst_dir, src_contents, dst_exists) \
+                    if src_contents or self.sync_delete else {}
+                listing = DirectoryListing(src_dir, dst_dir, src_contents, dst_index)
+            return True, listing, self._sub_directory_pairs(listing)
         except Exception as e:
-            logger.error(f"递归复制失败: {str(e)}")
-        return False
+            logger.error(f"列出目录失败: {src_dir}, 错误: {str(e)}")
+            return False, None, []
+
+    def _list_contents(self, directory_path: str) -> Optional[List[Dict]]:
+        """获取目录内容，请求失败时返回None以区别于空目录"""
+        response = self._directory_operation("list", path=directory_path)
+        if not self._is_operation_success(response):
+            return None
+        return (response.get("data") or {}).get("content") or []
+
+    def _load_destination_index(self, dst_dir: str, src_contents: List[Dict],
+                                dst_exists: Optional[bool] = None) -> Dict[str, Dict]:
+        """
+        获取目标目录索引
+
+        目标目录已知不存在时直接返回空索引；列表失败但目录存在时按源目录项目逐个查询
+        """
+        if dst_exists is False:
+            return {}
+        dst_index = self.get_destination_index(dst_dir)
+        if dst_index is not None:
+            return dst_index
+        if not self.is_path_exists(dst_dir):
+            return {}
+        dst_index = {}
+        for item in src_contents:
+            item_name = item.get('name')
+            dst_info = self.get_file_info(self._join_path(dst_dir, item_name)) if item_name else None
+            if dst_info:
+                dst_index[item_name] = dst_info
+        return dst_index
+
+    def execute_actions(self, actions: Iterable[SyncAction]) -> bool:
+        """
+        执行阶段：消费同步动作，返回是否全部成功
+
+        mkdir 在当前线程立即执行，保证之后写入该目录的动作执行时目录已存在；
+        其他动作按目录合并为 PendingOperations，目录切换时提交到 max_workers 个线程批量执行。
+        已提交未完成的目录数有上限，超过时阻塞上游（背压）。单个目录失败不影响其他目录。
+        """
+        failures = []
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+
+        def on_done(future, src_dir: str):
+            success = False
+            try:
+                success = bool(future.result())
+                if not success:
+                    failures.append(future)
+            except SyncCancelled:
+                failures.append(future)
+            except Exception as e:
+                logger.error(f"执行同步动作失败: {str(e)}")
+                failures.append(future)
+            finally:
+                self.checkpoint.close(src_dir, success)
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="alist-executor") as executor:
+            def submit(operations: PendingOperations):
+                slots.acquire()
+                executor.submit(contextvars.copy_context().run, self._flush_pending,
+                                operations).add_done_callback(lambda future: on_done(future, operations.src_dir))
+
+            pending = None
+            for action in actions:
+                if action.action == ACTION_SKIP:
+                    continue
+                if action.action == ACTION_MKDIR:
+                    created = self._prepare_sub_directory(self._join_path(action.dst_dir, action.name), False)
+                    self._count_results({action.name: created})
+                    if not created:
+                        logger.error(f"复制项目失败: {action.name}")
+                        failures.append(action)
+                        self.checkpoint.fail(action.src_dir)
+                    continue
+                if pending is None or (pending.src_dir, pending.dst_dir) != (action.src_dir, action.dst_dir):
+                    if pending:
+                        submit(pending)
+                    pending = PendingOperations(action.src_dir, action.dst_dir)
+                    # 目录的动作组在规划结束前登记，执行完成后该目录才记为已完成
+                    self.checkpoint.open(action.src_dir)
+                pending.add(action)
+            if pending:
+                submit(pending)
+        # 执行线程中途被取消时，同样以取消结束而不是返回失败
+        self.cancel_token.raise_if_cancelled()
+        return not failures
+
+    def _prepare_sub_directory(self, dst_path: str, exists: Optional[bool] = None) -> bool:
+        """确保目标子目录存在，exists 为None时向服务端查询"""
+        if exists is None:
+            exists = self.is_path_exists(dst_path)
+        if not exists:
+            logger.info(f"创建目标子目录: {dst_path}")
+            return self.create_directory(dst_path)
+        logger.info(f"文件夹【{dst_path}】已存在，跳过创建")
+        return True
 
-    def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict]):
+    def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict],
+                            dst_index: Optional[Dict[str, Dict]] = None):
         """
         处理同步删除逻辑
         
@@ -416,6 +1421,7 @@ class AlistSync:
             src_dir: 源目录
             dst_dir: 目标目录
             src_contents: 源目录内容列表
+            dst_index: 目标目录索引，为None时重新列出目标目录
             
         处理方式:
             - "none": 不处理目标目录差异项
@@ -427,64 +1433,42 @@ class AlistSync:
             if self.sync_delete_action == "none":
                 logger.info("差异项处理策略：不处理目标目录差异项")
                 return
-                
-            dst_contents = self.get_directory_contents(dst_dir)
-            src_names = {}
-            if src_contents:
-                src_names = {normalize_filename(item["name"]) for item in src_contents}
 
-            dst_names = {}
-            if dst_contents:
-                dst_names = {normalize_filename(item["name"]) for item in dst_contents}
-
-            if src_names:
-                to_delete = set(dst_names) - set(src_names)
-            else:
-                to_delete = dst_names
-
-            if not to_delete:
+            if dst_index is None:
+                dst_index = self.get_destination_index(dst_dir) or {}
+            pending = PendingOperations(src_dir, dst_dir)
+            for action in self._plan_sync_delete(src_dir, dst_dir, src_contents, dst_index):
+                pending.add(action)
+            if not pending:
                 logger.info("没有需要处理的差异项")
                 return
-
-            # 记录处理策略
-            if self.sync_delete_action == "move":
-                logger.info("差异项处理策略：移至目标目录回收站")
-            elif self.sync_delete_action == "delete":
-                logger.info("差异项处理策略：删除目标目录多余项")
-                
-            for name in to_delete:
-                if self.sync_delete_action == "move":
-                    logger.info(f"处理移动项目: {name}")
-                    trash_dir = self._get_trash_dir(dst_dir)
-                    if trash_dir:
-                        if not self.is_path_exists(trash_dir):
-                            logger.info(f"创建回收站目录: {trash_dir}")
-                            self.create_directory(trash_dir)
-                        logger.info(f"移动到回收站: {name}")
-                        self._move_item(dst_dir, trash_dir, name)
-                elif self.sync_delete_action == "delete":
-                    logger.info(f"处理删除项目: {name}")
-                    logger.info(f"直接删除项目: {name}")
-                    self._directory_operation("remove", dir=dst_dir, names=[name])
+            self._flush_pending(pending)
         except Exception as e:
             logger.error(f"处理同步删除失败: {str(e)}")
 
     def _get_trash_dir(self, dst_dir: str) -> Optional[str]:
-        """获取回收站目录路径"""
-        storage_list = self.get_storage_list()
-        for mount_path in storage_list:
-            if dst_dir.startswith(mount_path):
-                return f"{mount_path}/trash{dst_dir[len(mount_path):]}"
-        return None
+        """获取回收站目录路径，存储列表每次运行只获取一次"""
+        if self._mount_trie is None:
+            with self._trash_lock:
+                if self._mount_trie is None:
+                    storage_list = self.get_storage_list()
+                    if not storage_list:
+                        return None
+                    self._mount_trie = MountPathTrie(storage_list)
+        return self._match_trash_dir(dst_dir)
+
+    def _ensure_trash_dir(self, trash_dir: str):
+        """确保回收站目录存在，已确认的目录不再重复检查"""
+        if trash_dir in self._trash_dirs:
+            return
+        if not self.is_path_exists(trash_dir):
+            logger.info(f"创建回收站目录: {trash_dir}")
+            self.create_directory(trash_dir)
+        self._trash_dirs.add(trash_dir)
 
     def close(self):
-        """关闭连接"""
-        try:
-            if hasattr(self, 'connection') and self.connection:
-                self.connection.close()
-                logger.debug("连接已关闭")
-        except Exception as e:
-            logger.error(f"关闭连接时发生错误: {str(e)}")
+        """释放连接，共享连接池中的长连接保留给后续请求复用"""
+        logger.debug("连接已释放")
 
     def get_file_info(self, path: str) -> Optional[Dict]:
         """获取文件信息，包括大小和修改时间"""
@@ -493,8 +1477,15 @@ class AlistSync:
             return response.get("data", {})
         return None
 
-    def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict) -> bool:
-        """复制项目并进行检查"""
+    def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict,
+                              dst_index: Optional[Dict[str, Dict]] = None,
+                              pending: Optional[PendingOperations] = None) -> bool:
+        """
+        检查并同步单个项目，判定规则与规划阶段相同
+
+        未传入目标目录索引时查询该项目的目标文件；传入 pending 时文件操作只登记，
+        由调用方批量提交；目录会继续同步其整个子树
+        """
         try:
             item_name = item.get('name')
             if not item_name:
@@ -502,101 +1493,32 @@ class AlistSync:
                 return False
 
             logger.info(f"处理项目: {item_name}")
-            for exclude_item in self.exclude_list:
-                if src_dir.startswith(exclude_item) and exclude_item != '':
-                    logger.info(f"排除目录: {src_dir}, 跳过同步")
-                    return True
+            if self._is_excluded(src_dir):
+                return True
 
-            # 处理文件
-            src_path = f"{src_dir}/{item_name}".replace('//', '/')
-            dst_path = f"{dst_dir}/{item_name}".replace('//', '/')
+            src_path = self._join_path(src_dir, item_name)
+            dst_path = self._join_path(dst_dir, item_name)
+            if dst_index is None:
+                dst_info = self.get_file_info(dst_path)
+                dst_index = {item_name: dst_info} if dst_info else {}
 
-            # 如果是目录，递归处理
-            if item.get('is_dir', False):
+            if item.get('is_dir', False) and self._is_subtree_unchanged(src_dir, dst_dir, item, dst_index):
+                logger.info(f"子目录未变化，跳过: {src_path}")
+                return True
 
-                # 确保目标子目录存在
-                if not self.is_path_exists(dst_path):
-                    logger.info(f"创建目标子目录: {dst_path}")
-                    if not self.create_directory(dst_path):
+            self._refresh_undone_tasks()
+            operations = pending if pending is not None else PendingOperations(src_dir, dst_dir)
+            for action in self._plan_item(src_dir, dst_dir, item, dst_index):
+                if action.action == ACTION_MKDIR:
+                    if not self._prepare_sub_directory(dst_path, False):
                         return False
-                else:
-                    logger.info(f"文件夹【{dst_path}】已存在，跳过创建")
+                elif action.action != ACTION_SKIP:
+                    operations.add(action)
 
-                # 递归复制子目录
+            # 如果是目录，同步整个子树
+            if item.get('is_dir', False):
                 return self._recursive_copy(src_path, dst_path)
-            else:
-                # 文件大小过滤
-                file_size = item.get("size")
-                if self.size_min is not None and file_size is not None and file_size < self.size_min:
-                    logger.info(f"文件【{item_name}】小于最小传输大小({self.size_min}字节)，跳过同步")
-                    return True
-                if self.size_max is not None and file_size is not None and file_size > self.size_max:
-                    logger.info(f"文件【{item_name}】大于最大传输大小({self.size_max}字节)，跳过同步")
-                    return True
-
-                # 判断正则表达式,如果符合正则表达式跳过复制
-                if(self.regex_patterns_list or self.regex_pattern):
-                    if not self.check_regex(item_name):
-                        logger.info(f"不符合正则表达式: {src_path}, 跳过同步")
-                        return True
-
-                    # 检查是否在未完成的任务列表中，如果存在，则跳过
-                    self.get_copy_task_undone()
-                    for task_item in self.task_list:
-                        if src_dir in task_item and dst_dir in task_item and src_path in task_item:
-                            logger.info(f"文件【{item_name}】在未完成的任务列表中，跳过复制")
-                            return True
-                # 检查目标文件是否存在
-                if not self.is_path_exists(dst_path):
-                    logger.info(f"复制文件: {item_name}")
-                    return self._copy_item(src_dir, dst_dir, item_name)
-                else:
-                    # 获取源文件和目标文件信息
-                    src_size = item.get("size")
-                    dst_info = self.get_file_info(dst_path)
-
-                    if not dst_info:
-                        logger.error(f"获取目标文件信息失败: {dst_path}")
-                        return False
-
-                    dst_size = dst_info.get("size")
-
-                    # 比较文件大小
-                    if src_size == dst_size:
-                        logger.info(f"文件【{item_name}】已存在且大小相同，跳过复制")
-                        if self.move_file_action:
-                            if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                logger.error(f"删除源文件失败: {src_path}")
-                                return False
-                            else:
-                                logger.info(f"删除源文件成功: {src_path}")
-                                return True
-                        else:
-                            return True
-                    else:
-                        # 比较修改时间
-                        src_modified = parse_time_and_adjust_utc(item.get("modified"))
-                        dst_modified = parse_time_and_adjust_utc(dst_info.get("modified"))
-
-                        if src_modified and dst_modified and dst_modified > src_modified:
-                            logger.info(f"文件【{item_name}】目标文件修改时间晚于源文件，跳过复制")
-                            if self.move_file_action:
-                                if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                    logger.error(f"删除源文件失败: {src_dir}")
-                                    return False
-                                else:
-                                    logger.error(f"删除源文件: {src_dir}")
-                                    return True
-                            else:
-                                return True
-                        else:
-                            logger.info(f"文件【{item_name}】存在变更，删除并重新复制")
-                            # 删除旧文件
-                            if not self._directory_operation("remove", dir=dst_dir, names=[item_name]):
-                                logger.error(f"删除目标文件失败: {dst_path}")
-                                return False
-                            # 复制新文件
-                            return self._copy_item(src_dir, dst_dir, item_name)
+            return self._flush_pending(operations) if pending is None else True
         except Exception as e:
             logger.error(f"复制项目时发生错误: {str(e)}")
             return False
@@ -618,11 +1540,103 @@ def get_dir_pairs_from_env() -> List[str]:
     return dir_pairs_list
 
 
+class SyncJobConfig(NamedTuple):
+    """
+    一次同步作业的配置，直接传给 run_sync，不经过进程环境变量
+
+    同一进程中同时执行的多个作业各自持有自己的配置，互不影响。
+    """
+    base_url: str
+    username: Optional[str] = None
+    password: Optional[str] = None
+    token: Optional[str] = None
+    dir_pairs: Tuple[str, ...] = ()  # 格式为"源目录:目标目录"
+    sync_delete_action: str = "none"  # none / move / delete
+    exclude_dirs: Tuple[str, ...] = ()
+    move_file: bool = False
+    regex_patterns: Optional[str] = None
+    size_min: Optional[int] = None
+    size_max: Optional[int] = None
+    max_workers: int = DEFAULT_MAX_WORKERS
+    max_retry: int = DEFAULT_MAX_RETRY
+    batch_size: int = DEFAULT_BATCH_SIZE
+    sync_engine: str = "thread"  # thread / async
+    max_concurrency: Optional[int] = None
+    snapshot_enabled: bool = False
+    snapshot_max_age: Optional[float] = None
+    snapshot_max_entries: Optional[int] = None
+    full_rescan: bool = False
+    dry_run: bool = False
+    plan_file: Optional[str] = None
+    apply_plan: Optional[str] = None
+    job_id: Optional[str] = None  # 作业标识，JobLogFilter 据此筛选本作业的日志
+    resume_checkpoint: Optional[Dict] = None  # 上次中断的运行保存的断点，有效时从断点继续
+    checkpoint_interval: Optional[int] = None  # 保存断点的间隔（秒），环境变量 SYNC_CHECKPOINT_INTERVAL，默认 60
+    checkpoint_max_age: Optional[int] = None  # 断点有效期（小时），环境变量 SYNC_CHECKPOINT_MAX_AGE，默认 24
+
+    @classmethod
+    def from_env(cls, **overrides) -> "SyncJobConfig":
+        """从环境变量读取配置（命令行和 Docker 单任务运行方式），overrides 中不为空的值优先"""
+        def env_int(name):
+            value = os.environ.get(name)
+            return int(value) if value and value.isdigit() else None
+
+        def env_bool(name):
+            return os.environ.get(name, "false").lower() == "true"
+
+        config = {
+            "base_url": os.environ.get("BASE_URL"),
+            "username": os.environ.get("USERNAME"),
+            "password": os.environ.get("PASSWORD"),
+            "token": os.environ.get("TOKEN"),
+            "dir_pairs": tuple(get_dir_pairs_from_env()),
+            "sync_delete_action": os.environ.get("SYNC_DELETE_ACTION", "none"),
+            "exclude_dirs": tuple(os.environ.get("EXCLUDE_DIRS", "").split(",")),
+            "move_file": env_bool("MOVE_FILE"),
+            "regex_patterns": os.environ.get("REGEX_PATTERNS") or None,
+            "size_min": env_int("SIZE_MIN"),
+            "size_max": env_int("SIZE_MAX"),
+            "max_workers": env_int("MAX_WORKERS") or DEFAULT_MAX_WORKERS,
+            "max_retry": env_int("MAX_RETRY") if env_int("MAX_RETRY") is not None else DEFAULT_MAX_RETRY,
+            "batch_size": env_int("BATCH_SIZE") or DEFAULT_BATCH_SIZE,
+            "sync_engine": os.environ.get("SYNC_ENGINE", "thread"),
+            "max_concurrency": env_int("MAX_CONCURRENCY"),
+            "snapshot_enabled": env_bool("SNAPSHOT_ENABLED"),
+            "snapshot_max_age": env_int("SNAPSHOT_MAX_AGE"),
+            "snapshot_max_entries": env_int("SNAPSHOT_MAX_ENTRIES"),
+            "full_rescan": env_bool("SNAPSHOT_FULL_RESCAN"),
+            "dry_run": env_bool("SYNC_DRY_RUN"),
+            "plan_file": os.environ.get("SYNC_PLAN_FILE") or None,
+            "apply_plan": os.environ.get("SYNC_APPLY_PLAN") or None,
+            "checkpoint_interval": env_int("SYNC_CHECKPOINT_INTERVAL"),
+            "checkpoint_max_age": env_int("SYNC_CHECKPOINT_MAX_AGE")
+        }
+        config.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**config)
+
+
+# 当前上下文正在执行的作业标识，目录遍历和执行线程池提交任务时复制上下文
+current_job_id: contextvars.ContextVar = contextvars.ContextVar("alist_sync_job_id", default=None)
+
+
+class JobLogFilter(logging.Filter):
+    """只放行指定作业产生的日志，用于把并发作业的日志分别写入各自的任务日志"""
+
+    def __init__(self, job_id: str):
+        super().__init__()
+        self.job_id = job_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return current_job_id.get() == self.job_id
+
+
 def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str = None, move_file: bool = False,
-         regex_patterns: str = None, size_min: int = None, size_max: int = None):
+         regex_patterns: str = None, size_min: int = None, size_max: int = None, max_workers: int = None,
+         max_retry: int = None, sync_engine: str = None, max_concurrency: int = None, batch_size: int = None,
+         full_rescan: bool = None, dry_run: bool = None, plan_file: str = None, apply_plan: str = None):
     """
-    主函数，用于命令行执行
-    
+    主函数，用于命令行执行，未传入的参数从环境变量读取
+
     参数:
         dir_pairs: 目录对，格式为"源目录:目标目录"，多个目录对用分号分隔
         sync_del_action: 同步目标目录多余项的处理方式
@@ -634,84 +1648,126 @@ def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str =
         regex_patterns: 正则表达式模式
         size_min: 仅传输大于指定大小的文件（字节，默认关闭）
         size_max: 仅传输小于指定大小的文件（字节，默认关闭）
+        max_workers: 目录遍历并发数，默认读取环境变量MAX_WORKERS
+        max_retry: 连接异常时的重试次数，默认读取环境变量MAX_RETRY
+        sync_engine: 同步引擎，"thread"（默认）或 "async"，默认读取环境变量SYNC_ENGINE
+        max_concurrency: async 引擎同时进行中的请求数上限，默认读取环境变量MAX_CONCURRENCY
+        batch_size: 单次 copy/move/remove 请求合并的名称数，默认读取环境变量BATCH_SIZE
+        full_rescan: 忽略目录快照完整比较一次，默认读取环境变量SNAPSHOT_FULL_RESCAN
+        dry_run: 只生成同步计划不执行，默认读取环境变量SYNC_DRY_RUN
+        plan_file: dry-run 计划文件路径，默认读取环境变量SYNC_PLAN_FILE，未设置时写入 data/plan 目录
+        apply_plan: 执行指定的计划文件而不重新列出目录，默认读取环境变量SYNC_APPLY_PLAN
+
+    返回:
+        dry-run 时返回计划文件路径，其他情况下返回是否全部成功
     """
+    config = SyncJobConfig.from_env(
+        dir_pairs=tuple(dir_pairs.split(";")) if dir_pairs else None,
+        sync_delete_action=sync_del_action or None,
+        exclude_dirs=tuple(exclude_dirs.split(",")) if exclude_dirs else None,
+        move_file=move_file or None, regex_patterns=regex_patterns or None, size_min=size_min, size_max=size_max,
+        max_workers=max_workers, max_retry=max_retry, sync_engine=sync_engine or None,
+        max_concurrency=max_concurrency, batch_size=batch_size, full_rescan=full_rescan, dry_run=dry_run,
+        plan_file=plan_file or None, apply_plan=apply_plan or None)
+    return run_sync(config)
+
+
+def run_sync(config: SyncJobConfig, cancel_token: CancelToken = None, on_checkpoint=None):
+    """
+    按配置执行一次同步作业，只读取 config，可以在同一进程的多个线程中同时调用
+
+    参数:
+        config: 同步作业配置，job_id 不为空时作业期间产生的日志带有该标识
+        cancel_token: 取消标记，其他线程调用 cancel() 后作业在下一次请求前停止
+        on_checkpoint: 保存断点的回调 on_checkpoint(断点)，为空时不记录断点；dry-run 和执行计划时不使用
+
+    返回:
+        dry-run 时返回计划文件路径，其他情况下返回是否全部成功；作业被取消时抛出 SyncCancelled，
+        其 progress 为取消前的进度统计
+    """
+    token = current_job_id.set(config.job_id)
+    try:
+        return _run_sync(config, cancel_token, on_checkpoint)
+    finally:
+        current_job_id.reset(token)
+
+
+def _cancelled(e: SyncCancelled, engine: AlistSyncBase) -> SyncCancelled:
+    """记录取消时的进度统计并保存断点，返回需要继续抛出的异常"""
+    engine.checkpoint.save(force=True)
+    e.progress = dict(engine.progress)
+    logger.warning(f"同步任务已取消: {e.reason}, 进度统计: {e.progress}")
+    return e
+
+
+def _run_sync(config: SyncJobConfig, cancel_token: CancelToken = None, on_checkpoint=None):
     code_souce()
     xiaojin()
 
     logger.info("开始执行同步任务")
-    # 从环境变量获取配置 0
-    base_url = os.environ.get("BASE_URL")
-    username = os.environ.get("USERNAME")
-    password = os.environ.get("PASSWORD")
-    token = os.environ.get("TOKEN")  # 添加token环境变量
-
-    # 是否删除目标目录多余文件
-    if sync_del_action:
-        sync_delete_action = sync_del_action
-    else:
-        sync_delete_action = os.environ.get("SYNC_DELETE_ACTION", "none")
-    
+    base_url = config.base_url
+    username = config.username
+    password = config.password
+    token = config.token
+
     # 验证sync_delete_action值是否有效
-    sync_delete_action = sync_delete_action.lower()
+    sync_delete_action = (config.sync_delete_action or "none").lower()
     if sync_delete_action not in ["none", "move", "delete"]:
         logger.warning(f"无效的差异项处理方式: {sync_delete_action}，将使用默认值: none")
         sync_delete_action = "none"
     else:
         logger.info(f"差异项处理方式: {sync_delete_action}")
 
-    # 是否删除源目录
-    if move_file:
-        move_file_action = move_file
-    else:
-        move_file_action = os.environ.get("MOVE_FILE", "false").lower() == "true"
-
     # 删除源目录和删除多余目标目录无法同时生效
+    move_file_action = config.move_file
     if move_file_action and sync_delete_action != "none":
         logger.warning("移动源文件和处理目标目录差异项不能同时启用，将禁用目标目录差异项处理")
         sync_delete_action = "none"
 
-    # 排除目录
-    if exclude_dirs:
-        exclude_list = exclude_dirs.split(",")
-    else:
-        exclude_dirs = os.environ.get("EXCLUDE_DIRS", "")
-        exclude_list = exclude_dirs.split(",")
-
-    # 正则表达式
-    if not regex_patterns:
-        regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-        # regex_patterns_list = regex_patterns.split(" ")
-    # else:
-    #     regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-    #     regex_patterns_list = regex_patterns.split(" ")
+    # 没有排除目录时与环境变量为空时一样使用 [""]，目录快照指纹保持不变
+    exclude_list = list(config.exclude_dirs) or [""]
+    regex_patterns = config.regex_patterns
 
     # 初始化一个空列表，用于存储编译后的正则表达式对象
     regex_and_replace_list: List[Pattern[str]] = []
-    # if regex_patterns_list:
-    #     for pattern_replacement in regex_patterns_list:
-    #         try:
-    #             compiled_pattern = re.compile(pattern_replacement)
-    #             regex_and_replace_list.append(compiled_pattern)
-    #         except re.error as e:
-    #             print(f"正则表达式 {pattern_replacement} 编译失败：{e}")
     regex_pattern = None
     try:
         if regex_patterns:
             regex_pattern = re.compile(regex_patterns)
-        # regex_and_replace_list.append(compiled_pattern)
     except re.error as e:
         print(f"正则表达式 {regex_patterns} 编译失败：{e}")
 
-    # 解析文件大小限制
-    if size_min is None:
-        size_min_env = os.environ.get("SIZE_MIN")
-        size_min = int(size_min_env) if size_min_env and size_min_env.isdigit() else None
-    if size_max is None:
-        size_max_env = os.environ.get("SIZE_MAX")
-        size_max = int(size_max_env) if size_max_env and size_max_env.isdigit() else None
+    size_min = config.size_min
+    size_max = config.size_max
+    max_workers = config.max_workers
+    max_retry = config.max_retry
+    batch_size = config.batch_size
+
+    # 目录快照
+    snapshot = None
+    if config.snapshot_enabled:
+        from app.sync_snapshot import SnapshotStore, DEFAULT_SNAPSHOT_MAX_AGE, DEFAULT_SNAPSHOT_MAX_ENTRIES
+
+        fingerprint = SnapshotStore.make_fingerprint(sync_delete_action, move_file_action, exclude_list,
+                                                     regex_patterns, size_min, size_max)
+        snapshot = SnapshotStore(
+            base_url, fingerprint,
+            max_age=config.snapshot_max_age or DEFAULT_SNAPSHOT_MAX_AGE,
+            max_entries=config.snapshot_max_entries or DEFAULT_SNAPSHOT_MAX_ENTRIES,
+            full_rescan=config.full_rescan)
+        logger.info(f"目录快照已启用, 完整扫描: {config.full_rescan}")
+
+    # 同步引擎
+    sync_engine = (config.sync_engine or "thread").lower()
+    max_concurrency = config.max_concurrency
+
+    # dry-run 与执行计划
+    dry_run = config.dry_run
+    plan_file = config.plan_file
+    apply_plan = config.apply_plan
 
     if not base_url:
-        logger.error("服务地址(BASE_URL)环境变量未设置")
+        logger.error("未设置服务地址(BASE_URL)")
         return
 
     # 修改验证逻辑
@@ -720,22 +1776,84 @@ def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str =
         return
 
     logger.info(
-        f"配置信息 - URL: {base_url}, 用户名: {username}, 差异项处理策略: {sync_delete_action}, 删除源目录: {move_file_action}")
+        f"配置信息 - URL: {base_url}, 用户名: {username}, 差异项处理策略: {sync_delete_action}, 删除源目录: {move_file_action}, 并发数: {max_workers}")
+
+    dir_pairs_list = list(config.dir_pairs)
+
+    # 同步断点
+    checkpoint = None
+    if on_checkpoint is not None and not dry_run and not apply_plan:
+        from app.sync_checkpoint import SyncCheckpoint, DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_CHECKPOINT_MAX_AGE
+
+        checkpoint = SyncCheckpoint(
+            SyncCheckpoint.make_fingerprint(base_url, sync_delete_action, move_file_action, exclude_list,
+                                            regex_patterns, size_min, size_max),
+            resume=config.resume_checkpoint, on_save=on_checkpoint,
+            interval=config.checkpoint_interval or DEFAULT_CHECKPOINT_INTERVAL,
+            max_age=config.checkpoint_max_age or DEFAULT_CHECKPOINT_MAX_AGE)
+        if checkpoint.resumable:
+            logger.info("找到上次运行的断点，源目录未变化的目录对将从断点继续")
+        elif config.resume_checkpoint:
+            logger.info("上次运行的断点已过期或同步配置已变化，重新完整同步")
+
+    # 使用 asyncio 引擎
+    if sync_engine == "async":
+        import asyncio
+        from app.alist_sync_async import AsyncAlistSync, DEFAULT_MAX_CONCURRENCY
+
+        logger.info(f"同步引擎: async, 最大并发请求数: {max_concurrency or DEFAULT_MAX_CONCURRENCY}")
+        plan_writer = _create_plan_writer(plan_file, base_url, dir_pairs_list, sync_delete_action,
+                                          move_file_action) if dry_run and not apply_plan else None
+        async_sync = AsyncAlistSync(base_url, username, password, token, sync_delete_action, exclude_list,
+                                    move_file_action, regex_and_replace_list, regex_pattern, size_min=size_min,
+                                    size_max=size_max, max_concurrency=max_concurrency or DEFAULT_MAX_CONCURRENCY,
+                                    max_retry=max_retry, batch_size=batch_size, snapshot=snapshot,
+                                    plan_writer=plan_writer, cancel_token=cancel_token, checkpoint=checkpoint)
+        try:
+            if apply_plan:
+                return asyncio.run(async_sync.apply_plan_file(apply_plan))
+            result = asyncio.run(async_sync.sync_dir_pairs(dir_pairs_list, dry_run=bool(plan_writer)))
+        except SyncCancelled as e:
+            if plan_writer:
+                plan_writer.discard()
+            raise _cancelled(e, async_sync)
+        except BaseException:
+            if plan_writer:
+                plan_writer.discard()
+            raise
+        if plan_writer:
+            return _close_plan_writer(plan_writer, result)
+        return result
 
     # 创建AlistSync实例时添加token参数
+    plan_writer = _create_plan_writer(plan_file, base_url, dir_pairs_list, sync_delete_action,
+                                      move_file_action) if dry_run and not apply_plan else None
     alist_sync = AlistSync(base_url, username, password, token, sync_delete_action, exclude_list, move_file_action,
-                           regex_and_replace_list, regex_pattern, size_min=size_min, size_max=size_max)
-    # 验证 token 是否正确
-    if not alist_sync.login():
-        logger.error("令牌或用户名密码不正确")
-        return False
+                           regex_and_replace_list, regex_pattern, size_min=size_min, size_max=size_max,
+                           max_workers=max_workers, max_retry=max_retry, batch_size=batch_size, snapshot=snapshot,
+                           plan_writer=plan_writer, cancel_token=cancel_token, checkpoint=checkpoint)
+    try:
+        # 验证 token 是否正确
+        if not alist_sync.login():
+            logger.error("令牌或用户名密码不正确")
+            if plan_writer:
+                plan_writer.discard()
+            return False
+    except SyncCancelled as e:
+        if plan_writer:
+            plan_writer.discard()
+        alist_sync.close()
+        raise _cancelled(e, alist_sync)
+    if apply_plan:
+        try:
+            return alist_sync.apply_plan(apply_plan)
+        except SyncCancelled as e:
+            raise _cancelled(e, alist_sync)
+        finally:
+            alist_sync.close()
+            logger.info("关闭连接，任务结束")
+    result = True
     try:
-        # 获取同步目录对
-        dir_pairs_list = []
-        if dir_pairs:
-            dir_pairs_list.extend(dir_pairs.split(";"))
-        else:
-            dir_pairs_list = get_dir_pairs_from_env()
 
         logger.info(f"")
         logger.info(f"")
@@ -757,14 +1875,47 @@ def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str =
             logger.info(f"")
             logger.info(f"")
             i += 1
-            alist_sync.sync_directories(src_dir.strip(), dst_dir.strip())
+            if not alist_sync.sync_directories(src_dir.strip(), dst_dir.strip(), dry_run=bool(plan_writer)):
+                result = False
 
         logger.info("所有同步任务执行完成")
+    except SyncCancelled as e:
+        if plan_writer:
+            plan_writer.discard()
+        raise _cancelled(e, alist_sync)
     except Exception as e:
         logger.error(f"执行同步任务时发生错误: {str(e)}")
+        result = False
     finally:
         alist_sync.close()
         logger.info("关闭连接，任务结束")
+    if plan_writer:
+        return _close_plan_writer(plan_writer, result)
+    return result
+
+
+def _create_plan_writer(plan_file: Optional[str], base_url: str, dir_pairs_list: List[str],
+                        sync_delete_action: str, move_file_action: bool):
+    """创建 dry-run 计划写入器，计划头记录服务器地址、目录对和同步配置"""
+    from app.sync_plan import SyncPlanWriter, get_default_plan_file
+
+    plan_file = plan_file or get_default_plan_file()
+    logger.info(f"dry-run 模式，同步计划写入: {plan_file}")
+    return SyncPlanWriter(plan_file, {
+        "base_url": base_url,
+        "dir_pairs": [pair.strip() for pair in dir_pairs_list],
+        "sync_delete_action": sync_delete_action,
+        "move_file": move_file_action
+    })
+
+
+def _close_plan_writer(plan_writer, result: bool) -> Optional[str]:
+    """保存计划文件，返回文件路径，保存失败时返回None"""
+    if not plan_writer.close(result):
+        logger.error(f"保存同步计划失败: {plan_writer.file_path}")
+        return None
+    logger.info(f"同步计划已保存: {plan_writer.file_path}, 动作统计: {plan_writer.counts}")
+    return plan_writer.file_path
 
 
 def code_souce():
@@ -0,0 +1,761 @@
+import asyncio
+import json
+import re
+import ssl
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.alist_sync import (AlistSyncBase, DirectoryListing, MountPathTrie, PendingOperations, SyncAction, logger,
+                            ACTION_MKDIR, ACTION_SKIP, DEFAULT_BATCH_SIZE, DEFAULT_MAX_RETRY, DEFAULT_REQUEST_TIMEOUT,
+                            IDEMPOTENT_POST_PATHS)
+
+# 默认同时进行中的请求数上限
+DEFAULT_MAX_CONCURRENCY = 256
+
+
+class AsyncHTTPConnectionPool:
+    """
+    基于 asyncio 的HTTP/1.1长连接池
+
+    每个连接同一时间只承载一个请求，连接数上限即为同时进行中的请求数上限。
+    只实现 AList API 用到的部分: Content-Length 或 chunked 响应体、keep-alive、1xx 临时响应和无响应体的状态码。
+    重试规则与 HTTPConnectionPool.request 相同: 只在请求确定未到达服务端或请求幂等时重试。
+    """
+
+    # 没有响应体的状态码（1xx 之外）
+    BODILESS_STATUSES = (204, 304)
+
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", base_url or "")
+        if not match:
+            raise ValueError("Invalid base URL format")
+        self.is_https = base_url.startswith("https://")
+        self.host = match.group(1)
+        self.port = int(match.group(2)) if match.group(2) else (443 if self.is_https else 80)
+        # 非默认端口（如 AList 默认的 5244）需要写入 Host 头
+        self.host_header = self.host if self.port == (443 if self.is_https else 80) else f"{self.host}:{self.port}"
+        self.pool_size = max(1, int(pool_size or 1))
+        self.timeout = timeout
+        self._idle = []  # [(reader, writer)]
+        self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def _open(self, timeout: float):
+        """建立新连接"""
+        ssl_context = ssl.create_default_context() if self.is_https else None
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=ssl_context), timeout)
+
+    @staticmethod
+    def _close_writer(writer):
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+    async def _read_response(self, reader, method: str) -> Tuple[int, bytes, bool]:
+        """读取响应，跳过 1xx 临时响应，返回 (状态码, 响应体, 连接是否可复用)"""
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("服务端关闭了连接")
+            parts = status_line.decode("latin-1").split(" ", 2)
+            status = int(parts[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            if not 100 <= status < 200:
+                break
+
+        keep_alive = headers.get("connection", "").lower() != "close" and parts[0] != "HTTP/1.0"
+        if method.upper() == "HEAD" or status in self.BODILESS_STATUSES:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # 跳过trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, body, keep_alive
+
+    async def request(self, method: str, path: str, body: str = None, headers: Dict = None,
+                      timeout: float = None, max_retry: int = DEFAULT_MAX_RETRY,
+                      idempotent: bool = None) -> Tuple[int, bytes]:
+        """
+        发送请求并返回 (状态码, 响应体)
+
+        建立连接失败时最多重试 max_retry 次；复用的连接在发送时失败视为陈旧连接，立即换新连接重试（最多 pool_size 次）；
+        新连接发送失败或发送后失败时服务端可能已处理该请求，只有幂等请求（默认 GET/HEAD）重试。
+        """
+        timeout = timeout or self.timeout
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        payload = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host_header}", f"Content-Length: {len(payload)}",
+                 "Connection: keep-alive"]
+        lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+        raw_request = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + payload
+
+        attempt = 0
+        stale_retries = 0
+        async with self._slots:
+            while True:
+                reused = bool(self._idle)
+                reader = writer = None
+                keep_alive = False
+                phase = "connect"
+                try:
+                    reader, writer = self._idle.pop() if reused else await self._open(timeout)
+                    phase = "send"
+                    writer.write(raw_request)
+                    await asyncio.wait_for(writer.drain(), timeout)
+                    phase = "response"
+                    status, data, keep_alive = await asyncio.wait_for(self._read_response(reader, method), timeout)
+                    return status, data
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError) as e:
+                    stale = reused and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)) \
+                        and (phase == "send" or idempotent)
+                    if stale and stale_retries < self.pool_size:
+                        stale_retries += 1
+                        logger.debug(f"连接已失效，重新建立连接 - 路径: {path}")
+                        continue
+                    if not idempotent and (phase == "response" or (phase == "send" and not reused)):
+                        logger.error(f"请求可能已到达服务端，不再重试 - 方法: {method}, 路径: {path}, "
+                                     f"错误: {str(e) or type(e).__name__}")
+                        raise
+                    if attempt >= max_retry:
+                        raise
+                    attempt += 1
+                    logger.warning(f"请求异常，第{attempt}次重试 - 方法: {method}, 路径: {path}, "
+                                   f"错误: {str(e) or type(e).__name__}")
+                finally:
+                    if writer is not None:
+                        if keep_alive:
+                            self._idle.append((reader, writer))
+                        else:
+                            self._close_writer(writer)
+                await asyncio.sleep(min(0.5 * attempt, 5))
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            self._close_writer(writer)
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+class AsyncAlistSync(AlistSyncBase):
+    """
+    基于 asyncio 的同步引擎，对外接口与 AlistSync 一致（方法均为协程）
+
+    同步判定规则与 AlistSync 共用 AlistSyncBase，同一目录下的项目并发处理，
+    同时进行中的请求数由信号量限制。
+    """
+
+    def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
+                 sync_delete_action: str = "none", exclude_list: List[str] = None, move_file_action: bool = False,
+                 regex_patterns_list=None, regex_pattern=None, size_min: int = None, size_max: int = None,
+                 task_list: List[str] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT, max_retry: int = DEFAULT_MAX_RETRY,
+                 batch_size: int = DEFAULT_BATCH_SIZE, snapshot=None, plan_writer=None, cancel_token=None,
+                 checkpoint=None):
+        """
+        初始化AsyncAlistSync类
+
+        参数与 AlistSync 相同，另外:
+            max_concurrency: 同时进行中的请求数上限
+        """
+        super().__init__(base_url, username, password, token, sync_delete_action, exclude_list, move_file_action,
+                         regex_patterns_list, regex_pattern, size_min, size_max, task_list, batch_size, snapshot,
+                         plan_writer, cancel_token, checkpoint)
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+        self.timeout = timeout
+        self.max_retry = int(max_retry) if str(max_retry).strip().isdigit() else DEFAULT_MAX_RETRY
+        self.pool = AsyncHTTPConnectionPool(base_url, self.max_concurrency, timeout)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._trash_lock = asyncio.Lock()
+
+    def _headers(self, with_token: bool = True) -> Dict:
+        headers = {
+            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
+            "Content-Type": "application/json"
+        }
+        if with_token:
+            headers["Authorization"] = self.token
+        return headers
+
+    async def _make_request(self, method: str, path: str, headers: Dict = None,
+                            payload: str = None, timeout: float = None) -> Optional[Dict]:
+        """发送HTTP请求并返回JSON响应，作业已取消时抛出 SyncCancelled"""
+        self.cancel_token.raise_if_cancelled()
+        try:
+            logger.debug(f"发送请求 - 方法: {method}, 路径: {path}")
+            async with self._semaphore:
+                status, data = await self.pool.request(method, path, body=payload, headers=headers,
+                                                       timeout=timeout or self.timeout, max_retry=self.max_retry,
+                                                       idempotent=method == "GET" or path in IDEMPOTENT_POST_PATHS)
+            result = json.loads(data.decode("utf-8"))
+            logger.debug(f"请求响应: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"请求失败 - 方法: {method}, 路径: {path}, 错误: {str(e) or type(e).__name__}")
+            return None
+
+    async def login(self) -> bool:
+        """登录并获取token"""
+        if self.token and await self.get_setting():
+            return True
+
+        if not self.username or not self.password:
+            logger.error("token或用户名密码不正确")
+            return False
+
+        payload = json.dumps({"username": self.username, "password": self.password})
+        response = await self._make_request("POST", "/api/auth/login", self._headers(False), payload)
+        if response and response.get("data", {}).get("token"):
+            self.token = response["data"]["token"]
+            logger.info("令牌验证成功")
+            return True
+        logger.error("获取token失败")
+        return False
+
+    async def get_setting(self) -> bool:
+        """验证令牌正确性"""
+        response = await self._make_request("GET", "/api/admin/setting/list", self._headers())
+        if response and response.get("data", {}):
+            for item in response["data"]:
+                if item["key"] == "token" and item["value"] == self.token:
+                    logger.info("令牌验证成功")
+                    return True
+        logger.info("令牌验证失败")
+        return False
+
+    async def _directory_operation(self, operation: str, **kwargs) -> Optional[Dict]:
+        """执行目录操作"""
+        if not self.token:
+            if not await self.login():
+                return None
+        return await self._make_request("POST", f"/api/fs/{operation}", self._headers(), json.dumps(kwargs))
+
+    async def _task_operation(self, method: str, operation: str, **kwargs) -> Optional[Dict]:
+        """执行任务操作"""
+        if not self.token:
+            if not await self.login():
+                return None
+        return await self._make_request(method, f"/api/admin/task/{operation}", self._headers(), json.dumps(kwargs))
+
+    async def get_copy_task_undone(self):
+        """获取未完成的复制任务并重建索引"""
+        response = await self._task_operation("GET", "copy/undone")
+        task_names = [item["name"] for item in response.get("data") or []] if response else None
+        self.undone_tasks.update(task_names)
+        if task_names is not None:
+            self.task_list = [name.replace("](", "") for name in task_names]
+        return True
+
+    async def _refresh_undone_tasks(self):
+        """超过刷新间隔或查询次数上限时重新获取未完成的复制任务"""
+        if self.undone_tasks.begin_refresh():
+            await self.get_copy_task_undone()
+
+    async def get_copy_task_retry_failed(self) -> List[Dict]:
+        """重试失败的复制任务"""
+        response = await self._task_operation("POST", "copy/retry_failed")
+        return response.get("data", []) if response else []
+
+    async def get_directory_contents(self, directory_path: str) -> List[Dict]:
+        """获取目录内容"""
+        response = await self._directory_operation("list", path=directory_path)
+        return (response.get("data") or {}).get("content") or [] if response else []
+
+    async def get_destination_index(self, dst_dir: str) -> Optional[Dict[str, Dict]]:
+        """列出目标目录一次并建立名称索引"""
+        return self._build_destination_index(await self._directory_operation("list", path=dst_dir))
+
+    async def create_directory(self, directory_path: str) -> bool:
+        """创建目录"""
+        response = await self._directory_operation("mkdir", path=directory_path)
+        if response:
+            logger.info(f"文件夹【{directory_path}】创建成功")
+            return True
+        logger.error("文件夹创建失败")
+        return False
+
+    async def _copy_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
+        """复制文件或目录"""
+        response = await self._directory_operation("copy", src_dir=src_dir, dst_dir=dst_dir, names=[item_name])
+        if response:
+            logger.info(f"文件【{item_name}】复制成功")
+            return True
+        logger.error("文件复制失败")
+        return False
+
+    async def _move_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
+        """移动文件或目录"""
+        response = await self._directory_operation("move", src_dir=src_dir, dst_dir=dst_dir, names=[item_name])
+        if response:
+            logger.info(f"文件从【{src_dir}/{item_name}】移动到【{dst_dir}/{item_name}】移动成功")
+            return True
+        logger.error("文件移动失败")
+        return False
+
+    async def _batch_operation(self, operation: str, names: List[str], **kwargs) -> Dict[str, bool]:
+        """批量执行 copy/move/remove 操作，各批次并发提交，返回 名称→是否成功"""
+        async def run_chunk(chunk: List[str]) -> Dict[str, bool]:
+            response = await self._directory_operation(operation, names=chunk, **kwargs)
+            if self._is_operation_success(response) or len(chunk) == 1:
+                return dict.fromkeys(chunk, self._is_operation_success(response))
+            logger.warning(f"批量{operation}失败，逐个重试 - 数量: {len(chunk)}")
+            responses = await asyncio.gather(
+                *(self._directory_operation(operation, names=[name], **kwargs) for name in chunk))
+            return {name: self._is_operation_success(response) for name, response in zip(chunk, responses)}
+
+        results = {}
+        for chunk_result in await asyncio.gather(*(run_chunk(chunk) for chunk in self._chunk_names(names))):
+            results.update(chunk_result)
+        self._count_results(results)
+        return results
+
+    async def _flush_pending(self, pending: PendingOperations) -> bool:
+        """提交目录内收集的文件操作，处理顺序和返回值与 AlistSync._flush_pending 相同"""
+        success = True
+        if pending.trash:
+            logger.info("差异项处理策略：移至目标目录回收站")
+            trash_dir = await self._get_trash_dir(pending.dst_dir)
+            if trash_dir:
+                await self._ensure_trash_dir(trash_dir)
+                moved = await self._batch_operation("move", pending.trash, src_dir=pending.dst_dir, dst_dir=trash_dir)
+                for name, ok in moved.items():
+                    if ok:
+                        logger.info(f"移动到回收站: {name}")
+                    else:
+                        logger.error(f"移动到回收站失败: {name}")
+            else:
+                logger.warning(f"未找到目标目录所在存储，无法移至回收站: {pending.dst_dir}")
+        if pending.delete:
+            logger.info("差异项处理策略：删除目标目录多余项")
+            for name, ok in (await self._batch_operation("remove", pending.delete, dir=pending.dst_dir)).items():
+                if ok:
+                    logger.info(f"直接删除项目: {name}")
+                else:
+                    logger.error(f"删除项目失败: {name}")
+        copy_names = list(pending.copy)
+        if pending.replace:
+            for name, ok in (await self._batch_operation("remove", pending.replace, dir=pending.dst_dir)).items():
+                if ok:
+                    copy_names.append(name)
+                else:
+                    logger.error(f"删除目标文件失败: {self._join_path(pending.dst_dir, name)}")
+                    success = False
+        if copy_names:
+            for name, ok in (await self._batch_operation("copy", copy_names, src_dir=pending.src_dir,
+                                                         dst_dir=pending.dst_dir)).items():
+                if ok:
+                    logger.info(f"文件【{name}】复制成功")
+                else:
+                    logger.error(f"文件【{name}】复制失败")
+                    success = False
+        if pending.remove_source:
+            for name, ok in (await self._batch_operation("remove", pending.remove_source,
+                                                         dir=pending.src_dir)).items():
+                if ok:
+                    logger.info(f"删除源文件成功: {self._join_path(pending.src_dir, name)}")
+                else:
+                    logger.error(f"删除源文件失败: {self._join_path(pending.src_dir, name)}")
+                    success = False
+        return success
+
+    async def is_path_exists(self, path: str) -> bool:
+        """检查路径是否存在"""
+        response = await self._directory_operation("get", path=path)
+        return bool(response and response.get("message") == "success")
+
+    async def get_file_info(self, path: str) -> Optional[Dict]:
+        """获取文件信息，包括大小和修改时间"""
+        response = await self._directory_operation("get", path=path)
+        if response and response.get("message") == "success":
+            return response.get("data", {})
+        return None
+
+    async def get_storage_list(self) -> List[str]:
+        """获取存储列表"""
+        if not self.token:
+            if not await self.login():
+                return []
+        response = await self._make_request("GET", "/api/admin/storage/list", self._headers())
+        if response:
+            return [item["mount_path"] for item in response["data"]["content"]]
+        logger.error("获取存储列表失败")
+        return []
+
+    async def _get_trash_dir(self, dst_dir: str) -> Optional[str]:
+        """获取回收站目录路径，存储列表每次运行只获取一次"""
+        if self._mount_trie is None:
+            async with self._trash_lock:
+                if self._mount_trie is None:
+                    storage_list = await self.get_storage_list()
+                    if not storage_list:
+                        return None
+                    self._mount_trie = MountPathTrie(storage_list)
+        return self._match_trash_dir(dst_dir)
+
+    async def _ensure_trash_dir(self, trash_dir: str):
+        """确保回收站目录存在，已确认的目录不再重复检查"""
+        if trash_dir in self._trash_dirs:
+            return
+        if not await self.is_path_exists(trash_dir):
+            logger.info(f"创建回收站目录: {trash_dir}")
+            await self.create_directory(trash_dir)
+        self._trash_dirs.add(trash_dir)
+
+    async def _remove_empty_folders(self, base_dir: str, src_dir: str):
+        """递归删除空文件夹"""
+        if base_dir in src_dir and await self.is_path_exists(src_dir):
+            src_contents = await self.get_directory_contents(src_dir)
+            if src_contents:
+                for item in src_contents:
+                    if item.get('is_dir', False):
+                        await self._remove_empty_folders(base_dir, self._join_path(src_dir, item.get('name', '未知项目')))
+            elif base_dir != src_dir:
+                remove_dir, _, remove_name = src_dir.rpartition('/')
+                await self._directory_operation("remove", dir=remove_dir, names=[remove_name])
+                logger.info(f"删除空文件夹【{src_dir}】成功")
+                await self._remove_empty_folders(base_dir, remove_dir)
+
+    async def sync_directories(self, src_dir: str, dst_dir: str, dry_run: bool = False) -> bool:
+        """同步两个目录，dry_run 与 AlistSync.sync_directories 相同"""
+        try:
+            if not dry_run:
+                await self.get_copy_task_retry_failed()
+            await self.get_copy_task_undone()
+
+            logger.info(f"开始同步目录 - 源目录: {src_dir}, 目标目录: {dst_dir}{', dry-run' if dry_run else ''}")
+            if not await self.is_path_exists(src_dir):
+                logger.error(f"源目录【{src_dir}】不存在，停止同步")
+                return False
+            if dry_run:
+                result = await self._write_plan(src_dir, dst_dir)
+                self._finish_snapshot(False)
+                logger.info(f"同步计划生成完成 - 源目录: {src_dir}, 目标目录: {dst_dir}, 结果: {'成功' if result else '失败'}")
+                return result
+            start_dirs = await self._begin_checkpoint(src_dir, dst_dir)
+            if not start_dirs:
+                return True
+            results = await asyncio.gather(*(self._recursive_copy(start_src, start_dst, exists)
+                                             for start_src, start_dst, exists in start_dirs))
+            result = all(results)
+            self._finish_snapshot(result)
+            self.checkpoint.finish_pair(src_dir, dst_dir, result)
+            if self.move_file_action:
+                await self._remove_empty_folders(src_dir, src_dir)
+
+            logger.info(f"目录同步完成 - 源目录: {src_dir}, 目标目录: {dst_dir}, 结果: {'成功' if result else '失败'}")
+            return result
+        except Exception as e:
+            logger.error(f"同步目录失败: {str(e)}")
+            return False
+
+    async def _begin_checkpoint(self, src_dir: str, dst_dir: str) -> List[Tuple[str, str, Optional[bool]]]:
+        """开始目录对的断点记录，与 AlistSync._begin_checkpoint 相同"""
+        src_contents = await self._list_contents(src_dir) if self.checkpoint.saved_pair(src_dir, dst_dir) else None
+        return self._resume_from_checkpoint(src_dir, dst_dir, src_contents)
+
+    async def _recursive_copy(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None) -> bool:
+        """
+        同步目录树：列出目录对，按 AlistSyncBase 规划出的动作执行，子目录并发递归
+
+        某个目录失败时继续处理其余目录，全部完成后返回是否全部成功
+        """
+        try:
+            success, listing, sub_dirs = await self._list_directory_pair(src_dir, dst_dir, dst_exists)
+            if listing is None:
+                return success
+
+            pending = PendingOperations(src_dir, dst_dir)
+            mkdir_paths = []
+            for action in self._plan_directory(listing):
+                if action.action == ACTION_MKDIR:
+                    mkdir_paths.append(self._join_path(action.dst_dir, action.name))
+                elif action.action != ACTION_SKIP:
+                    pending.add(action)
+
+            # 子目录创建完成后再并发处理本目录的文件和各子目录
+            created = await asyncio.gather(*(self._prepare_sub_directory(path, False) for path in mkdir_paths))
+            self._count_results(dict(zip(mkdir_paths, created)))
+            failed_dirs = {path for path, ok in zip(mkdir_paths, created) if not ok}
+            for path in failed_dirs:
+                logger.error(f"复制项目失败: {path}")
+            if failed_dirs:
+                self.checkpoint.fail(src_dir)
+            if pending:
+                self.checkpoint.open(src_dir)
+            self.checkpoint.planned(listing)
+            jobs = [self._recursive_copy(sub_src, sub_dst, exists)
+                    for sub_src, sub_dst, exists in sub_dirs
+                    if sub_dst not in failed_dirs and self.checkpoint.visit(sub_src, sub_dst, exists)]
+            if pending:
+                jobs.append(self._flush_directory(pending))
+            results = await asyncio.gather(*jobs)
+            return success and not failed_dirs and all(results)
+        except Exception as e:
+            logger.error(f"复制目录失败: {str(e)}")
+        return False
+
+    async def _flush_directory(self, pending: PendingOperations) -> bool:
+        """提交目录内的文件操作，结束后更新断点记录"""
+        success = False
+        try:
+            success = await self._flush_pending(pending)
+            return success
+        finally:
+            self.checkpoint.close(pending.src_dir, success)
+
+    async def _write_plan(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None) -> bool:
+        """dry-run：列出目录对并写入规划出的同步动作，子目录并发递归"""
+        try:
+            success, listing, sub_dirs = await self._list_directory_pair(src_dir, dst_dir, dst_exists)
+            if listing is None:
+                return success
+            for action in self._plan_directory(listing):
+                self._record_plan_action(action)
+            results = await asyncio.gather(*(self._write_plan(sub_src, sub_dst, exists)
+                                             for sub_src, sub_dst, exists in sub_dirs))
+            return success and all(results)
+        except Exception as e:
+            logger.error(f"生成同步计划失败: {src_dir}, 错误: {str(e)}")
+        return False
+
+    async def execute_actions(self, actions: Iterable[SyncAction]) -> bool:
+        """
+        执行同步动作，返回是否全部成功
+
+        mkdir 立即执行，其他动作按目录合并后并发提交，进行中的目录数不超过 max_concurrency
+        """
+        slots = asyncio.Semaphore(self.max_concurrency)
+        jobs = []
+        success = True
+
+        async def flush(operations: PendingOperations) -> bool:
+            try:
+                return await self._flush_pending(operations)
+            except Exception as e:
+                logger.error(f"执行同步动作失败: {str(e)}")
+                return False
+            finally:
+                slots.release()
+
+        async def submit(operations: PendingOperations):
+            await slots.acquire()
+            jobs.append(asyncio.ensure_future(flush(operations)))
+
+        pending = None
+        for action in actions:
+            if action.action == ACTION_SKIP:
+                continue
+            if action.action == ACTION_MKDIR:
+                created = await self._prepare_sub_directory(self._join_path(action.dst_dir, action.name), False)
+                self._count_results({action.name: created})
+                if not created:
+                    logger.error(f"复制项目失败: {action.name}")
+                    success = False
+                continue
+            if pending is None or (pending.src_dir, pending.dst_dir) != (action.src_dir, action.dst_dir):
+                if pending:
+                    await submit(pending)
+                pending = PendingOperations(action.src_dir, action.dst_dir)
+            pending.add(action)
+        if pending:
+            await submit(pending)
+        results = await asyncio.gather(*jobs)
+        return success and all(results)
+
+    async def apply_plan(self, plan_file: str) -> bool:
+        """执行 dry-run 生成的计划文件，与 AlistSync.apply_plan 相同"""
+        try:
+            header = self._check_plan(plan_file)
+            if header is None:
+                return False
+            logger.info(f"开始执行同步计划: {plan_file}")
+            result = await self.execute_actions(self._iter_plan_actions(plan_file))
+            if self.move_file_action:
+                for pair in header.get("dir_pairs") or []:
+                    src_dir = pair.split(":")[0].strip()
+                    await self._remove_empty_folders(src_dir, src_dir)
+            logger.info(f"同步计划执行完成: {plan_file}, 结果: {'成功' if result else '失败'}")
+            return result
+        except Exception as e:
+            logger.error(f"执行同步计划失败: {str(e)}")
+            return False
+
+    async def _list_directory_pair(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None
+                                   ) -> Tuple[bool, Optional[DirectoryListing], List[Tuple[str, str, Optional[bool]]]]:
+        """列出一个目录对，返回值与 AlistSync._list_directory_pair 相同"""
+        try:
+            if self._is_excluded(src_dir):
+                self.checkpoint.complete(src_dir)
+                return True, None, []
+            logger.info(f"开始列出目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+            src_contents = await self._list_contents(src_dir)
+            if src_contents is None:
+                logger.error(f"获取源目录内容失败: {src_dir}")
+                return False, None, []
+            if not src_contents:
+                logger.info(f"源目录为空: {src_dir}")
+
+            if self._is_listing_unchanged(src_dir, dst_dir, src_contents):
+                logger.info(f"源目录未变化，跳过文件比较: {src_dir}")
+                listing = DirectoryListing(src_dir, dst_dir, src_contents, None, True)
+            else:
+                await self._refresh_undone_tasks()
+                dst_index = await self._load_destination_index(dst_dir, src_contents, dst_exists) \
+                    if src_contents or self.sync_delete else {}
+                listing = DirectoryListing(src_dir, dst_dir, src_contents, dst_index)
+            return True, listing, self._sub_directory_pairs(listing)
+        except Exception as e:
+            logger.error(f"列出目录失败: {src_dir}, 错误: {str(e)}")
+            return False, None, []
+
+    async def _list_contents(self, directory_path: str) -> Optional[List[Dict]]:
+        """获取目录内容，请求失败时返回None以区别于空目录"""
+        response = await self._directory_operation("list", path=directory_path)
+        if not self._is_operation_success(response):
+            return None
+        return (response.get("data") or {}).get("content") or []
+
+    async def _load_destination_index(self, dst_dir: str, src_contents: List[Dict],
+                                      dst_exists: Optional[bool] = None) -> Dict[str, Dict]:
+        """获取目标目录索引，规则与 AlistSync._load_destination_index 相同"""
+        if dst_exists is False:
+            return {}
+        dst_index = await self.get_destination_index(dst_dir)
+        if dst_index is not None:
+            return dst_index
+        if not await self.is_path_exists(dst_dir):
+            return {}
+        names = [item.get('name') for item in src_contents if item.get('name')]
+        infos = await asyncio.gather(*(self.get_file_info(self._join_path(dst_dir, name)) for name in names))
+        return {name: info for name, info in zip(names, infos) if info}
+
+    async def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict],
+                                  dst_index: Optional[Dict[str, Dict]] = None):
+        """处理同步删除逻辑，处理方式与 AlistSync._handle_sync_delete 相同"""
+        try:
+            if self.sync_delete_action == "none":
+                logger.info("差异项处理策略：不处理目标目录差异项")
+                return
+
+            if dst_index is None:
+                dst_index = await self.get_destination_index(dst_dir) or {}
+            pending = PendingOperations(src_dir, dst_dir)
+            for action in self._plan_sync_delete(src_dir, dst_dir, src_contents, dst_index):
+                pending.add(action)
+            if not pending:
+                logger.info("没有需要处理的差异项")
+                return
+            await self._flush_pending(pending)
+        except Exception as e:
+            logger.error(f"处理同步删除失败: {str(e)}")
+
+    async def _prepare_sub_directory(self, dst_path: str, exists: Optional[bool] = None) -> bool:
+        """确保目标子目录存在，exists 为None时向服务端查询"""
+        if exists is None:
+            exists = await self.is_path_exists(dst_path)
+        if not exists:
+            logger.info(f"创建目标子目录: {dst_path}")
+            return await self.create_directory(dst_path)
+        logger.info(f"文件夹【{dst_path}】已存在，跳过创建")
+        return True
+
+    async def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict,
+                                    dst_index: Optional[Dict[str, Dict]] = None,
+                                    pending: Optional[PendingOperations] = None) -> bool:
+        """检查并同步单个项目，判定规则与 AlistSync._copy_item_with_check 相同"""
+        try:
+            item_name = item.get('name')
+            if not item_name:
+                logger.error("项目名称为空")
+                return False
+
+            logger.info(f"处理项目: {item_name}")
+            if self._is_excluded(src_dir):
+                return True
+
+            src_path = self._join_path(src_dir, item_name)
+            dst_path = self._join_path(dst_dir, item_name)
+            if dst_index is None:
+                dst_info = await self.get_file_info(dst_path)
+                dst_index = {item_name: dst_info} if dst_info else {}
+
+            if item.get('is_dir', False) and self._is_subtree_unchanged(src_dir, dst_dir, item, dst_index):
+                logger.info(f"子目录未变化，跳过: {src_path}")
+                return True
+
+            await self._refresh_undone_tasks()
+            operations = pending if pending is not None else PendingOperations(src_dir, dst_dir)
+            for action in self._plan_item(src_dir, dst_dir, item, dst_index):
+                if action.action == ACTION_MKDIR:
+                    if not await self._prepare_sub_directory(dst_path, False):
+                        return False
+                elif action.action != ACTION_SKIP:
+                    operations.add(action)
+
+            if item.get('is_dir', False):
+                return await self._recursive_copy(src_path, dst_path)
+            return await self._flush_pending(operations) if pending is None else True
+        except Exception as e:
+            logger.error(f"复制项目时发生错误: {str(e)}")
+            return False
+
+    async def close(self):
+        """关闭连接"""
+        await self.pool.close()
+        logger.debug("连接已关闭")
+
+    async def sync_dir_pairs(self, dir_pairs_list: List[str], dry_run: bool = False) -> bool:
+        """登录并依次同步目录对，供 main() 在事件循环中调用"""
+        if not await self.login():
+            logger.error("令牌或用户名密码不正确")
+            return False
+        try:
+            result = True
+            for i, pair in enumerate(dir_pairs_list, 1):
+                src_dir, dst_dir = pair.split(":")
+                logger.info(f"第 [{i:02d}] 个 同步目录【{src_dir.strip()}】---->【 {dst_dir.strip()}】")
+                if not await self.sync_directories(src_dir.strip(), dst_dir.strip(), dry_run=dry_run):
+                    result = False
+            logger.info("所有同步任务执行完成")
+            return result
+        except Exception as e:
+            logger.error(f"执行同步任务时发生错误: {str(e)}")
+            return False
+        finally:
+            await self.close()
+            logger.info("关闭连接，任务结束")
+
+    async def apply_plan_file(self, plan_file: str) -> bool:
+        """登录并执行计划文件，供 main() 在事件循环中调用"""
+        if not await self.login():
+            logger.error("令牌或用户名密码不正确")
+            return False
+        try:
+            return await self.apply_plan(plan_file)
+        finally:
+            await self.close()
+            logger.info("关闭连接，任务结束")
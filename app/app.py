@@ -1,10 +1,11 @@
 from flask import Flask, current_app
 from apscheduler.schedulers.background import BackgroundScheduler
 import os
+import atexit
 import logging
 import time
 from datetime import datetime, timedelta
-from app.utils.data_manager import DataManager
+from app.utils.data_manager import create_data_manager
 from app.utils.sync_manager import SyncManager
 import pytz
 import traceback
@@ -18,7 +19,7 @@ def init_app(app):
     
     # 初始化数据管理器(如果尚未初始化)
     if 'DATA_MANAGER' not in app.config:
-        data_manager = DataManager()
+        data_manager = create_data_manager()
         app.config['DATA_MANAGER'] = data_manager
     else:
         data_manager = app.config['DATA_MANAGER']
@@ -30,6 +31,8 @@ def init_app(app):
     with app.app_context():
         sync_manager = SyncManager()
         app.config['SYNC_MANAGER'] = sync_manager
+        # 进程退出时结束队列中的任务实例，避免它们一直保持排队状态
+        atexit.register(sync_manager.shutdown)
         
         # 初始化同步管理器的调度器
         app.logger.info("正在加载任务到调度器...")
@@ -55,17 +58,12 @@ def init_app(app):
                         settings = data_manager.get_settings()
                         keep_log_days = settings.get("keep_log_days", 7)
                         
-                        # 清理系统日志
-                        data_manager.clear_old_logs(keep_log_days)
-                        app.logger.info(f"系统日志清理完成，保留{keep_log_days}天内的日志")
-                        
-                        # 清理任务实例和任务日志
-                        data_manager.clear_old_task_instances(keep_log_days)
-                        app.logger.info(f"任务实例和任务日志清理完成，保留{keep_log_days}天内的记录")
-                        
-                        # 清理主日志文件 alist_sync.log
-                        data_manager.clear_main_log_files(keep_log_days)
-                        app.logger.info(f"主日志文件清理完成，保留{keep_log_days}天内的日志")
+                        # 系统日志、任务实例和任务日志、主日志文件都按天分区，过期分区整体删除
+                        report = data_manager.run_log_cleanup(keep_log_days)
+                        for name, step in report["steps"].items():
+                            app.logger.info(f"日志清理 {name}: {step}")
+                        app.logger.info(f"日志清理完成，保留{keep_log_days}天内的日志，"
+                                        f"释放 {report['bytes_reclaimed']} 字节，耗时 {report['elapsed']} 秒")
                         
                     except Exception as e:
                         app.logger.error(f"清理日志时出错: {str(e)}")
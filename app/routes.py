@@ -1,5 +1,5 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session, flash
-from app.utils.sync_manager import SyncManager
+from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session, flash, Response
+from app.utils.task_executor import PRIORITY_MANUAL
 from app.utils.version_checker import get_current_version, has_new_version
 import importlib.util
 import os
@@ -9,8 +9,8 @@ from datetime import datetime
 import json
 import time
 from werkzeug.utils import secure_filename
-from app.utils.data_manager import DataManager
-from app.alist_sync import AlistSync
+from app.utils.data_manager import DataManager, DEFAULT_TASK_LOG_LINES, MAX_TASK_LOG_LINES, ACTIVE_INSTANCE_STATUSES
+from app.alist_sync import AlistSync, close_connection_pool
 import pytz
 from functools import wraps
 
@@ -18,6 +18,9 @@ main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__)
 auth_bp = Blueprint('auth', __name__)
 
+# 任务日志实时推送时检查新日志的间隔（秒）
+TASK_LOG_STREAM_INTERVAL = 1
+
 # 全局上下文处理器，为所有模板提供版本信息
 @main_bp.context_processor
 def inject_version_info():
@@ -206,11 +209,18 @@ def api_connection(conn_id):
             connection_data['status'] = 'offline'
             current_app.logger.debug("未指定连接状态，设置为offline")
         
+        # 服务器地址可能变化，关闭原地址的共享连接池
+        old_connection = data_manager.get_connection(conn_id)
         data_manager.update_connection(conn_id, connection_data)
+        if old_connection:
+            close_connection_pool(old_connection.get('server'))
         return jsonify({"status": "success", "message": "连接已更新"})
     
     elif request.method == 'DELETE':
+        old_connection = data_manager.get_connection(conn_id)
         data_manager.delete_connection(conn_id)
+        if old_connection:
+            close_connection_pool(old_connection.get('server'))
         return jsonify({"status": "success", "message": "连接已删除"})
     
     # GET 方法 - 获取连接信息
@@ -334,6 +344,11 @@ def test_connection():
         # 确保关闭连接
         if 'alist' in locals():
             alist.close()
+            # 测试的地址不属于已保存的连接时关闭其共享连接池，避免每次测试都留下一个连接池
+            server = (data.get('server') or '').rstrip('/')
+            saved_servers = {(conn.get('server') or '').rstrip('/') for conn in data_manager.get_connections()}
+            if server not in saved_servers:
+                close_connection_pool(server)
 
 @api_bp.route('/tasks', methods=['GET', 'POST'])
 def api_tasks():
@@ -428,15 +443,39 @@ def api_run_task(task_id):
             "details": {"task_id": task_id, "from": request.remote_addr}
         })
         
-        # 创建同步管理器并运行任务
-        sync_manager = SyncManager()
-        result = sync_manager.run_task(task_id)
+        # 运行选项，支持查询参数或JSON请求体:
+        #   full_rescan: 忽略目录快照完整扫描
+        #   dry_run: 只生成同步计划不执行
+        #   apply_plan: 执行指定任务实例生成的同步计划
+        payload = request.get_json(silent=True) or {}
+        full_rescan = request.args.get('full_rescan', '').lower() in ('1', 'true') or payload.get('full_rescan') is True
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true') or payload.get('dry_run') is True
+        apply_plan = request.args.get('apply_plan') or payload.get('apply_plan')
+        apply_instance_id = None
+        if apply_plan not in (None, ''):
+            try:
+                apply_instance_id = int(apply_plan)
+            except (TypeError, ValueError):
+                return jsonify({
+                    "status": "error",
+                    "message": f"无效的任务实例ID: {apply_plan}"
+                }), 400
+            if dry_run:
+                return jsonify({
+                    "status": "error",
+                    "message": "dry_run 和 apply_plan 不能同时使用"
+                }), 400
+
+        # 加入执行队列，立即返回任务实例ID，执行进度通过实例日志查看
+        sync_manager = current_app.config['SYNC_MANAGER']
+        result = sync_manager.submit_task(task_id, full_rescan=full_rescan, dry_run=dry_run,
+                                          apply_instance_id=apply_instance_id, priority=PRIORITY_MANUAL)
         
         # 记录任务运行结果
         if result.get("status") == "success":
             data_manager.add_log({
                 "level": "INFO",
-                "message": f"任务启动成功: {task.get('name', f'任务 {task_id}')}",
+                "message": f"任务已加入执行队列: {task.get('name', f'任务 {task_id}')}",
                 "details": {"task_id": task_id, "instance_id": result.get("instance_id")}
             })
         else:
@@ -467,19 +506,32 @@ def api_run_task(task_id):
 
 @api_bp.route('/task-instances', methods=['GET'])
 def api_task_instances():
-    """获取任务实例列表"""
+    """
+    获取任务实例列表，按开始时间从新到旧排列
+    
+    分页参数 before/after 为游标，取自上一次响应的 X-Next-Cursor（更早的一页）或 X-Prev-Cursor（更新的一页）
+    """
     data_manager = current_app.config['DATA_MANAGER']
-    task_id = request.args.get('task_id')
+    task_id = request.args.get('task_id', type=int)
     limit = request.args.get('limit', 50, type=int)
+    before = request.args.get('before')
+    after = request.args.get('after')
     
-    if task_id:
-        # 获取指定任务的实例
-        instances = data_manager.get_task_instances(int(task_id), limit)
-    else:
-        # 获取所有任务的实例
-        instances = data_manager.get_task_instances(None, limit)
+    try:
+        for cursor in (before, after):
+            if cursor is not None:
+                data_manager.parse_instance_cursor(cursor)
+    except ValueError:
+        return jsonify({"status": "error", "message": "无效的分页游标"}), 400
+    
+    limit = max(1, min(limit, 500))
+    instances = data_manager.get_task_instances(task_id, limit, before=before, after=after)
     
-    return jsonify(instances)
+    response = jsonify(instances)
+    if instances:
+        response.headers['X-Prev-Cursor'] = data_manager.instance_cursor(instances[0])
+        response.headers['X-Next-Cursor'] = data_manager.instance_cursor(instances[-1])
+    return response
 
 @api_bp.route('/task-instances/<int:instance_id>', methods=['GET'])
 def api_task_instance(instance_id):
@@ -492,6 +544,27 @@ def api_task_instance(instance_id):
     
     return jsonify(instance)
 
+@api_bp.route('/task-instances/<int:instance_id>/cancel', methods=['POST'])
+def api_cancel_task_instance(instance_id):
+    """
+    取消任务实例
+
+    排队中的实例立即取消；执行中的实例在当前请求完成后停止，实例状态变为 cancelled，结果中记录已完成的进度
+    """
+    data_manager = current_app.config['DATA_MANAGER']
+    if not data_manager.get_task_instance(instance_id):
+        return jsonify({"status": "error", "message": "任务实例不存在"}), 404
+
+    result = current_app.config['SYNC_MANAGER'].cancel_instance(instance_id)
+    if result.get("status") == "success":
+        data_manager.add_log({
+            "level": "INFO",
+            "message": f"取消任务实例: {instance_id}",
+            "details": {"instance_id": instance_id, "from": request.remote_addr}
+        })
+        return jsonify(result)
+    return jsonify(result), 409
+
 @api_bp.route('/task-instances/<int:instance_id>/logs', methods=['GET'])
 def api_task_instance_logs(instance_id):
     """获取任务实例的日志"""
@@ -502,15 +575,65 @@ def api_task_instance_logs(instance_id):
         return jsonify({"status": "error", "message": "任务实例不存在"}), 404
     
     task_id = instance.get('task_id')
-    logs = data_manager.get_task_log(task_id, instance_id)
+    offset = request.args.get('offset', type=int)
+    limit = request.args.get('limit', type=int)
+    tail = request.args.get('tail', type=int)
+    
+    # 未指定 offset 时默认返回最后一页
+    if offset is None and tail is None:
+        tail = limit or DEFAULT_TASK_LOG_LINES
+    page = data_manager.read_task_log(task_id, instance_id, offset=offset, limit=limit, tail=tail)
     
     return jsonify({
         "status": "success",
         "instance_id": instance_id,
         "task_id": task_id,
-        "logs": logs
+        "instance_status": instance.get('status'),
+        "logs": page["lines"],
+        "offset": page["offset"],
+        "next_offset": page["next_offset"],
+        "size": page["size"]
     })
 
+@api_bp.route('/task-instances/<int:instance_id>/logs/stream', methods=['GET'])
+def api_task_instance_log_stream(instance_id):
+    """
+    以 Server-Sent Events 推送任务日志的新行，实例结束后发送 end 事件并断开
+    
+    从 offset 参数（或重连时的 Last-Event-ID）开始读取，每个事件的 id 为下一次读取的字节偏移
+    """
+    data_manager = current_app.config['DATA_MANAGER']
+    instance = data_manager.get_task_instance(instance_id)
+    
+    if not instance:
+        return jsonify({"status": "error", "message": "任务实例不存在"}), 404
+    
+    task_id = instance.get('task_id')
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', 0, type=int)
+    
+    def generate():
+        next_offset = offset
+        while True:
+            page = data_manager.read_task_log(task_id, instance_id, offset=next_offset, limit=MAX_TASK_LOG_LINES)
+            next_offset = page["next_offset"]
+            if page["lines"]:
+                data = "\n".join(f"data: {line}" for line in page["lines"])
+                yield f"id: {next_offset}\n{data}\n\n"
+                continue
+            
+            # 没有新行时检查实例是否已结束
+            current = data_manager.get_task_instance(instance_id)
+            if not current or current.get('status') not in ACTIVE_INSTANCE_STATUSES:
+                yield f"id: {next_offset}\nevent: end\ndata: {(current or {}).get('status', '')}\n\n"
+                return
+            yield ": keep-alive\n\n"
+            time.sleep(TASK_LOG_STREAM_INTERVAL)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @api_bp.route('/settings', methods=['GET', 'PUT'])
 def api_settings():
     """设置 API"""
@@ -519,6 +642,11 @@ def api_settings():
     if request.method == 'PUT':
         settings_data = request.json
         data_manager.update_settings(settings_data)
+        
+        # 并发设置立即生效
+        sync_manager = current_app.config.get('SYNC_MANAGER')
+        if sync_manager:
+            sync_manager.configure_executor()
         return jsonify({"status": "success", "message": "设置已更新"})
     
     return jsonify(data_manager.get_settings())
@@ -566,7 +694,8 @@ def get_storages():
             connection.get('server'),
             connection.get('username'),
             connection.get('password'),
-            connection.get('token')
+            connection.get('token'),
+            max_retry=connection.get('max_retry')
         )
         
         # 尝试登录
@@ -707,7 +836,8 @@ def get_all_storages():
                     connection.get('server'),
                     connection.get('username'),
                     connection.get('password'),
-                    connection.get('token')
+                    connection.get('token'),
+                    max_retry=connection.get('max_retry')
                 )
                 
                 # 尝试登录
@@ -910,7 +1040,11 @@ def dashboard_stats():
                 "task_duration_counts": task_duration_counts,
                 "success_rate_labels": success_rate_labels,
                 "success_rate_values": success_rate_values,
-                "recent_tasks": recent_tasks
+                "recent_tasks": recent_tasks,
+                "storage": {
+                    "backend": data_manager.backend,
+                    "cache": data_manager.get_cache_stats()
+                }
             }
         })
     except Exception as e:
@@ -955,7 +1089,8 @@ def scheduler_status():
             "message": "调度器正在运行",
             "running": scheduler.running,
             "job_count": len(jobs),
-            "jobs": job_info
+            "jobs": job_info,
+            "executor": sync_manager.executor.status()
         })
     except Exception as e:
         import traceback
@@ -1063,27 +1198,23 @@ def api_logs():
     timestamp = request.args.get('timestamp')
     limit = request.args.get('limit', 100, type=int)
     
-    # 获取所有日志
-    logs = data_manager.get_logs(limit=limit)
+    # 任务和时间条件交给日志存储筛选，可以跳过不相关的日志分段
+    try:
+        task_id = int(task_id) if task_id else None
+    except (ValueError, TypeError):
+        task_id = None
+    
+    try:
+        timestamp = int(timestamp) if timestamp else None
+    except (ValueError, TypeError):
+        timestamp = None
+    
+    logs = data_manager.get_logs(limit=limit, task_id=task_id, since=timestamp, until=timestamp)
     
     # 应用筛选条件
     if level:
         logs = [log for log in logs if log.get('level') == level]
     
-    if task_id:
-        try:
-            task_id = int(task_id)
-            logs = [log for log in logs if log.get('task_id') == task_id]
-        except (ValueError, TypeError):
-            pass
-    
-    if timestamp:
-        try:
-            timestamp = int(timestamp)
-            logs = [log for log in logs if log.get('timestamp') == timestamp]
-        except (ValueError, TypeError):
-            pass
-    
     if search:
         search = search.lower()
         filtered_logs = []
@@ -1120,19 +1251,7 @@ def api_log_detail(log_id):
     """获取单个日志详情"""
     data_manager = current_app.config['DATA_MANAGER']
     
-    # 获取所有日志
-    logs = data_manager.get_logs(limit=1000)
-    
-    # 查找指定 ID 的日志
-    log = None
-    for i, item in enumerate(logs):
-        # 如果日志没有 ID，使用索引作为 ID
-        if 'id' not in item:
-            item['id'] = i + 1
-            
-        if item.get('id') == log_id:
-            log = item
-            break
+    log = data_manager.get_log(log_id)
     
     if not log:
         return jsonify({"status": "error", "message": "日志不存在"}), 404
@@ -1156,7 +1275,7 @@ def api_clear_logs():
         })
         
         # 清空日志
-        data_manager._write_json(data_manager.logs_file, [])
+        data_manager.clear_logs()
         
         return jsonify({
             "status": "success",
@@ -1247,53 +1366,58 @@ def import_export_page():
     """导入导出页面"""
     return render_template('import_export.html')
 
+@api_bp.route('/logs/cleanup', methods=['GET', 'POST'])
+def api_logs_cleanup():
+    """GET 获取最近一次日志清理报告，POST 立即执行日志清理"""
+    data_manager = current_app.config['DATA_MANAGER']
+    
+    if request.method == 'POST':
+        try:
+            days = (request.get_json(silent=True) or {}).get('days')
+            report = data_manager.run_log_cleanup(int(days) if days is not None else None)
+            return jsonify({"status": "success", "message": "日志清理完成", "report": report})
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "无效的保留天数"}), 400
+        except Exception as e:
+            current_app.logger.error(f"日志清理失败: {str(e)}")
+            return jsonify({"status": "error", "message": f"日志清理失败: {str(e)}"}), 500
+    
+    return jsonify({"status": "success", "report": data_manager.get_cleanup_report()})
+
 @api_bp.route('/logs/repair', methods=['POST'])
 def api_repair_logs():
     """修复日志文件"""
     try:
         data_manager = current_app.config['DATA_MANAGER']
         
-        # 读取旧日志
-        try:
-            with open(data_manager.logs_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                old_logs = json.loads(content) if content else []
-                if not isinstance(old_logs, list):
-                    old_logs = []
-        except Exception:
-            old_logs = []
-        
-        # 创建测试日志
-        timestamp = int(time.time())
-        test_log = {
+        # 重建日志索引，跳过无法解析的日志行
+        logs_count = data_manager.repair_logs()
+        
+        # 写入测试日志
+        data_manager.add_log({
             "level": "INFO",
             "message": "日志系统已修复",
-            "timestamp": timestamp,
-            "timestamp_formatted": data_manager.format_timestamp(timestamp),
             "details": {"triggered_by": "repair_api"}
-        }
-        
-        # 重写日志文件
-        logs = old_logs + [test_log]
-        data_manager._write_json(data_manager.logs_file, logs)
+        })
+        logs_count += 1
         
-        # 验证日志文件
+        # 验证日志
         try:
-            new_logs = data_manager.get_logs()
+            new_logs = data_manager.get_logs(limit=1)
             if len(new_logs) > 0:
                 success = True
-                message = f"日志文件已修复，当前有 {len(new_logs)} 条日志"
+                message = f"日志已修复，当前有 {logs_count} 条日志"
             else:
                 success = False
-                message = "日志文件修复失败，仍然无法读取日志"
+                message = "日志修复失败，仍然无法读取日志"
         except Exception as e:
             success = False
-            message = f"日志文件修复失败: {str(e)}"
+            message = f"日志修复失败: {str(e)}"
         
         return jsonify({
             "status": "success" if success else "error",
             "message": message,
-            "logs_count": len(logs)
+            "logs_count": logs_count
         })
     except Exception as e:
         import traceback
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 断点格式版本
+CHECKPOINT_VERSION = 1
+# 默认保存断点的间隔（秒）
+DEFAULT_CHECKPOINT_INTERVAL = 60
+# 断点默认有效期（小时），超过后重新完整同步
+DEFAULT_CHECKPOINT_MAX_AGE = 24
+
+
+def listing_fingerprint(contents: Optional[List[Dict]]) -> Optional[str]:
+    """目录列表的指纹（名称、类型、大小、修改时间），列表失败时返回None"""
+    if contents is None:
+        return None
+    items = sorted((item.get("name") or "", bool(item.get("is_dir")), item.get("size"), item.get("modified") or "")
+                   for item in contents)
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class SyncCheckpoint:
+    """
+    同步断点，记录每个目录对已完成的目录和待处理的目录队列，定期通过 on_save 保存
+
+    目录列出并规划完成、且它的同步动作全部成功后记为已完成；已登记但未完成的目录组成待处理队列。
+    中断后再次运行时，源根目录列表未变化的目录对从待处理队列继续，已完成的目录不再列出；
+    上次已完成且源根目录未变化的目录对整体跳过。断点以目录为单位，待处理目录中已完成的文件会在比较后跳过。
+
+    失效策略:
+        - 同步配置（服务器地址、差异处理、过滤条件等）变化时全部失效
+        - 超过 max_age 小时未更新时全部失效
+        - 目录对的源根目录列表变化时，该目录对重新完整同步
+    """
+
+    def __init__(self, fingerprint: str = "", resume: Dict = None, on_save: Callable[[Dict], None] = None,
+                 interval: float = DEFAULT_CHECKPOINT_INTERVAL, max_age: float = DEFAULT_CHECKPOINT_MAX_AGE):
+        self.fingerprint = fingerprint
+        self.on_save = on_save
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._saved_at = 0.0
+        # 已结束或上次运行保存的目录对: 目录对 -> {"root", "done", "completed", "pending"}
+        self._pairs: Dict[str, Dict] = {}
+        if resume and resume.get("version") == CHECKPOINT_VERSION and resume.get("fingerprint") == fingerprint \
+                and time.time() - resume.get("updated_at", 0) <= max_age * 3600:
+            self._pairs = dict(resume.get("pairs") or {})
+        self.resumable = bool(self._pairs)
+        # 正在同步的目录对
+        self._pair: Optional[str] = None
+        self._root_dir: Optional[str] = None
+        self._root: Optional[str] = None
+        self._pending: Dict[str, List] = {}  # 源目录 -> [目标目录, 目标目录是否存在]
+        self._completed = set()
+        self._states: Dict[str, List] = {}  # 源目录 -> [执行中的动作组数, 是否已规划, 是否失败]
+
+    @staticmethod
+    def make_fingerprint(*values) -> str:
+        """根据同步配置生成指纹，配置变化时断点失效"""
+        return hashlib.sha1(json.dumps([str(v) for v in values], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(src_dir: str, dst_dir: str) -> str:
+        return f"{src_dir}:{dst_dir}"
+
+    @property
+    def completed_count(self) -> int:
+        with self._lock:
+            return len(self._completed)
+
+    def saved_pair(self, src_dir: str, dst_dir: str) -> Optional[Dict]:
+        """上次运行保存的目录对断点"""
+        return self._pairs.get(self._key(src_dir, dst_dir))
+
+    def begin_pair(self, src_dir: str, dst_dir: str, root: str = None) -> List[Tuple[str, str, Optional[bool]]]:
+        """
+        开始同步一个目录对
+
+        参数:
+            root: 源根目录当前的列表指纹，与断点中的记录一致时才从断点继续
+
+        返回:
+            需要从其开始列出的目录 [(源目录, 目标目录, 目标目录是否存在)]，目录对上次已完成且未变化时返回空列表
+        """
+        key = self._key(src_dir, dst_dir)
+        saved = self._pairs.get(key)
+        resume = bool(saved and root and saved.get("root") == root)
+        if resume and saved.get("done"):
+            return []
+        with self._lock:
+            # 上一个目录对异常中断、没有调用 finish_pair 时保留它的待处理队列
+            if self._pair is not None:
+                self._pairs[self._pair] = self._pair_state()
+            self._pair, self._root_dir = key, src_dir
+            self._pending, self._completed, self._states = {}, set(), {}
+            self._root = root if resume else None
+            if resume and saved.get("pending"):
+                self._completed = set(saved.get("completed") or [])
+                self._pending = {src: [dst, exists] for src, dst, exists in saved["pending"]}
+            else:
+                self._pending = {src_dir: [dst_dir, None]}
+            start_dirs = [(src, dst, exists) for src, (dst, exists) in self._pending.items()]
+        self.save(force=True)
+        return start_dirs
+
+    def finish_pair(self, src_dir: str, dst_dir: str, success: bool):
+        """目录对同步结束，成功时记为已完成，失败时保留待处理队列供下次继续"""
+        with self._lock:
+            key = self._key(src_dir, dst_dir)
+            if key != self._pair:
+                return
+            self._pairs[key] = {"root": self._root, "done": True} if success else self._pair_state()
+            self._pair = self._root_dir = self._root = None
+            self._pending, self._completed, self._states = {}, set(), {}
+        self.save(force=True)
+
+    def visit(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None) -> bool:
+        """登记待列出的子目录，已完成或已在待处理队列中的目录返回 False"""
+        with self._lock:
+            if src_dir in self._pending or src_dir in self._completed:
+                return False
+            self._pending[src_dir] = [dst_dir, dst_exists]
+            return True
+
+    def planned(self, listing):
+        """目录已列出并规划完成，同步动作全部成功后记为已完成"""
+        with self._lock:
+            if listing.src_dir == self._root_dir:
+                self._root = listing_fingerprint(listing.src_contents)
+            self._state(listing.src_dir)[1] = True
+            self._check(listing.src_dir)
+        self.save()
+
+    def open(self, src_dir: str):
+        """目录的一组同步动作开始执行"""
+        with self._lock:
+            self._state(src_dir)[0] += 1
+
+    def close(self, src_dir: str, success: bool):
+        """目录的一组同步动作执行结束"""
+        with self._lock:
+            state = self._states.get(src_dir)
+            if state is None:
+                return
+            state[0] -= 1
+            state[2] = state[2] or not success
+            self._check(src_dir)
+        self.save()
+
+    def fail(self, src_dir: str):
+        """目录有同步动作失败，本次运行中不再记为已完成"""
+        with self._lock:
+            self._state(src_dir)[2] = True
+
+    def complete(self, src_dir: str):
+        """直接记为已完成（如排除的目录）"""
+        with self._lock:
+            self._states.pop(src_dir, None)
+            self._pending.pop(src_dir, None)
+            self._completed.add(src_dir)
+
+    def save(self, force: bool = False):
+        """距上次保存超过 interval 时保存断点，force 时立即保存"""
+        if self.on_save is None or (not force and time.time() - self._saved_at < self.interval):
+            return
+        # 其他线程正在保存时跳过，不阻塞执行线程
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            with self._lock:
+                data = self.to_dict()
+            self._saved_at = time.time()
+            self.on_save(data)
+        finally:
+            self._save_lock.release()
+
+    def to_dict(self) -> Dict:
+        """断点内容，正在同步的目录对记录当前的已完成目录和待处理队列"""
+        with self._lock:
+            pairs = dict(self._pairs)
+            if self._pair is not None:
+                pairs[self._pair] = self._pair_state()
+            return {"version": CHECKPOINT_VERSION, "fingerprint": self.fingerprint,
+                    "updated_at": int(time.time()), "pairs": pairs}
+
+    def _pair_state(self) -> Dict:
+        return {"root": self._root, "done": False, "completed": sorted(self._completed),
+                "pending": [[src, dst, exists] for src, (dst, exists) in self._pending.items()]}
+
+    def _state(self, src_dir: str) -> List:
+        return self._states.setdefault(src_dir, [0, False, False])
+
+    def _check(self, src_dir: str):
+        """已规划、没有执行中的动作组且没有失败的目录记为已完成"""
+        running, planned, failed = self._states[src_dir]
+        if planned and not running and not failed:
+            self.complete(src_dir)
+
+
+class NullCheckpoint:
+    """
+    不记录断点时使用的空实现，接口与 SyncCheckpoint 相同
+
+    不保存任何目录状态，遍历时的内存占用与不使用断点时相同。
+    """
+
+    resumable = False
+    completed_count = 0
+
+    def saved_pair(self, src_dir: str, dst_dir: str) -> Optional[Dict]:
+        return None
+
+    def begin_pair(self, src_dir: str, dst_dir: str, root: str = None) -> List[Tuple[str, str, Optional[bool]]]:
+        return [(src_dir, dst_dir, None)]
+
+    def finish_pair(self, src_dir: str, dst_dir: str, success: bool):
+        pass
+
+    def visit(self, src_dir: str, dst_dir: str, dst_exists: Optional[bool] = None) -> bool:
+        return True
+
+    def planned(self, listing):
+        pass
+
+    def open(self, src_dir: str):
+        pass
+
+    def close(self, src_dir: str, success: bool):
+        pass
+
+    def fail(self, src_dir: str):
+        pass
+
+    def complete(self, src_dir: str):
+        pass
+
+    def save(self, force: bool = False):
+        pass
@@ -0,0 +1,235 @@
+"""
+同步引擎对比: python -m app.sync_engine_compare
+
+启动一个内存中的模拟 AList 服务，在同一组源/目标目录上分别用 AlistSync（线程）和 AsyncAlistSync（asyncio）
+执行同步，对比两者的同步结果和同步后的目录树。覆盖差异处理 none / move / delete、移动源文件和正则表达式过滤
+五种配置，任一配置结果不一致时以非零状态退出。
+"""
+import asyncio
+import collections
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.alist_sync import AlistSync, close_connection_pools
+from app.alist_sync_async import AsyncAlistSync
+
+# 对比的配置: (差异处理方式, 是否移动源文件, 正则表达式)
+COMPARE_MODES = (("none", False, None), ("move", False, None), ("delete", False, None), ("none", True, None),
+                 ("none", False, r"f[01]\.txt$"))
+# 模拟服务的存储挂载路径
+MOCK_STORAGES = ("/src", "/dst")
+
+
+class MockAlistFS:
+    """模拟 AList 的内存文件树: 路径 -> {"is_dir", "size", "modified"}"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {"/": {"is_dir": True}}
+        self.counts = collections.Counter()
+        self.latency = 0.0
+
+    @staticmethod
+    def normalize(path):
+        return "/" + (path or "").strip("/")
+
+    def add(self, path, size=None, modified="2024-01-01T00:00:00Z"):
+        """添加文件（size 不为空）或目录，自动创建上级目录"""
+        path = self.normalize(path)
+        current = ""
+        for part in path.strip("/").split("/")[:-1]:
+            current += "/" + part
+            self.nodes.setdefault(current, {"is_dir": True, "modified": modified})
+        if size is None:
+            self.nodes[path] = {"is_dir": True, "modified": modified}
+        else:
+            self.nodes[path] = {"is_dir": False, "size": size, "modified": modified}
+
+    def children(self, path):
+        prefix = self.normalize(path).rstrip("/") + "/"
+        return sorted(({"name": key[len(prefix):], "size": node.get("size", 0), "is_dir": node["is_dir"],
+                        "modified": node.get("modified", "2024-01-01T00:00:00Z")}
+                       for key, node in self.nodes.items()
+                       if key.startswith(prefix) and "/" not in key[len(prefix):] and key != prefix.rstrip("/")),
+                      key=lambda item: item["name"])
+
+    def copy_tree(self, src, dst):
+        src, dst = self.normalize(src), self.normalize(dst)
+        for key, node in list(self.nodes.items()):
+            if key == src or key.startswith(src + "/"):
+                self.nodes[dst + key[len(src):]] = dict(node)
+
+    def remove_tree(self, path):
+        path = self.normalize(path)
+        for key in [key for key in self.nodes if key == path or key.startswith(path + "/")]:
+            del self.nodes[key]
+
+    def snapshot(self):
+        """同步后的目录树，用于对比"""
+        return {key: node for key, node in sorted(self.nodes.items()) if key.startswith(MOCK_STORAGES)}
+
+
+class _MockAlistHandler(BaseHTTPRequestHandler):
+    """模拟 AList API，只实现同步引擎用到的接口"""
+
+    protocol_version = "HTTP/1.1"
+    fs: MockAlistFS = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, data=None, code=200, message="success"):
+        body = json.dumps({"code": code, "message": message, "data": data}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        fs, path = self.fs, self.path
+        if fs.latency:
+            time.sleep(fs.latency)
+        with fs.lock:
+            fs.counts[path] += 1
+            if path == "/api/auth/login":
+                return self._send({"token": "mock-token"})
+            if path == "/api/admin/setting/list":
+                return self._send([{"key": "token", "value": "mock-token"}])
+            if path == "/api/admin/storage/list":
+                return self._send({"content": [{"mount_path": mount_path} for mount_path in MOCK_STORAGES]})
+            if path.startswith("/api/admin/task/copy/"):
+                return self._send([])
+            if path in ("/api/fs/list", "/api/fs/get"):
+                node_path = fs.normalize(body.get("path"))
+                node = fs.nodes.get(node_path)
+                if node is None:
+                    return self._send(code=500, message="object not found")
+                if path == "/api/fs/list":
+                    return self._send({"content": fs.children(node_path), "total": 0})
+                return self._send({"name": node_path.rsplit("/", 1)[-1], "size": node.get("size", 0),
+                                   "is_dir": node["is_dir"], "modified": node.get("modified")})
+            if path == "/api/fs/mkdir":
+                fs.add(body["path"])
+                return self._send()
+            if path in ("/api/fs/copy", "/api/fs/move"):
+                for name in body["names"]:
+                    src = f"{body['src_dir'].rstrip('/')}/{name}"
+                    if fs.normalize(src) not in fs.nodes:
+                        return self._send(code=500, message=f"object not found: {src}")
+                    fs.copy_tree(src, f"{body['dst_dir'].rstrip('/')}/{name}")
+                    if path == "/api/fs/move":
+                        fs.remove_tree(src)
+                return self._send()
+            if path == "/api/fs/remove":
+                for name in body["names"]:
+                    fs.remove_tree(f"{body['dir'].rstrip('/')}/{name}")
+                return self._send()
+            return self._send(code=404, message="not found")
+
+
+class MockAlistServer:
+    """在后台线程中运行的模拟 AList 服务"""
+
+    def __init__(self):
+        self.fs = MockAlistFS()
+        handler = type("MockAlistHandler", (_MockAlistHandler,), {"fs": self.fs})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, name="mock-alist", daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def build_scenario(fs, files_per_dir=3):
+    """
+    构造对比用的源/目标目录:
+        源目录多层子目录、空目录和排除目录；目标目录中有大小相同、较新、较旧的同名文件和多余的文件/目录
+    """
+    fs.nodes = {"/": {"is_dir": True}}
+    for directory in ("a", "a/b", "a/b/c", "e", "x"):
+        for i in range(files_per_dir):
+            fs.add(f"/src/data/{directory}/f{i}.txt", size=100 + i)
+    fs.add("/src/data/empty")
+    fs.add("/src/data/top.bin", size=5)
+    fs.add("/dst/data/a/f0.txt", size=100)
+    fs.add("/dst/data/a/f1.txt", size=1, modified="2030-01-01T00:00:00Z")
+    fs.add("/dst/data/a/f2.txt", size=1, modified="2000-01-01T00:00:00Z")
+    fs.add("/dst/data/a/extra.txt", size=9)
+    fs.add("/dst/data/gone/z.txt", size=9)
+
+
+def run_engine(engine, sync_delete_action, move_file, regex_patterns=None):
+    """
+    在新构造的模拟目录上用指定引擎同步 /src/data -> /dst/data
+
+    参数:
+        regex_patterns: 正则表达式，与 run_sync 一样编译后作为 regex_pattern 传给引擎
+
+    返回:
+        (同步结果, 同步后的目录树, 各接口请求次数)
+    """
+    server = MockAlistServer()
+    build_scenario(server.fs)
+    regex_pattern = re.compile(regex_patterns) if regex_patterns else None
+    args = (server.base_url, "admin", "password", None, sync_delete_action, ["/src/data/x"], move_file,
+            [], regex_pattern)
+    try:
+        if engine == "async":
+            async def run():
+                alist = AsyncAlistSync(*args)
+                try:
+                    if not await alist.login():
+                        return False
+                    return await alist.sync_directories("/src/data", "/dst/data")
+                finally:
+                    await alist.close()
+            result = asyncio.run(run())
+        else:
+            alist = AlistSync(*args)
+            try:
+                result = alist.login() and alist.sync_directories("/src/data", "/dst/data")
+            finally:
+                alist.close()
+        return result, server.fs.snapshot(), dict(server.fs.counts)
+    finally:
+        close_connection_pools()
+        server.close()
+
+
+def compare_engines():
+    """逐个配置对比两个引擎，返回是否全部一致"""
+    passed = True
+    for sync_delete_action, move_file, regex_patterns in COMPARE_MODES:
+        thread_result, thread_tree, thread_counts = run_engine("thread", sync_delete_action, move_file, regex_patterns)
+        async_result, async_tree, async_counts = run_engine("async", sync_delete_action, move_file, regex_patterns)
+        same = thread_result == async_result and thread_tree == async_tree
+        passed = passed and same
+        print(f"[{'一致' if same else '不一致'}] 差异处理: {sync_delete_action}, 移动源文件: {move_file}, "
+              f"正则表达式: {regex_patterns}, "
+              f"结果: {thread_result}/{async_result}, "
+              f"请求数: {sum(thread_counts.values())}/{sum(async_counts.values())}")
+        if not same:
+            for path in sorted(set(thread_tree) | set(async_tree)):
+                if thread_tree.get(path) != async_tree.get(path):
+                    print(f"    {path}: thread={thread_tree.get(path)} async={async_tree.get(path)}")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if compare_engines() else 1)
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+# 计划文件格式版本
+PLAN_VERSION = 1
+
+
+def get_default_plan_file() -> str:
+    """未指定计划文件时的默认路径: 项目根目录下的 data/plan/plan_<时间>.jsonl"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, "data", "plan", f"plan_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+
+class SyncPlanWriter:
+    """
+    同步计划写入器，dry-run 时将规划阶段产生的同步动作写入 JSON Lines 文件
+
+    文件格式:
+        - 第一行: 计划头，记录版本、服务器地址、目录对和同步配置
+        - 中间每行一个同步动作 {"action", "src_dir", "dst_dir", "name"}，skip 动作只计数不写入
+        - 最后一行: 各类动作数量汇总和规划结果
+
+    先写入临时文件，close 时再替换为正式文件，中途出错时调用 discard 丢弃
+    """
+
+    def __init__(self, file_path: str, header: Dict = None):
+        self.file_path = file_path
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self._tmp_path = f"{file_path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+        self._write_line({"plan": PLAN_VERSION, "created_at": int(time.time()), **(header or {})})
+
+    def _write_line(self, data: Dict):
+        self._file.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def write(self, action):
+        """写入一个同步动作（SyncAction）"""
+        with self._lock:
+            self.counts[action.action] = self.counts.get(action.action, 0) + 1
+            if action.action == "skip":
+                return
+            data = action._asdict()
+            if not data.get("reason"):
+                data.pop("reason", None)
+            self._write_line(data)
+
+    def close(self, result: bool = True) -> bool:
+        """写入汇总并保存计划文件，result 为规划阶段是否全部成功"""
+        with self._lock:
+            if self._file.closed:
+                return False
+            try:
+                self._write_line({"summary": self.counts, "result": result})
+                self._file.close()
+                os.replace(self._tmp_path, self.file_path)
+                return True
+            except OSError:
+                return False
+
+    def discard(self):
+        """丢弃未完成的计划"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+
+
+def read_plan(file_path: str) -> Iterator[Dict]:
+    """逐行读取计划文件中的同步动作，跳过计划头和汇总行"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            if "action" in data:
+                yield data
+
+
+def read_plan_header(file_path: str) -> Optional[Dict]:
+    """读取计划头，文件不存在或格式不正确时返回None"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+        return header if header.get("plan") == PLAN_VERSION else None
+    except (OSError, ValueError):
+        return None
+
+
+def read_plan_summary(file_path: str) -> Optional[Dict]:
+    """读取计划最后一行: {"summary": 各类动作数量, "result": 规划是否全部成功}"""
+    try:
+        with open(file_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 4096))
+            lines: List[bytes] = f.read().splitlines()
+        data = json.loads(lines[-1].decode("utf-8")) if lines else {}
+        return data if "summary" in data else None
+    except (OSError, ValueError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import glob
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.utils.file_lock import FileLock
+
+# 快照默认有效期（小时），超过后该目录重新完整比较
+DEFAULT_SNAPSHOT_MAX_AGE = 24
+# 单个快照文件默认最多保存的目录数
+DEFAULT_SNAPSHOT_MAX_ENTRIES = 200000
+
+
+def get_snapshot_dir() -> str:
+    """快照目录: 项目根目录下的 data/snapshot"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, "data", "snapshot")
+
+
+class SnapshotStore:
+    """
+    远程目录快照存储，每个 (服务器地址, 同步配置指纹) 一个JSON文件
+
+    记录每个已成功同步的源目录的列表签名和子目录修改时间，供下次运行时跳过未变化的目录。
+    本次运行的记录先暂存，只有目录对整体同步成功后才写入文件。
+    同一连接上配置不同的任务使用各自的文件，互不影响；配置相同的任务共用一个文件，
+    写入时在文件锁内重新读取并合并，不会覆盖其他任务（或其他进程）同时写入的记录。
+
+    失效策略:
+        - 超过 max_age 小时的记录视为无效，超过 max_age 未更新的快照文件在写入时删除
+        - 同步配置（差异处理、过滤条件等）变化时使用新的快照文件
+        - full_rescan 时忽略已有记录，但仍写入新的快照
+        - 记录数超过 max_entries 时淘汰最早同步的记录
+    """
+
+    def __init__(self, base_url: str, fingerprint: str = "", max_age: float = DEFAULT_SNAPSHOT_MAX_AGE,
+                 max_entries: int = DEFAULT_SNAPSHOT_MAX_ENTRIES, full_rescan: bool = False,
+                 snapshot_dir: str = None):
+        self.snapshot_dir = snapshot_dir or get_snapshot_dir()
+        self._url_name = hashlib.sha1((base_url or "").encode("utf-8")).hexdigest()[:16]
+        fingerprint_name = hashlib.sha1((fingerprint or "").encode("utf-8")).hexdigest()[:16]
+        self.file_path = os.path.join(self.snapshot_dir, f"{self._url_name}-{fingerprint_name}.json")
+        # 同一服务器地址的快照文件共用一个锁文件
+        self._file_lock = FileLock(os.path.join(self.snapshot_dir, f"{self._url_name}.lock"))
+        self.fingerprint = fingerprint
+        self.max_age = max_age * 3600
+        self.max_entries = max_entries
+        self.full_rescan = full_rescan
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._staged: Dict[str, Dict] = {}
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(src_dir: str, dst_dir: str) -> str:
+        return f"{src_dir}:{dst_dir}"
+
+    def _load(self) -> Dict[str, Dict]:
+        """读取快照文件中的记录，文件不存在、损坏或配置指纹不一致时返回空字典"""
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") == self.fingerprint:
+                return data.get("entries") or {}
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def get(self, src_dir: str, dst_dir: str) -> Optional[Dict]:
+        """获取有效的目录快照，不存在、已过期或强制重新扫描时返回None"""
+        if self.full_rescan:
+            return None
+        with self._lock:
+            entry = self._entries.get(self._key(src_dir, dst_dir))
+        if not entry or time.time() - entry.get("synced_at", 0) > self.max_age:
+            return None
+        return entry
+
+    def stage(self, src_dir: str, dst_dir: str, signature: str, dirs: Dict[str, str]):
+        """暂存本次运行中已成功处理的目录"""
+        with self._lock:
+            self._staged[self._key(src_dir, dst_dir)] = {
+                "signature": signature,
+                "dirs": dirs,
+                "synced_at": time.time()
+            }
+
+    def discard(self):
+        """丢弃暂存的记录"""
+        with self._lock:
+            self._staged = {}
+
+    def commit(self) -> bool:
+        """将暂存记录与快照文件中的最新记录合并后写入"""
+        with self._lock:
+            staged, self._staged = self._staged, {}
+        try:
+            with self._file_lock:
+                entries = self._load()
+                entries.update(staged)
+                if len(entries) > self.max_entries:
+                    keep = sorted(entries.items(), key=lambda kv: kv[1].get("synced_at", 0), reverse=True)
+                    entries = dict(keep[:self.max_entries])
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                tmp_path = f"{self.file_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"fingerprint": self.fingerprint, "entries": entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.file_path)
+                self._remove_expired_files()
+        except OSError:
+            return False
+        with self._lock:
+            self._entries = entries
+        return True
+
+    def _remove_expired_files(self):
+        """删除同一服务器地址下超过有效期未更新的快照文件（如旧配置的快照、旧版本按地址保存的快照），在文件锁内调用"""
+        now = time.time()
+        paths = glob.glob(os.path.join(self.snapshot_dir, f"{self._url_name}-*.json"))
+        paths.append(os.path.join(self.snapshot_dir, f"{self._url_name}.json"))
+        for path in paths:
+            try:
+                if path != self.file_path and now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def listing_signature(contents: List[Dict]) -> str:
+        """目录列表签名：名称、大小、类型和修改时间"""
+        items = sorted((item.get("name") or "", item.get("size") or 0, bool(item.get("is_dir")),
+                        item.get("modified") or "") for item in contents or [])
+        return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_fingerprint(*values) -> str:
+        """根据同步配置生成指纹，配置变化时快照失效"""
+        return hashlib.sha1(json.dumps([str(v) for v in values], ensure_ascii=False).encode("utf-8")).hexdigest()
+
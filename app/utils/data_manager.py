@@ -4,13 +4,54 @@ import time
 import datetime
 from datetime import datetime as dt, timedelta
 import glob
+import gzip
+import bisect
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from flask import current_app
+from app.utils.file_lock import FileLock
+from app.utils.json_serializer import JsonSerializer
+from app.utils.log_store import LogStore
+from app.utils.task_log_writer import TaskLogWriter
+
+# 存储后端: json（默认）或 sqlite，由环境变量 STORAGE_BACKEND 选择，首次使用 sqlite 时自动从JSON文件迁移
+STORAGE_BACKENDS = ("json", "sqlite")
+# SQLite 后端系统日志最多保留的条数
+MAX_LOG_ENTRIES = 1000
+# 任务日志按行分页读取时默认和最多返回的行数
+DEFAULT_TASK_LOG_LINES = 1000
+MAX_TASK_LOG_LINES = 10000
+# 未结束的任务实例状态: 排队中、运行中
+ACTIVE_INSTANCE_STATUSES = ("queued", "running")
+# 已结束的任务实例状态，更新为这些状态时记录结束时间
+FINISHED_INSTANCE_STATUSES = ("completed", "failed", "cancelled")
+# 支持 transaction() 的数据集合，同时修改多个集合时按此顺序嵌套
+TRANSACTION_COLLECTIONS = ("users", "settings", "connections", "tasks")
+
+
+def create_data_manager(data_dir=None, backend=None):
+    """按配置创建数据管理器，backend 默认读取环境变量 STORAGE_BACKEND"""
+    backend = (backend or os.environ.get("STORAGE_BACKEND") or "json").lower()
+    if backend not in STORAGE_BACKENDS:
+        logging.warning(f"未知的存储后端: {backend}，将使用默认值: json")
+        backend = "json"
+    if backend == "sqlite":
+        from app.utils.sqlite_data_manager import SQLiteDataManager
+        return SQLiteDataManager(data_dir)
+    return DataManager(data_dir)
+
 
 class DataManager:
     """数据管理器，负责处理JSON文件的读写操作"""
     
+    # 存储后端名称
+    backend = "json"
+    
     def __init__(self, data_dir=None):
         """初始化数据管理器"""
         # 获取项目根目录
@@ -33,20 +74,68 @@ class DataManager:
         self.connections_file = os.path.join(self.config_dir, "connections.json")
         self.tasks_file = os.path.join(self.config_dir, "tasks.json")
         self.settings_file = os.path.join(self.config_dir, "settings.json")
-        self.logs_file = os.path.join(self.log_dir, "logs.json")
-        self.task_instances_file = os.path.join(self.config_dir, "task_instances.json")
+        self.logs_file = os.path.join(self.log_dir, "logs.json")  # 旧版系统日志，启动时迁移到 system_logs_dir
+        self.system_logs_dir = os.path.join(self.log_dir, "system_logs")
+        self.task_instances_file = os.path.join(self.config_dir, "task_instances.json")  # 旧版任务实例，启动时拆分到日期分区
+        self.task_instances_dir = os.path.join(self.config_dir, "task_instances")
+        self.task_instances_meta_file = os.path.join(self.task_instances_dir, "meta.json")
+        self.cleanup_report_file = os.path.join(self.log_dir, "cleanup_report.json")
+        
+        # 用户可能手动查看或编辑的配置文件使用缩进格式，其余由程序读写的文件使用紧凑格式
+        self._serializer = JsonSerializer()
+        self._pretty_json_files = {self.users_file, self.connections_file, self.tasks_file, self.settings_file}
         
         # 确保任务日志目录存在
         self.task_logs_dir = os.path.join(self.log_dir, "task_logs")
         os.makedirs(self.task_logs_dir, exist_ok=True)
         
-        # 创建初始数据文件（如果不存在）
+        # 运行中任务实例的缓冲日志写入器: 日志文件路径 -> TaskLogWriter
+        self._task_log_writers = {}
+        self._task_log_writers_lock = threading.Lock()
+        
+        # 已结束实例的日志在后台压缩为 .log.gz，压缩和追加已压缩日志时持有该锁
+        self._task_log_archiver = None
+        self._task_log_archive_lock = threading.Lock()
+        
+        # dry-run 生成的同步计划，与任务实例一一对应
+        self.task_plans_dir = os.path.join(self.log_dir, "task_plans")
+        
+        # 同步断点，每个任务实例一个文件，实例记录中只保存 has_checkpoint 标记
+        self.task_checkpoints_dir = os.path.join(self.data_dir, "checkpoints")
+        
+        # JSON文件内存缓存: 文件路径 -> (文件签名, 数据)
+        self._json_cache = {}
+        self._cache_lock = threading.RLock()
+        self._cache_stats = {}
+        
+        # 每个JSON文件一个文件锁，所有写入和读-改-写都在锁内执行
+        self._file_locks = {}
+        self._file_locks_guard = threading.Lock()
+        self._transaction_local = threading.local()
+        
+        # 任务实例分区索引: 分区文件路径 -> (数据, 索引)，分区内容变化后重建
+        self._instance_index_cache = {}
+        # 实例ID -> 日期分区，实例创建后不会改变
+        self._instance_partitions = {}
+        self._partition_dirs = set()
+        
+        self._init_storage()
+    
+    def _init_storage(self):
+        """初始化存储，JSON后端创建初始数据文件（如果不存在）"""
         self._ensure_file_exists(self.users_file, self._get_default_users())
         self._ensure_file_exists(self.connections_file, [])
         self._ensure_file_exists(self.tasks_file, [])
         self._ensure_file_exists(self.settings_file, self._get_default_settings())
-        self._ensure_file_exists(self.logs_file, [])
-        self._ensure_file_exists(self.task_instances_file, [])
+        
+        # 任务实例按日期分区存储
+        os.makedirs(self.task_instances_dir, exist_ok=True)
+        self._migrate_task_instances_json()
+        self._migrate_task_instance_files()
+        
+        # 系统日志使用只追加的分段存储
+        self.log_store = LogStore(self.system_logs_dir)
+        self._migrate_logs_json()
     
     def _get_default_settings(self):
         """获取默认设置"""
@@ -56,6 +145,7 @@ class DataManager:
             "refresh_interval": 60,
             "keep_log_days": 7,  # 默认保留日志天数为7天
             "max_concurrent_tasks": 3,
+            "max_tasks_per_connection": 1,  # 同一连接最多同时执行的任务数
             "default_retry_count": 3,
             "default_block_size": 10485760,  # 10MB
             "bandwidth_limit": 0,
@@ -88,8 +178,65 @@ class DataManager:
             }
         ]
     
+    @staticmethod
+    def _file_signature(file_path):
+        """文件签名（inode、修改时间、大小），文件被替换或修改后签名变化"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    @staticmethod
+    def _copy_json(data):
+        """复制JSON数据，避免调用方修改缓存中的对象"""
+        if isinstance(data, dict):
+            return {key: DataManager._copy_json(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [DataManager._copy_json(value) for value in data]
+        return data
+    
+    def _count_cache(self, file_path, hit):
+        stats = self._cache_stats.setdefault(os.path.basename(file_path), {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+    
+    def get_cache_stats(self):
+        """获取JSON文件缓存的命中统计"""
+        with self._cache_lock:
+            files = {name: dict(stats) for name, stats in self._cache_stats.items()}
+        return {
+            "hits": sum(stats["hits"] for stats in files.values()),
+            "misses": sum(stats["misses"] for stats in files.values()),
+            "files": files
+        }
+    
+    def _read_cached(self, file_path):
+        """
+        读取 JSON 文件，文件签名未变化时直接返回缓存数据
+        
+        返回的是缓存中的对象，调用方只能读取不能修改；需要修改时使用 transaction 或 _read_json
+        """
+        with self._cache_lock:
+            signature = self._file_signature(file_path)
+            entry = self._json_cache.get(file_path)
+            if signature is not None and entry and entry[0] == signature:
+                self._count_cache(file_path, True)
+                return entry[1]
+            self._count_cache(file_path, False)
+        # 读取磁盘时不持有缓存锁，文件损坏时 _load_json_file 会获取文件锁重写文件
+        data = self._load_json_file(file_path)
+        with self._cache_lock:
+            signature = self._file_signature(file_path)
+            if signature is not None:
+                self._json_cache[file_path] = (signature, data)
+        return data
+    
     def _read_json(self, file_path):
-        """读取 JSON 文件"""
+        """读取 JSON 文件，返回可修改的副本"""
+        return self._copy_json(self._read_cached(file_path))
+    
+    def _load_json_file(self, file_path):
+        """从磁盘读取 JSON 文件"""
         try:
             # 如果文件不存在，创建默认内容
             if not os.path.exists(file_path):
@@ -121,8 +268,8 @@ class DataManager:
                 
                 # 尝试解析JSON
                 try:
-                    return json.loads(content)
-                except json.JSONDecodeError as e:
+                    return self._serializer.loads(content)
+                except ValueError as e:
                     print(f"JSON解析错误 ({file_path}): {str(e)}")
                     # 如果文件内容不是有效的JSON，返回默认值
                     if "logs.json" in file_path:
@@ -152,32 +299,85 @@ class DataManager:
             else:
                 return []
     
+    def _file_lock(self, file_path):
+        """获取 JSON 文件对应的文件锁（锁文件为 <文件名>.lock），任务实例分区共用一个锁"""
+        if os.path.dirname(file_path) == self.task_instances_dir:
+            file_path = os.path.join(self.task_instances_dir, "instances")
+        with self._file_locks_guard:
+            lock = self._file_locks.get(file_path)
+            if lock is None:
+                lock = self._file_locks[file_path] = FileLock(file_path + ".lock")
+            return lock
+    
+    @contextmanager
+    def transaction(self, name):
+        """
+        原子的读-改-写: with dm.transaction('tasks') as tasks: ...
+        
+        在文件锁内读取最新数据，with 块正常结束后写回，块内抛出异常时放弃修改。
+        同一线程内可以嵌套，嵌套同一集合时修改同一份数据，只有最外层写回。
+        同时修改多个集合时按 TRANSACTION_COLLECTIONS 中的顺序嵌套，避免进程之间互相等待。
+        
+        参数:
+            name: 集合名称，见 TRANSACTION_COLLECTIONS
+        """
+        with self._file_transaction(self._collection_file(name)) as data:
+            yield data
+    
+    @contextmanager
+    def _file_transaction(self, file_path, default=None):
+        """对单个 JSON 文件的原子读-改-写，见 transaction；文件不存在且指定了 default 时从 default 开始"""
+        with self._file_lock(file_path):
+            active = self._transaction_data()
+            if file_path in active:
+                yield active[file_path]
+                return
+            if default is not None and not os.path.exists(file_path):
+                data = self._copy_json(default)
+            else:
+                data = self._read_json(file_path)
+            active[file_path] = data
+            try:
+                yield data
+                self._write_json(file_path, data)
+            finally:
+                del active[file_path]
+    
+    def _collection_file(self, name):
+        if name not in TRANSACTION_COLLECTIONS:
+            raise ValueError(f"未知的数据集合: {name}")
+        return getattr(self, f"{name}_file")
+    
+    def _transaction_data(self):
+        """当前线程进行中的事务: 文件路径 -> 数据"""
+        local = self._transaction_local
+        if not hasattr(local, "data"):
+            local.data = {}
+        return local.data
+    
     def _write_json(self, file_path, data):
-        """写入 JSON 文件"""
+        """写入 JSON 文件，写入在文件锁内执行，写入后更新缓存"""
+        with self._file_lock(file_path):
+            self._write_json_file(file_path, data)
+            with self._cache_lock:
+                signature = self._file_signature(file_path)
+                if signature is not None:
+                    self._json_cache[file_path] = (signature, self._copy_json(data))
+                else:
+                    self._json_cache.pop(file_path, None)
+    
+    def _write_json_file(self, file_path, data):
+        """写入 JSON 文件到磁盘"""
+        pretty = file_path in self._pretty_json_files
         try:
-            # 确保目录存在
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            # 先写入临时文件
-            temp_file = file_path + ".tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, ensure_ascii=False, indent=2, fp=f)
-            
-            # 然后原子性地重命名为目标文件
-            if os.path.exists(file_path):
-                # 在Windows上需要先删除现有文件
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"删除现有文件失败: {str(e)}")
-                    
-            os.rename(temp_file, file_path)
+            # 先写入临时文件再原子性地替换目标文件，其他进程读取时不会看到文件缺失或写了一半
+            self._serializer.write_file(file_path, data, pretty)
         except Exception as e:
             print(f"写入JSON文件时出错 ({file_path}): {str(e)}")
             # 如果重命名失败，尝试直接写入
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, ensure_ascii=False, indent=2, fp=f)
+                with open(file_path, 'wb') as f:
+                    f.write(self._serializer.dumps(data, pretty))
             except Exception as write_error:
                 print(f"直接写入也失败了: {str(write_error)}")
     
@@ -194,10 +394,9 @@ class DataManager:
     
     def get_user(self, username):
         """通过用户名获取用户"""
-        users = self.get_users()
-        for user in users:
+        for user in self._read_cached(self.users_file):
             if user["username"] == username:
-                return user
+                return self._copy_json(user)
         return None
     
     def authenticate_user(self, username, password):
@@ -211,37 +410,34 @@ class DataManager:
     
     def update_user_password(self, username, new_password):
         """更新用户密码"""
-        users = self.get_users()
-        for i, user in enumerate(users):
-            if user["username"] == username:
-                users[i]["password"] = new_password
-                users[i]["updated_at"] = self.format_timestamp(int(time.time()))
-                self._write_json(self.users_file, users)
-                return True
+        with self.transaction("users") as users:
+            for user in users:
+                if user["username"] == username:
+                    user["password"] = new_password
+                    user["updated_at"] = self.format_timestamp(int(time.time()))
+                    return True
         return False
     
     def update_username(self, old_username, new_username):
         """更新用户名"""
-        if self.get_user(new_username):
-            return False  # 新用户名已存在
+        with self.transaction("users") as users:
+            if any(user["username"] == new_username for user in users):
+                return False  # 新用户名已存在
             
-        users = self.get_users()
-        for i, user in enumerate(users):
-            if user["username"] == old_username:
-                users[i]["username"] = new_username
-                users[i]["updated_at"] = self.format_timestamp(int(time.time()))
-                self._write_json(self.users_file, users)
-                return True
+            for user in users:
+                if user["username"] == old_username:
+                    user["username"] = new_username
+                    user["updated_at"] = self.format_timestamp(int(time.time()))
+                    return True
         return False
     
     def update_last_login(self, username):
         """更新用户最后登录时间"""
-        users = self.get_users()
-        for i, user in enumerate(users):
-            if user["username"] == username:
-                users[i]["last_login"] = self.format_timestamp(int(time.time()))
-                self._write_json(self.users_file, users)
-                return True
+        with self.transaction("users") as users:
+            for user in users:
+                if user["username"] == username:
+                    user["last_login"] = self.format_timestamp(int(time.time()))
+                    return True
         return False
     
     # 连接管理
@@ -251,46 +447,42 @@ class DataManager:
     
     def get_connection(self, conn_id):
         """获取单个连接"""
-        connections = self.get_connections()
-        for conn in connections:
+        for conn in self._read_cached(self.connections_file):
             if conn["connection_id"] == conn_id:
-                return conn
+                return self._copy_json(conn)
         return None
     
     def add_connection(self, connection_data):
         """添加连接"""
-        connections = self.get_connections()
-        # 生成新ID
-        next_id = 1
-        if connections:
-            next_id = max(conn["connection_id"] for conn in connections) + 1
-        
-        connection_data["connection_id"] = next_id
-        connection_data["created_at"] = self.format_timestamp(int(time.time()))
-        connection_data["updated_at"] = self.format_timestamp(int(time.time()))
-        
-        connections.append(connection_data)
-        self._write_json(self.connections_file, connections)
+        with self.transaction("connections") as connections:
+            # 生成新ID
+            next_id = 1
+            if connections:
+                next_id = max(conn["connection_id"] for conn in connections) + 1
+            
+            connection_data["connection_id"] = next_id
+            connection_data["created_at"] = self.format_timestamp(int(time.time()))
+            connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+            
+            connections.append(connection_data)
         return next_id
     
     def update_connection(self, conn_id, connection_data):
         """更新连接"""
-        connections = self.get_connections()
-        for i, conn in enumerate(connections):
-            if conn["connection_id"] == conn_id:
-                connection_data["connection_id"] = conn_id
-                connection_data["created_at"] = conn.get("created_at")
-                connection_data["updated_at"] = self.format_timestamp(int(time.time()))
-                connections[i] = connection_data
-                self._write_json(self.connections_file, connections)
-                return True
+        with self.transaction("connections") as connections:
+            for i, conn in enumerate(connections):
+                if conn["connection_id"] == conn_id:
+                    connection_data["connection_id"] = conn_id
+                    connection_data["created_at"] = conn.get("created_at")
+                    connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+                    connections[i] = connection_data
+                    return True
         return False
     
     def delete_connection(self, conn_id):
         """删除连接"""
-        connections = self.get_connections()
-        connections = [conn for conn in connections if conn["connection_id"] != conn_id]
-        self._write_json(self.connections_file, connections)
+        with self.transaction("connections") as connections:
+            connections[:] = [conn for conn in connections if conn["connection_id"] != conn_id]
     
     # 任务管理
     def get_tasks(self):
@@ -299,70 +491,64 @@ class DataManager:
     
     def get_task(self, task_id):
         """获取单个任务"""
-        tasks = self.get_tasks()
-        for task in tasks:
+        for task in self._read_cached(self.tasks_file):
             if task["id"] == task_id:
-                return task
+                return self._copy_json(task)
         return None
     
     def add_task(self, task_data):
         """添加任务"""
-        tasks = self.get_tasks()
-        # 生成新ID
-        next_id = 1
-        if tasks:
-            next_id = max(task["id"] for task in tasks) + 1
-        
-        task_data["id"] = next_id
-        task_data["created_at"] = self.format_timestamp(int(time.time()))
-        task_data["updated_at"] = self.format_timestamp(int(time.time()))
-        task_data["status"] = "pending"
-        task_data["last_run"] = ""
-        task_data["next_run"] = ""
-        
-        tasks.append(task_data)
-        self._write_json(self.tasks_file, tasks)
+        with self.transaction("tasks") as tasks:
+            # 生成新ID
+            next_id = 1
+            if tasks:
+                next_id = max(task["id"] for task in tasks) + 1
+            
+            task_data["id"] = next_id
+            task_data["created_at"] = self.format_timestamp(int(time.time()))
+            task_data["updated_at"] = self.format_timestamp(int(time.time()))
+            task_data["status"] = "pending"
+            task_data["last_run"] = ""
+            task_data["next_run"] = ""
+            
+            tasks.append(task_data)
         return next_id
     
     def update_task(self, task_id, task_data):
         """更新任务"""
-        tasks = self.get_tasks()
-        for i, task in enumerate(tasks):
-            if task["id"] == task_id:
-                task_data["id"] = task_id
-                task_data["created_at"] = task.get("created_at")
-                task_data["updated_at"] = self.format_timestamp(int(time.time()))
-                # 保留其他状态字段
-                for field in ["status", "last_run", "next_run"]:
-                    if field in task and field not in task_data:
-                        task_data[field] = task[field]
-                
-                tasks[i] = task_data
-                self._write_json(self.tasks_file, tasks)
-                return True
+        with self.transaction("tasks") as tasks:
+            for i, task in enumerate(tasks):
+                if task["id"] == task_id:
+                    task_data["id"] = task_id
+                    task_data["created_at"] = task.get("created_at")
+                    task_data["updated_at"] = self.format_timestamp(int(time.time()))
+                    # 保留其他状态字段
+                    for field in ["status", "last_run", "next_run"]:
+                        if field in task and field not in task_data:
+                            task_data[field] = task[field]
+                    
+                    tasks[i] = task_data
+                    return True
         return False
     
     def delete_task(self, task_id):
         """删除任务"""
-        tasks = self.get_tasks()
-        tasks = [task for task in tasks if task["id"] != task_id]
-        self._write_json(self.tasks_file, tasks)
+        with self.transaction("tasks") as tasks:
+            tasks[:] = [task for task in tasks if task["id"] != task_id]
     
     def update_task_status(self, task_id, status, last_run=None, next_run=None):
         """更新任务状态"""
-        tasks = self.get_tasks()
-        for i, task in enumerate(tasks):
-            if task["id"] == task_id:
-                task["status"] = status
-                if last_run:
-                    task["last_run"] = self.format_timestamp(last_run)
-                if next_run:
-                    # 如果提供的是数字时间戳，则格式化为字符串
-                    task["next_run"] = self.format_timestamp(next_run)
-                    current_app.logger.debug(f"已更新任务 {task_id} 的下次运行时间: {task['next_run']}")
-                tasks[i] = task
-                self._write_json(self.tasks_file, tasks)
-                return True
+        with self.transaction("tasks") as tasks:
+            for task in tasks:
+                if task["id"] == task_id:
+                    task["status"] = status
+                    if last_run:
+                        task["last_run"] = self.format_timestamp(last_run)
+                    if next_run:
+                        # 如果提供的是数字时间戳，则格式化为字符串
+                        task["next_run"] = self.format_timestamp(next_run)
+                        current_app.logger.debug(f"已更新任务 {task_id} 的下次运行时间: {task['next_run']}")
+                    return True
         return False
     
     # 设置管理
@@ -372,26 +558,38 @@ class DataManager:
     
     def update_settings(self, settings_data):
         """更新设置"""
-        current_settings = self.get_settings()
-        current_settings.update(settings_data)
-        self._write_json(self.settings_file, current_settings)
+        with self.transaction("settings") as current_settings:
+            current_settings.update(settings_data)
     
     # 日志管理
-    def get_logs(self, limit=100):
-        """获取最新日志"""
+    def _migrate_logs_json(self):
+        """将旧版 logs.json 中的日志导入日志存储，导入后文件改名为 logs.json.migrated"""
+        if not os.path.exists(self.logs_file):
+            return
+        logs = self._load_json_file(self.logs_file)
+        if isinstance(logs, list) and logs and not self.log_store.count():
+            for log in sorted(logs, key=lambda x: x.get("timestamp", 0)):
+                log.pop("id", None)
+                self.log_store.append(log)
         try:
-            logs = self._read_json(self.logs_file)
-            
-            # 确保logs是一个列表
-            if not isinstance(logs, list):
-                print(f"日志文件内容不是有效的列表，重置为空列表")
-                logs = []
-                self._write_json(self.logs_file, logs)
-                
-            logs_sorted = sorted(logs, key=lambda x: x.get("timestamp", 0), reverse=True)[:limit]
+            os.replace(self.logs_file, self.logs_file + ".migrated")
+        except OSError as e:
+            print(f"重命名旧日志文件失败: {str(e)}")
+    
+    def get_logs(self, limit=100, task_id=None, since=None, until=None):
+        """
+        获取最新日志
+        
+        参数:
+            limit: 最多返回的条数
+            task_id: 只返回该任务的日志
+            since/until: 时间戳范围（包含两端）
+        """
+        try:
+            logs = self.log_store.query(limit=limit, task_id=task_id, since=since, until=until)
             
             # 格式化时间戳和添加缺失的任务名称
-            for log in logs_sorted:
+            for log in logs:
                 if "timestamp" in log:
                     log["timestamp_formatted"] = self.format_timestamp(log["timestamp"])
                 
@@ -404,17 +602,23 @@ class DataManager:
                         # 如果找不到对应的任务，使用任务ID作为备用显示
                         log["task_name"] = f"任务 {log['task_id']}"
             
-            return logs_sorted
+            return logs
             
         except Exception as e:
             print(f"获取日志时出错: {str(e)}")
             # 如果出错，返回空列表
             return []
     
+    def get_log(self, log_id):
+        """按ID获取单条日志"""
+        log = self.log_store.get(log_id)
+        if log and "timestamp" in log:
+            log["timestamp_formatted"] = self.format_timestamp(log["timestamp"])
+        return log
+    
     def add_log(self, log_data):
-        """添加日志"""
+        """添加日志，只追加到当前日志分段"""
         try:
-            logs = self._read_json(self.logs_file)
             timestamp = int(time.time())
             log_data["timestamp"] = timestamp
             log_data["timestamp_formatted"] = self.format_timestamp(timestamp)
@@ -425,160 +629,422 @@ class DataManager:
                 if task:
                     log_data["task_name"] = task.get("name", "未知任务")
             
-            # 确保logs是一个列表
-            if not isinstance(logs, list):
-                logs = []
-                
-            # 限制日志数量为最新的 1000 条
-            logs.append(log_data)
-            logs = sorted(logs, key=lambda x: x.get("timestamp", 0), reverse=True)[:1000]
-            
-            # 写入日志前打印调试信息
-            print(f"正在写入日志，当前日志条数: {len(logs)}")
-            try:
-                self._write_json(self.logs_file, logs)
-                print(f"日志写入成功 - {log_data.get('message', '无消息')}")
-            except Exception as e:
-                print(f"写入日志时发生错误: {str(e)}")
-                # 尝试重新创建日志文件
-                with open(self.logs_file, 'w', encoding='utf-8') as f:
-                    json.dump(logs, ensure_ascii=False, indent=2, fp=f)
+            self.log_store.append(log_data)
         except Exception as e:
             print(f"添加日志失败: {str(e)}")
-            # 确保日志文件存在并有效
-            self._ensure_file_exists(self.logs_file, [])
     
     def clear_old_logs(self, days=None):
-        """清理旧日志"""
+        """
+        清理旧日志，按分段整体删除
+        
+        返回:
+            {"removed": 删除的日志条数, "bytes": 释放的字节数}
+        """
         if days is None:
             settings = self.get_settings()
             days = settings.get("keep_log_days", 7)
         
-        logs = self._read_json(self.logs_file)
         current_time = int(time.time())
         cutoff_time = current_time - (days * 86400)  # 一天有 86400 秒
         
-        logs = [log for log in logs if log.get("timestamp", 0) > cutoff_time]
-        self._write_json(self.logs_file, logs)
+        return self.log_store.delete_before(cutoff_time)
+    
+    def clear_logs(self):
+        """清空全部日志"""
+        self.log_store.clear()
+    
+    def repair_logs(self):
+        """重建日志索引，跳过无法解析的日志行，返回日志条数"""
+        return self.log_store.rebuild_index()
     
     # 任务实例管理
-    def get_task_instances(self, task_id=None, limit=50):
-        """获取任务实例列表，可以按任务ID筛选"""
-        instances = self._read_json(self.task_instances_file)
+    # 任务实例按开始日期分区存储在 task_instances/<YYYY-MM-DD>.json，实例日志和计划文件也按同一日期分目录，
+    # 清理时整体删除过期分区
+    @staticmethod
+    def _partition_of(timestamp):
+        """时间戳所属的日期分区"""
+        return dt.fromtimestamp(timestamp or 0).strftime("%Y-%m-%d")
+    
+    def _instance_partition_file(self, partition):
+        return os.path.join(self.task_instances_dir, f"{partition}.json")
+    
+    def _list_instance_partitions(self):
+        """已有的任务实例分区，按日期升序"""
+        try:
+            names = os.listdir(self.task_instances_dir)
+        except OSError:
+            return []
+        return sorted(name[:-len(".json")] for name in names
+                      if name.endswith(".json") and len(name) == len("YYYY-MM-DD.json"))
+    
+    def _instances_lock(self):
+        """分配实例ID和读写分区时持有的锁，全部分区共用"""
+        return self._file_lock(self.task_instances_meta_file)
+    
+    def _migrate_task_instances_json(self):
+        """将旧版 task_instances.json 按开始日期拆分到分区，拆分后文件改名为 task_instances.json.migrated"""
+        if not os.path.exists(self.task_instances_file):
+            return
+        instances = self._load_json_file(self.task_instances_file)
+        partitions = {}
+        for instance in instances if isinstance(instances, list) else []:
+            partitions.setdefault(self._partition_of(instance.get("start_time", 0)), []).append(instance)
+        with self._instances_lock():
+            for partition, items in partitions.items():
+                with self._file_transaction(self._instance_partition_file(partition), default=[]) as data:
+                    known = {item.get("task_instances_id") for item in data}
+                    data.extend(item for item in items if item.get("task_instances_id") not in known)
+            try:
+                os.replace(self.task_instances_file, self.task_instances_file + ".migrated")
+            except OSError as e:
+                print(f"重命名旧任务实例文件失败: {str(e)}")
+    
+    def _load_all_task_instances(self):
+        """读取全部分区的任务实例，按开始时间升序"""
+        instances = []
+        for partition in self._list_instance_partitions():
+            instances.extend(self._read_json(self._instance_partition_file(partition)))
+        return instances
+    
+    @staticmethod
+    def _instance_key(instance):
+        """任务实例排序键: (开始时间, 实例ID)"""
+        return instance.get("start_time", 0), instance.get("task_instances_id", 0)
+    
+    @staticmethod
+    def instance_cursor(instance):
+        """任务实例分页游标: <开始时间>_<实例ID>"""
+        start_time, instance_id = DataManager._instance_key(instance)
+        return f"{start_time}_{instance_id}"
+    
+    @staticmethod
+    def parse_instance_cursor(cursor):
+        """解析分页游标，格式不正确时抛出 ValueError"""
+        start_time, _, instance_id = str(cursor).partition("_")
+        return int(start_time), int(instance_id)
+    
+    def _partition_index(self, partition):
+        """
+        单个分区的任务实例索引，分区内容变化后重建
         
-        # 按时间戳降序排序
-        instances = sorted(instances, key=lambda x: x.get("start_time", 0), reverse=True)
+        返回:
+            {"by_id": 实例ID -> 实例, "all": (排序键列表, 实例列表),
+             "by_task": 任务ID -> (排序键列表, 实例列表), "max_id": 最大实例ID}
+            列表按开始时间升序排列，实例是缓存中的对象，只能读取
+        """
+        file_path = self._instance_partition_file(partition)
+        instances = self._read_cached(file_path)
+        with self._cache_lock:
+            cached = self._instance_index_cache.get(file_path)
+        if cached is not None and cached[0] is instances:
+            return cached[1]
         
-        # 如果指定了任务ID，则只返回该任务的实例
-        if task_id:
-            instances = [inst for inst in instances if inst.get("task_id") == task_id]
+        # 实例基本按开始时间追加，排序接近线性
+        index = {"by_id": {}, "all": ([], []), "by_task": {}, "max_id": 0}
+        for instance in sorted(instances, key=self._instance_key):
+            key = self._instance_key(instance)
+            instance_id = instance.get("task_instances_id")
+            index["by_id"][instance_id] = instance
+            index["max_id"] = max(index["max_id"], instance_id or 0)
+            index["all"][0].append(key)
+            index["all"][1].append(instance)
+            keys, items = index["by_task"].setdefault(instance.get("task_id"), ([], []))
+            keys.append(key)
+            items.append(instance)
+            self._instance_partitions[instance_id] = partition
+        with self._cache_lock:
+            self._instance_index_cache[file_path] = (instances, index)
+        return index
+    
+    def get_task_instances(self, task_id=None, limit=50, before=None, after=None):
+        """
+        获取任务实例列表，按开始时间从新到旧排列，可以按任务ID筛选
         
-        # 返回指定数量的实例
-        return instances[:limit]
+        参数:
+            task_id: 只返回该任务的实例
+            limit: 最多返回的条数
+            before: 分页游标，只返回比该游标更早的实例
+            after: 分页游标，只返回比该游标更新的实例（紧接游标的 limit 条）
+        """
+        before_key = self.parse_instance_cursor(before) if before is not None else None
+        after_key = self.parse_instance_cursor(after) if after is not None else None
+        partitions = self._list_instance_partitions()
+        # after 从游标所在分区向新的方向取，其余从游标所在分区（或最新分区）向旧的方向取
+        if after_key is not None:
+            partitions = [p for p in partitions if p >= self._partition_of(after_key[0])]
+        else:
+            if before_key is not None:
+                partitions = [p for p in partitions if p <= self._partition_of(before_key[0])]
+            partitions.reverse()
+        
+        results = []
+        for partition in partitions:
+            if len(results) >= limit:
+                break
+            index = self._partition_index(partition)
+            if task_id:
+                keys, items = index["by_task"].get(task_id, ([], []))
+            else:
+                keys, items = index["all"]
+            
+            start = bisect.bisect_right(keys, after_key) if after_key is not None else 0
+            end = bisect.bisect_left(keys, before_key) if before_key is not None else len(keys)
+            remaining = limit - len(results)
+            if after_key is not None:
+                results.extend(items[start:min(end, start + remaining)])
+            else:
+                results.extend(items[max(start, end - remaining):end][::-1])
+        
+        if after_key is not None:
+            results.reverse()
+        return self._copy_json(results)
     
     def get_task_instance(self, instance_id):
-        """获取单个任务实例"""
-        instances = self._read_json(self.task_instances_file)
-        for instance in instances:
-            if instance.get("task_instances_id") == instance_id:
-                return instance
+        """获取单个任务实例，已知所在分区时只查该分区"""
+        partition = self._instance_partitions.get(instance_id)
+        partitions = [partition] if partition else reversed(self._list_instance_partitions())
+        for partition in partitions:
+            if not os.path.exists(self._instance_partition_file(partition)):
+                continue
+            instance = self._partition_index(partition)["by_id"].get(instance_id)
+            if instance:
+                return self._copy_json(instance)
         return None
     
-    def add_task_instance(self, task_id, start_params=None):
-        """添加新的任务实例记录"""
-        instances = self._read_json(self.task_instances_file)
+    def get_active_task_instances(self):
+        """获取所有排队中和执行中的任务实例"""
+        instances = []
+        for partition in self._list_instance_partitions():
+            instances.extend(instance for instance in self._partition_index(partition)["all"][1]
+                             if instance.get("status") in ACTIVE_INSTANCE_STATUSES)
+        return self._copy_json(instances)
+    
+    def _instance_partition(self, instance_id):
+        """任务实例所在的日期分区，实例不存在时返回None"""
+        partition = self._instance_partitions.get(instance_id)
+        if partition is None:
+            instance = self.get_task_instance(instance_id)
+            if instance:
+                partition = self._instance_partitions[instance_id] = self._partition_of(instance.get("start_time", 0))
+        return partition
+    
+    def _next_instance_id(self):
+        """分配新的实例ID，需要在 _instances_lock 内调用；分区被清理后ID仍继续递增"""
+        meta = self._read_json(self.task_instances_meta_file) if os.path.exists(self.task_instances_meta_file) else None
+        # 已记录 next_id 时只需再检查最新分区，否则扫描全部分区
+        partitions = self._list_instance_partitions()
+        if isinstance(meta, dict) and "next_id" in meta:
+            partitions = partitions[-1:]
+        else:
+            meta = {}
+        next_id = max([meta.get("next_id", 1)] + [self._partition_index(partition)["max_id"] + 1
+                                                  for partition in partitions])
+        self._write_json(self.task_instances_meta_file, {"next_id": next_id + 1})
+        return next_id
+    
+    def add_task_instance(self, task_id, start_params=None, status="running"):
+        """添加新的任务实例记录，排队等待执行的实例状态为 queued"""
         task = self.get_task(task_id)
         
         if not task:
             return None
         
-        # 生成新ID
-        next_id = 1
-        if instances:
-            next_id = max(instance.get("task_instances_id", 0) for instance in instances) + 1
-        
-        # 获取当前时间戳
-        start_time = int(time.time())
-        
-        # 创建任务实例记录
-        instance = {
-            "task_instances_id": next_id,
-            "task_id": task_id,
-            "task_name": task.get("name", f"任务 {task_id}"),
-            "start_time": start_time,
-            "start_time_formatted": self.format_timestamp(start_time),
-            "end_time": 0,
-            "end_time_formatted": "",
-            "status": "running",
-            "params": start_params or {},
-            "result": {}
-        }
-        
-        instances.append(instance)
-        self._write_json(self.task_instances_file, instances)
+        with self._instances_lock():
+            # 生成新ID
+            next_id = self._next_instance_id()
+            
+            # 获取当前时间戳
+            start_time = int(time.time())
+            
+            # 创建任务实例记录
+            instance = {
+                "task_instances_id": next_id,
+                "task_id": task_id,
+                "task_name": task.get("name", f"任务 {task_id}"),
+                "start_time": start_time,
+                "start_time_formatted": self.format_timestamp(start_time),
+                "end_time": 0,
+                "end_time_formatted": "",
+                "status": status,
+                "params": start_params or {},
+                "result": {},
+                # 创建实例的进程，重启后据此判断排队中和执行中的实例是否已中断
+                "owner_pid": os.getpid()
+            }
+            
+            partition = self._partition_of(start_time)
+            with self._file_transaction(self._instance_partition_file(partition), default=[]) as instances:
+                instances.append(instance)
+            self._instance_partitions[next_id] = partition
         
         # 创建任务日志文件
-        self._create_task_log_file(task_id, instance["task_instances_id"], f"开始执行任务: {instance['task_name']}")
+        self._create_task_log_file(task_id, instance["task_instances_id"], f"{'开始执行任务' if status == 'running' else '任务已加入执行队列'}: {instance['task_name']}")
         
         return instance
     
     def update_task_instance(self, instance_id, status, result=None, end_time=None):
         """更新任务实例状态"""
-        instances = self._read_json(self.task_instances_file)
+        partition = self._instance_partition(instance_id)
+        if partition is None:
+            return False
         
-        for i, instance in enumerate(instances):
-            if instance.get("task_instances_id") == instance_id:
-                instances[i]["status"] = status
-                
-                if result:
-                    instances[i]["result"] = result
-                
-                if end_time or status in ["completed", "failed"]:
-                    end_time = end_time or int(time.time())
-                    instances[i]["end_time"] = end_time
-                    instances[i]["end_time_formatted"] = self.format_timestamp(end_time)
-                
-                self._write_json(self.task_instances_file, instances)
-                
-                # 更新任务日志
-                self._append_task_log(
-                    instance.get("task_id"), 
-                    instance_id, 
-                    f"任务状态更新为: {status}" + (f", 结果: {json.dumps(result, ensure_ascii=False)}" if result else "")
-                )
-                
-                return True
-                
+        with self._file_transaction(self._instance_partition_file(partition)) as instances:
+            for instance in instances:
+                if instance.get("task_instances_id") == instance_id:
+                    instance["status"] = status
+                    
+                    if result:
+                        instance["result"] = result
+                    
+                    if end_time or status in FINISHED_INSTANCE_STATUSES:
+                        end_time = end_time or int(time.time())
+                        instance["end_time"] = end_time
+                        instance["end_time_formatted"] = self.format_timestamp(end_time)
+                    break
+            else:
+                return False
+        
+        # 更新任务日志
+        self._append_task_log(
+            instance.get("task_id"), 
+            instance_id, 
+            f"任务状态更新为: {status}" + (f", 结果: {json.dumps(result, ensure_ascii=False)}" if result else "")
+        )
+        
+        return True
+    
+    def update_task_instance_checkpoint(self, instance_id, checkpoint):
+        """
+        保存任务实例的同步断点，checkpoint 为 None 时删除
+        
+        断点写入单独的文件，不重写实例所在的分区；实例记录中只在首次保存和删除时更新 has_checkpoint 标记。
+        """
+        instance = self.get_task_instance(instance_id)
+        if not instance:
+            return False
+        checkpoint_file = self._get_task_checkpoint_file_path(instance.get("task_id"), instance_id)
+        if checkpoint is None:
+            try:
+                os.remove(checkpoint_file)
+            except FileNotFoundError:
+                pass
+            if instance.get("has_checkpoint"):
+                return self._update_task_instance_fields(instance_id, has_checkpoint=None)
+            return True
+        self._serializer.write_file(checkpoint_file, checkpoint)
+        if not instance.get("has_checkpoint"):
+            return self._update_task_instance_fields(instance_id, has_checkpoint=True)
+        return True
+    
+    def get_task_instance_checkpoint(self, instance_id):
+        """读取任务实例保存的同步断点，没有断点时返回None"""
+        instance = self.get_task_instance(instance_id)
+        if not instance or not instance.get("has_checkpoint"):
+            return None
+        try:
+            with open(self._get_task_checkpoint_file_path(instance.get("task_id"), instance_id), "rb") as f:
+                return self._serializer.loads(f.read())
+        except (OSError, ValueError) as e:
+            logging.error(f"读取任务实例 {instance_id} 的断点失败: {str(e)}")
+            return None
+    
+    def _update_task_instance_fields(self, instance_id, **fields):
+        """更新任务实例记录中的字段，值为 None 时删除该字段"""
+        partition = self._instance_partition(instance_id)
+        if partition is None:
+            return False
+        
+        with self._file_transaction(self._instance_partition_file(partition)) as instances:
+            for instance in instances:
+                if instance.get("task_instances_id") == instance_id:
+                    for key, value in fields.items():
+                        if value is None:
+                            instance.pop(key, None)
+                        else:
+                            instance[key] = value
+                    return True
         return False
     
     def clear_old_task_instances(self, days=None):
-        """清理旧的任务实例记录"""
+        """
+        清理旧的任务实例记录及其日志和计划文件，按天整体删除早于截止日期的分区
+        
+        返回:
+            {"removed": 删除的分区数, "bytes": 释放的字节数}
+        """
         if days is None:
             settings = self.get_settings()
             days = settings.get("keep_log_days", 7)
         
-        instances = self._read_json(self.task_instances_file)
         current_time = int(time.time())
         cutoff_time = current_time - (days * 86400)  # 一天有 86400 秒
+        cutoff_partition = self._partition_of(cutoff_time)
         
-        # 保留较新的任务实例
-        new_instances = [inst for inst in instances if inst.get("start_time", 0) > cutoff_time]
-        
-        # 删除旧实例对应的日志文件
-        old_instances = [inst for inst in instances if inst.get("start_time", 0) <= cutoff_time]
-        for instance in old_instances:
-            log_file = self._get_task_log_file_path(instance.get("task_id"), instance.get("task_instances_id"))
-            if os.path.exists(log_file):
+        removed, reclaimed = 0, 0
+        with self._instances_lock():
+            for partition in self._list_instance_partitions():
+                if partition >= cutoff_partition:
+                    break
+                file_path = self._instance_partition_file(partition)
                 try:
-                    os.remove(log_file)
-                except:
-                    pass
+                    reclaimed += os.path.getsize(file_path)
+                    os.remove(file_path)
+                    removed += 1
+                except OSError as e:
+                    print(f"删除任务实例分区失败 ({partition}): {str(e)}")
+                with self._cache_lock:
+                    self._json_cache.pop(file_path, None)
+                    self._instance_index_cache.pop(file_path, None)
         
-        self._write_json(self.task_instances_file, new_instances)
+        reclaimed += self._clear_old_task_files(cutoff_partition)
+        return {"removed": removed, "bytes": reclaimed}
+    
+    def _clear_old_task_files(self, cutoff_partition):
+        """删除早于截止日期的任务日志和计划文件分区目录，返回释放的字节数"""
+        reclaimed = 0
+        for base_dir in (self.task_logs_dir, self.task_plans_dir, self.task_checkpoints_dir):
+            try:
+                names = os.listdir(base_dir)
+            except OSError:
+                continue
+            for name in names:
+                partition_dir = os.path.join(base_dir, name)
+                if len(name) != len("YYYY-MM-DD") or name >= cutoff_partition or not os.path.isdir(partition_dir):
+                    continue
+                for entry in os.scandir(partition_dir):
+                    try:
+                        reclaimed += entry.stat().st_size
+                    except OSError:
+                        pass
+                shutil.rmtree(partition_dir, ignore_errors=True)
+                self._partition_dirs.discard(partition_dir)
+        return reclaimed
+    
+    def _migrate_task_instance_files(self):
+        """将旧版平铺在 task_logs、task_plans 目录下的实例文件移动到所属的日期分区目录"""
+        for base_dir in (self.task_logs_dir, self.task_plans_dir, self.task_checkpoints_dir):
+            for file_path in glob.glob(os.path.join(base_dir, "task_*_instance_*")):
+                if not os.path.isfile(file_path):
+                    continue
+                try:
+                    instance_part = os.path.basename(file_path).split("_instance_")[1].split(".")[0]
+                    partition = self._instance_partition(int(instance_part))
+                except (IndexError, ValueError):
+                    continue
+                if partition is None:
+                    continue
+                os.makedirs(os.path.join(base_dir, partition), exist_ok=True)
+                try:
+                    os.replace(file_path, os.path.join(base_dir, partition, os.path.basename(file_path)))
+                except OSError as e:
+                    print(f"移动任务实例文件失败 ({file_path}): {str(e)}")
     
     def clear_main_log_files(self, days=None):
         """清理主日志文件alist_sync.log的历史备份
         每天轮换的日志文件格式为 alist_sync.log.YYYY-MM-DD
+        
+        返回:
+            {"removed": 删除的文件数, "bytes": 释放的字节数}
         """
         if days is None:
             settings = self.get_settings()
@@ -590,6 +1056,7 @@ class DataManager:
         # 获取所有日志文件
         log_files = glob.glob(os.path.join(self.log_dir, "alist_sync.log.*"))
         
+        removed, reclaimed = 0, 0
         # 遍历所有日志文件
         for log_file in log_files:
             try:
@@ -602,15 +1069,86 @@ class DataManager:
                 
                 # 如果日期早于保留期限，则删除
                 if file_date < cutoff_date:
+                    size = os.path.getsize(log_file)
                     os.remove(log_file)
+                    removed += 1
+                    reclaimed += size
                     logging.info(f"已删除过期日志文件: {file_name}")
             except Exception as e:
                 logging.error(f"处理日志文件 {log_file} 时出错: {str(e)}")
+        return {"removed": removed, "bytes": reclaimed}
+    
+    def run_log_cleanup(self, days=None):
+        """
+        执行全部日志清理并保存清理报告
+        
+        返回:
+            清理报告: 各项清理删除的数量、释放的字节数和耗时，以及总耗时
+        """
+        if days is None:
+            settings = self.get_settings()
+            days = settings.get("keep_log_days", 7)
+        
+        report = {"keep_log_days": days, "started_at": self.format_timestamp(int(time.time())), "steps": {}}
+        started = time.time()
+        steps = [
+            ("system_logs", lambda: self.clear_old_logs(days)),
+            ("task_instances", lambda: self.clear_old_task_instances(days)),
+            ("task_log_archive", self.archive_task_logs),
+            ("main_log_files", lambda: self.clear_main_log_files(days)),
+        ]
+        for name, step in steps:
+            step_started = time.time()
+            try:
+                result = step() or {}
+            except Exception as e:
+                logging.error(f"日志清理步骤 {name} 出错: {str(e)}")
+                result = {"error": str(e)}
+            result["elapsed"] = round(time.time() - step_started, 3)
+            report["steps"][name] = result
+        
+        report["bytes_reclaimed"] = sum(step.get("bytes", 0) + step.get("bytes_saved", 0)
+                                        for step in report["steps"].values())
+        report["elapsed"] = round(time.time() - started, 3)
+        self._write_json(self.cleanup_report_file, report)
+        return report
+    
+    def get_cleanup_report(self):
+        """获取最近一次日志清理报告，没有时返回None"""
+        if not os.path.exists(self.cleanup_report_file):
+            return None
+        return self._read_json(self.cleanup_report_file)
     
     # 任务日志管理
     def _get_task_log_file_path(self, task_id, instance_id):
-        """获取任务日志文件路径"""
-        return os.path.join(self.task_logs_dir, f"task_{task_id}_instance_{instance_id}.log")
+        """获取任务日志文件路径: task_logs/<实例开始日期>/task_<任务ID>_instance_<实例ID>.log"""
+        return self._get_task_instance_file_path(self.task_logs_dir, f"task_{task_id}_instance_{instance_id}.log",
+                                                 instance_id)
+    
+    def _get_task_instance_file_path(self, base_dir, file_name, instance_id):
+        """实例文件放在实例开始日期的分区目录下，找不到实例时放在 base_dir 下"""
+        partition = self._instance_partition(instance_id)
+        if partition is None:
+            return os.path.join(base_dir, file_name)
+        partition_dir = os.path.join(base_dir, partition)
+        if partition_dir not in self._partition_dirs:
+            os.makedirs(partition_dir, exist_ok=True)
+            self._partition_dirs.add(partition_dir)
+        return os.path.join(partition_dir, file_name)
+    
+    def _get_task_log_archive_path(self, task_id, instance_id):
+        """获取压缩后的任务日志文件路径"""
+        return self._get_task_log_file_path(task_id, instance_id) + ".gz"
+    
+    def _get_task_plan_file_path(self, task_id, instance_id):
+        """获取任务实例的同步计划文件路径: task_plans/<实例开始日期>/task_<任务ID>_instance_<实例ID>.jsonl"""
+        return self._get_task_instance_file_path(self.task_plans_dir, f"task_{task_id}_instance_{instance_id}.jsonl",
+                                                 instance_id)
+    
+    def _get_task_checkpoint_file_path(self, task_id, instance_id):
+        """获取任务实例的同步断点文件路径: checkpoints/<实例开始日期>/task_<任务ID>_instance_<实例ID>.json"""
+        return self._get_task_instance_file_path(self.task_checkpoints_dir,
+                                                 f"task_{task_id}_instance_{instance_id}.json", instance_id)
     
     def _create_task_log_file(self, task_id, instance_id, initial_message=None):
         """创建任务日志文件"""
@@ -624,27 +1162,261 @@ class DataManager:
                 f.write(f"[{timestamp}] {initial_message}\n")
     
     def _append_task_log(self, task_id, instance_id, message):
-        """向任务日志文件追加内容"""
+        """向任务日志文件追加内容，实例运行中时交给缓冲写入器"""
         log_file = self._get_task_log_file_path(task_id, instance_id)
+        timestamp = self.format_timestamp(int(time.time()))
         
-        with open(log_file, 'a', encoding='utf-8') as f:
-            timestamp = self.format_timestamp(int(time.time()))
-            f.write(f"[{timestamp}] {message}\n")
+        writer = self._task_log_writers.get(log_file)
+        if writer and writer.write(f"[{timestamp}] {message}"):
+            return
+        
+        with self._task_log_archive_lock:
+            # 日志已压缩时追加为新的 gzip 成员，读取时与原内容连续
+            archive_file = log_file + ".gz"
+            if not os.path.exists(log_file) and os.path.exists(archive_file):
+                with gzip.open(archive_file, 'at', encoding='utf-8') as f:
+                    f.write(f"[{timestamp}] {message}\n")
+                return
+            
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(f"[{timestamp}] {message}\n")
+    
+    def open_task_log_writer(self, task_id, instance_id, **options):
+        """
+        为运行中的任务实例打开缓冲日志写入器，之后的 _append_task_log 由后台线程批量写入
+        
+        参数:
+            options: TaskLogWriter 的参数（队列大小、批量行数、写入间隔、溢出处理方式）
+        """
+        log_file = self._get_task_log_file_path(task_id, instance_id)
+        with self._task_log_writers_lock:
+            writer = self._task_log_writers.get(log_file)
+            if writer is None:
+                writer = self._task_log_writers[log_file] = TaskLogWriter(log_file, **options)
+            return writer
+    
+    def flush_task_log(self, task_id, instance_id, timeout=None):
+        """等待任务实例已提交的日志写入文件"""
+        writer = self._task_log_writers.get(self._get_task_log_file_path(task_id, instance_id))
+        return writer.flush(timeout) if writer else True
+    
+    def close_task_log_writer(self, task_id, instance_id, archive=False):
+        """写入剩余日志并关闭任务实例的缓冲日志写入器，archive 为 True 时随后在后台压缩日志"""
+        log_file = self._get_task_log_file_path(task_id, instance_id)
+        with self._task_log_writers_lock:
+            writer = self._task_log_writers.pop(log_file, None)
+        if writer:
+            writer.close()
+        if archive:
+            self.schedule_task_log_archive(task_id, instance_id)
+    
+    def schedule_task_log_archive(self, task_id, instance_id):
+        """在后台线程中压缩任务日志"""
+        with self._task_log_writers_lock:
+            if self._task_log_archiver is None:
+                self._task_log_archiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-log-archive")
+        return self._task_log_archiver.submit(self.archive_task_log, task_id, instance_id)
+    
+    def archive_task_log(self, task_id, instance_id):
+        """
+        将任务日志压缩为 .log.gz 并删除原文件，实例仍有打开的写入器时跳过
+        
+        返回:
+            节省的字节数，未压缩时返回 None
+        """
+        log_file = self._get_task_log_file_path(task_id, instance_id)
+        archive_file = log_file + ".gz"
+        if log_file in self._task_log_writers:
+            return None
+        
+        with self._task_log_archive_lock:
+            if not os.path.exists(log_file):
+                return None
+            try:
+                original_size = os.path.getsize(log_file)
+                temp_file = archive_file + ".tmp"
+                with open(log_file, 'rb') as src:
+                    if os.path.exists(archive_file):
+                        # 已有压缩日志（压缩后又追加过日志）时先复制原有内容
+                        with open(archive_file, 'rb') as old, open(temp_file, 'wb') as dst:
+                            shutil.copyfileobj(old, dst)
+                    with gzip.open(temp_file, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                os.replace(temp_file, archive_file)
+                os.remove(log_file)
+                return original_size - os.path.getsize(archive_file)
+            except Exception as e:
+                logging.error(f"压缩任务日志失败 ({log_file}): {str(e)}")
+                return None
+    
+    def archive_task_logs(self):
+        """压缩所有已结束实例的未压缩日志，返回压缩的文件数和节省的字节数"""
+        archived, saved = 0, 0
+        for log_file in glob.glob(os.path.join(self.task_logs_dir, "*", "task_*_instance_*.log")):
+            try:
+                task_part, instance_part = os.path.basename(log_file)[len("task_"):-len(".log")].split("_instance_")
+                task_id, instance_id = int(task_part), int(instance_part)
+            except ValueError:
+                continue
+            instance = self.get_task_instance(instance_id)
+            if instance and instance.get("status") in ACTIVE_INSTANCE_STATUSES:
+                continue
+            result = self.archive_task_log(task_id, instance_id)
+            if result is not None:
+                archived += 1
+                saved += result
+        return {"archived": archived, "bytes_saved": saved}
     
     def get_task_log(self, task_id, instance_id):
         """获取任务日志内容"""
         log_file = self._get_task_log_file_path(task_id, instance_id)
         
-        if not os.path.exists(log_file):
-            return []
+        # 运行中的实例先写入缓冲的日志
+        self.flush_task_log(task_id, instance_id, timeout=5)
         
-        with open(log_file, 'r', encoding='utf-8') as f:
-            log_content = f.read()
+        if os.path.exists(log_file):
+            with open(log_file, 'r', encoding='utf-8') as f:
+                log_content = f.read()
+        elif os.path.exists(log_file + ".gz"):
+            with gzip.open(log_file + ".gz", 'rt', encoding='utf-8', errors='replace') as f:
+                log_content = f.read()
+        else:
+            return []
             
         # 将日志文本转换为列表
         log_lines = log_content.split('\n')
         return [line for line in log_lines if line.strip()]
     
+    def read_task_log(self, task_id, instance_id, offset=None, limit=DEFAULT_TASK_LOG_LINES, tail=None):
+        """
+        按字节偏移分页读取任务日志，只读取需要的部分
+        
+        参数:
+            offset: 起始字节偏移，通常取上一次返回的 next_offset；不在行首时从下一行开始
+            limit: 最多返回的行数
+            tail: 返回最后 tail 行，指定时忽略 offset
+        
+        返回:
+            {"lines": 日志行, "offset": 第一行的字节偏移, "next_offset": 下一次读取的偏移, "size": 文件大小}
+            只返回以换行结尾的完整行，正在写入的最后一行留到下一次读取
+        """
+        log_file = self._get_task_log_file_path(task_id, instance_id)
+        limit = max(1, min(limit or DEFAULT_TASK_LOG_LINES, MAX_TASK_LOG_LINES))
+        
+        # 运行中的实例先写入缓冲的日志
+        self.flush_task_log(task_id, instance_id, timeout=5)
+        
+        if not os.path.exists(log_file) and os.path.exists(log_file + ".gz"):
+            return self._read_archived_task_log(log_file + ".gz", offset, limit, tail)
+        
+        try:
+            with open(log_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if tail is not None:
+                    start = self._find_tail_offset(f, size, max(1, min(tail, MAX_TASK_LOG_LINES)))
+                else:
+                    start = self._align_line_offset(f, min(max(offset or 0, 0), size))
+                    
+                f.seek(start)
+                lines = []
+                next_offset = start
+                while len(lines) < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    next_offset += len(line)
+                    line = line.rstrip(b"\r\n").decode('utf-8', errors='replace')
+                    if line.strip():
+                        lines.append(line)
+        except OSError:
+            return {"lines": [], "offset": 0, "next_offset": 0, "size": 0}
+        
+        return {"lines": lines, "offset": start, "next_offset": next_offset, "size": size}
+    
+    @staticmethod
+    def _read_archived_task_log(archive_file, offset, limit, tail):
+        """
+        流式解压读取压缩日志，偏移为解压后的字节偏移
+        
+        tail 时需要解压整个文件；按 offset 读取时只解压到所需位置，文件大小未知时 size 为 None
+        """
+        lines = []
+        try:
+            with gzip.open(archive_file, 'rb') as f:
+                if tail is not None:
+                    last = deque(maxlen=max(1, min(tail, MAX_TASK_LOG_LINES)))
+                    position = 0
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        if line.strip():
+                            last.append((position, line))
+                        position += len(line)
+                    start = last[0][0] if last else position
+                    lines = [line.rstrip(b"\r\n").decode('utf-8', errors='replace') for _, line in last]
+                    return {"lines": lines, "offset": start, "next_offset": position, "size": position}
+                
+                start = max(offset or 0, 0)
+                if start > 0:
+                    f.seek(start - 1)
+                    if f.read(1) != b"\n":
+                        start += len(f.readline())
+                next_offset = start
+                size = None
+                while len(lines) < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        size = next_offset + len(line)
+                        break
+                    next_offset += len(line)
+                    line = line.rstrip(b"\r\n").decode('utf-8', errors='replace')
+                    if line.strip():
+                        lines.append(line)
+        except (OSError, EOFError, ValueError):
+            return {"lines": [], "offset": 0, "next_offset": 0, "size": 0}
+        
+        return {"lines": lines, "offset": start, "next_offset": next_offset, "size": size}
+    
+    @staticmethod
+    def _align_line_offset(f, offset):
+        """偏移不在行首时移动到下一行的开头"""
+        if offset <= 0:
+            return 0
+        f.seek(offset - 1)
+        if f.read(1) == b"\n":
+            return offset
+        f.readline()
+        return f.tell()
+    
+    @staticmethod
+    def _find_tail_offset(f, size, count, block_size=65536):
+        """从文件末尾向前按块查找，返回最后 count 个完整行的起始偏移"""
+        end = size
+        # 末尾未以换行结束的部分不计入行数
+        f.seek(max(0, size - 1))
+        if size and f.read(1) != b"\n":
+            count += 1
+        newlines = 0
+        position = end
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size)
+            # 最后一个换行是最后一行的结尾，不作为分隔
+            if position + read_size == end and block.endswith(b"\n"):
+                block = block[:-1]
+            index = len(block)
+            while True:
+                index = block.rfind(b"\n", 0, index)
+                if index < 0:
+                    break
+                newlines += 1
+                if newlines == count:
+                    return position + index + 1
+        return 0
+    
     # 导入导出功能
     def export_data(self):
         """导出所有数据为一个字典"""
@@ -739,19 +1511,17 @@ class DataManager:
                 backup_dir = os.path.join(self.data_dir, f"backup_{timestamp}")
                 os.makedirs(backup_dir, exist_ok=True)
                 
-                # 备份文件
+                # 备份文件，通过 _read_json 读取以兼容不同的存储后端
                 for file_name, json_file in [
                     ("users", self.users_file),
                     ("connections", self.connections_file),
                     ("tasks", self.tasks_file),
                     ("settings", self.settings_file)
                 ]:
-                    if os.path.exists(json_file):
-                        backup_file = os.path.join(backup_dir, os.path.basename(json_file))
-                        with open(json_file, 'r', encoding='utf-8') as src, \
-                             open(backup_file, 'w', encoding='utf-8') as dst:
-                            dst.write(src.read())
-                        backup_files[file_name] = backup_file
+                    backup_file = os.path.join(backup_dir, os.path.basename(json_file))
+                    with open(backup_file, 'w', encoding='utf-8') as dst:
+                        json.dump(self._read_json(json_file), ensure_ascii=False, indent=2, fp=dst)
+                    backup_files[file_name] = backup_file
                 
                 result["details"]["backup_dir"] = backup_dir
                 result["details"]["backup_files"] = backup_files
@@ -792,9 +1562,8 @@ class DataManager:
                 try:
                     for data_type, backup_file in backup_files.items():
                         dest_file = getattr(self, f"{data_type}_file")
-                        with open(backup_file, 'r', encoding='utf-8') as src, \
-                             open(dest_file, 'w', encoding='utf-8') as dst:
-                            dst.write(src.read())
+                        with open(backup_file, 'r', encoding='utf-8') as src:
+                            self._write_json(dest_file, json.load(src))
                     result["details"]["recovery"] = "已从备份恢复"
                 except Exception as recovery_error:
                     result["details"]["recovery_error"] = str(recovery_error)
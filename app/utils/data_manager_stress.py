@@ -0,0 +1,107 @@
+"""
+DataManager 并发写入压力测试: python -m app.utils.data_manager_stress [进程数] [每进程线程数] [每线程次数]
+
+多个进程、每个进程多个线程同时对同一个 data 目录执行:
+    - add_task_instance: 检查分配的实例ID互不重复且总数正确
+    - transaction("tasks") 中对同一任务的计数器加一: 检查没有丢失更新
+JSON 和 SQLite 两种存储后端各运行一次，任一检查失败时以非零状态退出。
+"""
+import multiprocessing
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from app.utils.data_manager import STORAGE_BACKENDS, create_data_manager
+
+DEFAULT_PROCESSES = 4
+DEFAULT_THREADS = 5
+DEFAULT_UPDATES = 25
+# 等待单个工作进程结果的最长时间（秒），超时视为失败
+WORKER_TIMEOUT = 300
+
+
+def _worker(data_dir, backend, task_id, threads, updates, results):
+    """工作进程: 多个线程并发添加任务实例并递增任务计数器，把分配到的实例ID放入 results"""
+    data_manager = create_data_manager(data_dir, backend)
+    instance_ids = []
+    ids_lock = threading.Lock()
+
+    def run():
+        for _ in range(updates):
+            instance = data_manager.add_task_instance(task_id, {"stress": True}, status="queued")
+            with ids_lock:
+                instance_ids.append(instance["task_instances_id"])
+            with data_manager.transaction("tasks") as tasks:
+                for task in tasks:
+                    if task["id"] == task_id:
+                        task["stress_counter"] = task.get("stress_counter", 0) + 1
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put(instance_ids)
+
+
+def run_stress(backend, processes=DEFAULT_PROCESSES, threads=DEFAULT_THREADS, updates=DEFAULT_UPDATES):
+    """
+    对指定存储后端运行一次压力测试
+
+    返回:
+        (是否通过, 说明)
+    """
+    expected = processes * threads * updates
+    with tempfile.TemporaryDirectory() as data_dir:
+        task_id = create_data_manager(data_dir, backend).add_task({"name": "stress", "connection_id": 1})
+        # spawn 启动的子进程不继承父进程的线程和锁，与实际部署中多个 worker 进程的情况一致
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        started = time.perf_counter()
+        workers = [context.Process(target=_worker, args=(data_dir, backend, task_id, threads, updates, results))
+                   for _ in range(processes)]
+        for process in workers:
+            process.start()
+        instance_ids = []
+        for _ in workers:
+            try:
+                instance_ids.extend(results.get(timeout=WORKER_TIMEOUT))
+            except queue.Empty:
+                break
+        for process in workers:
+            process.join(WORKER_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+        elapsed = time.perf_counter() - started
+
+        data_manager = create_data_manager(data_dir, backend)
+        counter = data_manager.get_task(task_id).get("stress_counter", 0)
+        stored = data_manager.get_task_instances(task_id, limit=expected + 1)
+        errors = []
+        if any(process.exitcode != 0 for process in workers):
+            errors.append(f"工作进程异常退出: {[process.exitcode for process in workers]}")
+        if len(instance_ids) != expected or len(set(instance_ids)) != expected:
+            errors.append(f"实例ID重复或缺失: 分配 {len(instance_ids)} 个，不重复 {len(set(instance_ids))} 个")
+        if len(stored) != expected:
+            errors.append(f"保存的实例数 {len(stored)} 个")
+        if counter != expected:
+            errors.append(f"计数器为 {counter}，丢失 {expected - counter} 次更新")
+        summary = (f"{backend}: {processes} 进程 x {threads} 线程 x {updates} 次 = {expected} 次更新，"
+                   f"耗时 {elapsed:.1f} 秒")
+        return not errors, summary + ("" if not errors else "\n    " + "\n    ".join(errors))
+
+
+def main(argv):
+    counts = [int(value) for value in argv[:3]]
+    passed = True
+    for backend in STORAGE_BACKENDS:
+        ok, message = run_stress(backend, *counts)
+        print(f"[{'通过' if ok else '失败'}] {message}")
+        passed = passed and ok
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
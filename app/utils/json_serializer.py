@@ -0,0 +1,132 @@
+import os
+import json
+import logging
+
+# 可选的快速 JSON 库，未安装时使用标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# 支持的序列化实现（环境变量 JSON_SERIALIZER，默认 auto），auto 时按此顺序选择第一个已安装的
+JSON_BACKENDS = ("orjson", "ujson", "json")
+# 写入后的 fsync 策略（环境变量 JSON_FSYNC，默认 none）: none 不调用，file 同步文件内容，
+# full 同时同步所在目录（保证替换后的文件名落盘）
+FSYNC_POLICIES = ("none", "file", "full")
+
+
+def _available(backend):
+    return {"orjson": orjson, "ujson": ujson, "json": json}.get(backend) is not None
+
+
+class JsonSerializer:
+    """
+    JSON 序列化与原子写入
+
+    机器读写的文件使用紧凑格式，需要人工查看或编辑的配置文件使用缩进格式。
+    安装了 orjson 或 ujson 时自动使用，也可以通过环境变量 JSON_SERIALIZER 指定；
+    fsync 策略由环境变量 JSON_FSYNC 指定，默认 none。
+    """
+
+    def __init__(self, backend=None, fsync=None):
+        backend = (backend or os.environ.get("JSON_SERIALIZER") or "auto").lower()
+        if backend == "auto":
+            backend = next(name for name in JSON_BACKENDS if _available(name))
+        elif backend not in JSON_BACKENDS or not _available(backend):
+            logging.warning(f"JSON序列化实现不可用: {backend}，将使用标准库 json")
+            backend = "json"
+        fsync = (fsync or os.environ.get("JSON_FSYNC") or "none").lower()
+        if fsync not in FSYNC_POLICIES:
+            logging.warning(f"未知的 fsync 策略: {fsync}，将使用默认值: none")
+            fsync = "none"
+        self.backend = backend
+        self.fsync = fsync
+
+    def dumps(self, data, pretty=False):
+        """序列化为 UTF-8 字节，pretty 时缩进两个空格"""
+        if self.backend == "orjson":
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+            return orjson.dumps(data, option=option)
+        if self.backend == "ujson":
+            return ujson.dumps(data, ensure_ascii=False, indent=2 if pretty else 0,
+                               escape_forward_slashes=False).encode("utf-8")
+        if pretty:
+            return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, content):
+        """反序列化字符串或字节，格式错误时抛出 ValueError"""
+        if self.backend == "orjson":
+            return orjson.loads(content)
+        if self.backend == "ujson":
+            return ujson.loads(content)
+        return json.loads(content)
+
+    def write_file(self, file_path, data, pretty=False):
+        """先写入临时文件，按 fsync 策略同步后原子替换目标文件"""
+        directory = os.path.dirname(file_path)
+        os.makedirs(directory or ".", exist_ok=True)
+        temp_file = file_path + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(self.dumps(data, pretty))
+            if self.fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file, file_path)
+        if self.fsync == "full" and hasattr(os, "O_DIRECTORY"):
+            fd = os.open(directory or ".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def _benchmark():
+    """对比各序列化实现、格式和 fsync 策略在 1 万、10 万条记录上的写入耗时和文件大小"""
+    import tempfile
+    import time
+
+    def make_records(count):
+        return [{
+            "task_instances_id": i,
+            "task_id": i % 50 + 1,
+            "task_name": f"同步任务 {i % 50 + 1}",
+            "start_time": 1700000000 + i * 60,
+            "start_time_formatted": "2023-11-15 06:13:20",
+            "end_time": 1700000000 + i * 60 + 42,
+            "end_time_formatted": "2023-11-15 06:14:02",
+            "status": "completed",
+            "params": {"sync_type": "file_sync", "source_path": "/源目录/电影", "target_path": "/目标目录/电影"},
+            "result": {"status": "success", "message": "同步任务执行成功"}
+        } for i in range(count)]
+
+    backends = [name for name in JSON_BACKENDS if _available(name)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for count in (10000, 100000):
+            records = make_records(count)
+            print(f"\n{count} 条记录")
+            print(f"{'实现':<8}{'格式':<8}{'fsync':<8}{'写入(ms)':>10}{'读取(ms)':>10}{'大小(KB)':>10}")
+            for backend in backends:
+                for pretty in (True, False):
+                    for fsync in FSYNC_POLICIES:
+                        serializer = JsonSerializer(backend, fsync)
+                        file_path = os.path.join(temp_dir, f"{backend}.json")
+                        started = time.perf_counter()
+                        serializer.write_file(file_path, records, pretty)
+                        write_ms = (time.perf_counter() - started) * 1000
+                        started = time.perf_counter()
+                        with open(file_path, "rb") as f:
+                            serializer.loads(f.read())
+                        read_ms = (time.perf_counter() - started) * 1000
+                        size_kb = os.path.getsize(file_path) / 1024
+                        print(f"{backend:<8}{'pretty' if pretty else 'compact':<8}{fsync:<8}"
+                              f"{write_ms:>10.1f}{read_ms:>10.1f}{size_kb:>10.0f}")
+
+
+if __name__ == "__main__":
+    _benchmark()
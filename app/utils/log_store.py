@@ -0,0 +1,277 @@
+import os
+import time
+
+from app.utils.file_lock import FileLock
+from app.utils.json_serializer import JsonSerializer
+
+# 单个日志分段的最大字节数，超过后切换到新分段
+DEFAULT_SEGMENT_MAX_BYTES = 1024 * 1024
+# 单个日志分段覆盖的最长时间（秒），按天切换便于按天清理
+DEFAULT_SEGMENT_MAX_AGE = 86400
+# 最多保留的分段数，超过后删除最早的分段
+DEFAULT_MAX_SEGMENTS = 100
+
+
+class LogStore:
+    """
+    只追加的系统日志存储
+
+    日志按 JSON Lines 写入分段文件 segment_<序号>.jsonl，当前分段写满或跨天后切换到新分段。
+    index.json 记录已关闭分段的时间范围、ID范围和包含的任务ID，当前分段的统计只保存在内存中，
+    启动时扫描未登记的分段重建。
+
+    所有操作在 .lock 文件锁内执行，多个进程可以共享同一个目录: 发现当前分段被其他进程追加
+    或切换后重新加载分段信息。
+
+    - 追加: 只写当前分段的一行，O(1)
+    - 查询: 从最新分段向前读取，按索引跳过时间范围或任务ID不匹配的分段
+    - 清理: 删除整个过期分段，不改写任何文件
+    """
+
+    def __init__(self, store_dir, segment_max_bytes=DEFAULT_SEGMENT_MAX_BYTES,
+                 segment_max_age=DEFAULT_SEGMENT_MAX_AGE, max_segments=DEFAULT_MAX_SEGMENTS):
+        self.store_dir = store_dir
+        self.index_file = os.path.join(store_dir, "index.json")
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.max_segments = max_segments
+        self._lock = FileLock(os.path.join(store_dir, ".lock"))
+        self._serializer = JsonSerializer()
+        os.makedirs(store_dir, exist_ok=True)
+        with self._lock:
+            self._load()
+
+    # 分段与索引
+    def _segment_path(self, seq):
+        return os.path.join(self.store_dir, f"segment_{seq:08d}.jsonl")
+
+    @staticmethod
+    def _new_stats(seq):
+        return {"seq": seq, "first_ts": None, "last_ts": None, "first_id": None, "last_id": None,
+                "count": 0, "bytes": 0, "task_ids": []}
+
+    @staticmethod
+    def _update_stats(stats, log, size):
+        timestamp = log.get("timestamp", 0)
+        if stats["first_ts"] is None:
+            stats["first_ts"] = timestamp
+            stats["first_id"] = log.get("id")
+        stats["last_ts"] = max(stats["last_ts"] or 0, timestamp)
+        stats["last_id"] = log.get("id")
+        stats["count"] += 1
+        stats["bytes"] += size
+        task_id = log.get("task_id")
+        if task_id is not None and task_id not in stats["task_ids"]:
+            stats["task_ids"].append(task_id)
+
+    def _scan_segment(self, seq):
+        """扫描分段文件生成统计，跳过无法解析的行"""
+        stats = self._new_stats(seq)
+        for log, size in self._iter_segment_lines(seq):
+            self._update_stats(stats, log, size)
+        # 包含无法解析的行，与文件大小一致
+        try:
+            stats["bytes"] = os.path.getsize(self._segment_path(seq))
+        except OSError:
+            pass
+        return stats
+
+    def _iter_segment_lines(self, seq):
+        try:
+            with open(self._segment_path(seq), "rb") as f:
+                for line in f:
+                    try:
+                        yield self._serializer.loads(line), len(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+
+    def _load(self):
+        """读取索引，未登记的分段（当前分段或异常退出时未登记的分段）重新扫描"""
+        try:
+            with open(self.index_file, "rb") as f:
+                index = self._serializer.loads(f.read())
+            indexed = {item["seq"]: item for item in index.get("segments", [])}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            index, indexed = {}, {}
+        seqs = []
+        for name in os.listdir(self.store_dir):
+            if name.startswith("segment_") and name.endswith(".jsonl"):
+                try:
+                    seqs.append(int(name[len("segment_"):-len(".jsonl")]))
+                except ValueError:
+                    continue
+        seqs.sort()
+        self._segments = [indexed.get(seq) or self._scan_segment(seq) for seq in seqs]
+        if not self._segments:
+            self._segments = [self._new_stats(index.get("active_seq") or 1)]
+        self._active = self._segments[-1]
+        # 清空后ID继续递增
+        self._next_id = max([item["last_id"] or 0 for item in self._segments] + [index.get("next_id", 1) - 1]) + 1
+        self._file = None
+
+    def _refresh(self):
+        """其他进程追加或切换了分段时重新加载"""
+        try:
+            size = os.path.getsize(self._segment_path(self._active["seq"]))
+        except OSError:
+            size = 0
+        if size != self._active["bytes"] or os.path.exists(self._segment_path(self._active["seq"] + 1)):
+            self._close_file()
+            self._load()
+
+    def _write_index(self):
+        """写入已关闭分段的索引"""
+        data = {"segments": self._segments[:-1], "active_seq": self._active["seq"], "next_id": self._next_id}
+        self._serializer.write_file(self.index_file, data)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate_if_needed(self, timestamp):
+        active = self._active
+        if active["count"] and (active["bytes"] >= self.segment_max_bytes
+                                or timestamp - active["first_ts"] >= self.segment_max_age):
+            self._rotate()
+
+    def _rotate(self):
+        """关闭当前分段并登记到索引，之后的日志写入新分段"""
+        self._close_file()
+        self._active = self._new_stats(self._active["seq"] + 1)
+        self._segments.append(self._active)
+        self._drop_segments(self._segments[:-self.max_segments] if len(self._segments) > self.max_segments else [])
+        self._write_index()
+        self._open_active()
+
+    def _open_active(self):
+        """立即创建当前分段文件，其他进程据此发现分段已切换"""
+        if self._file is None:
+            self._file = open(self._segment_path(self._active["seq"]), "ab")
+
+    def _drop_segments(self, segments):
+        for stats in segments:
+            try:
+                os.remove(self._segment_path(stats["seq"]))
+            except OSError:
+                pass
+            self._segments.remove(stats)
+
+    # 写入
+    def append(self, log):
+        """追加一条日志，分配递增ID，返回该日志"""
+        with self._lock:
+            self._refresh()
+            log.setdefault("timestamp", int(time.time()))
+            self._rotate_if_needed(log["timestamp"])
+            log["id"] = self._next_id
+            self._next_id += 1
+            line = self._serializer.dumps(log) + b"\n"
+            self._open_active()
+            self._file.write(line)
+            self._file.flush()
+            self._update_stats(self._active, log, len(line))
+            return log
+
+    # 查询
+    def _read_segment_reversed(self, seq):
+        """按从新到旧的顺序读取分段中的日志"""
+        logs = [log for log, _ in self._iter_segment_lines(seq)]
+        logs.reverse()
+        return logs
+
+    def query(self, limit=100, task_id=None, since=None, until=None):
+        """
+        从新到旧查询日志
+
+        参数:
+            limit: 最多返回的条数，None 表示不限制
+            task_id: 只返回该任务的日志
+            since/until: 时间戳范围（包含两端）
+        """
+        with self._lock:
+            self._refresh()
+            segments = [dict(item) for item in self._segments]
+        results = []
+        for stats in reversed(segments):
+            if not stats["count"]:
+                continue
+            if since is not None and stats["last_ts"] < since:
+                break
+            if until is not None and stats["first_ts"] > until:
+                continue
+            if task_id is not None and task_id not in stats["task_ids"]:
+                continue
+            for log in self._read_segment_reversed(stats["seq"]):
+                timestamp = log.get("timestamp", 0)
+                if until is not None and timestamp > until:
+                    continue
+                if since is not None and timestamp < since:
+                    continue
+                if task_id is not None and log.get("task_id") != task_id:
+                    continue
+                results.append(log)
+                if limit is not None and len(results) >= limit:
+                    return results
+        return results
+
+    def get(self, log_id):
+        """按ID获取单条日志"""
+        with self._lock:
+            self._refresh()
+            segments = [dict(item) for item in self._segments]
+        for stats in reversed(segments):
+            if stats["count"] and stats["first_id"] is not None and stats["first_id"] <= log_id <= stats["last_id"]:
+                for log, _ in self._iter_segment_lines(stats["seq"]):
+                    if log.get("id") == log_id:
+                        return log
+        return None
+
+    # 清理
+    def delete_before(self, cutoff_time):
+        """删除最新日志早于截止时间的分段，返回 {"removed": 删除的日志条数, "bytes": 释放的字节数}"""
+        with self._lock:
+            self._refresh()
+            if self._active["count"] and self._active["last_ts"] <= cutoff_time:
+                self._rotate()
+            expired = [item for item in self._segments[:-1] if item["last_ts"] is not None
+                       and item["last_ts"] <= cutoff_time]
+            removed = sum(item["count"] for item in expired)
+            reclaimed = sum(item["bytes"] for item in expired)
+            if expired:
+                self._drop_segments(expired)
+                self._write_index()
+            return {"removed": removed, "bytes": reclaimed}
+
+    def clear(self):
+        """删除全部日志，ID继续递增"""
+        with self._lock:
+            self._refresh()
+            self._close_file()
+            self._drop_segments(list(self._segments))
+            self._active = self._new_stats(self._active["seq"] + 1)
+            self._segments = [self._active]
+            self._write_index()
+            self._open_active()
+
+    def rebuild_index(self):
+        """重新扫描全部分段重建索引，返回日志总数"""
+        with self._lock:
+            self._close_file()
+            next_id = self._next_id
+            try:
+                os.remove(self.index_file)
+            except OSError:
+                pass
+            self._load()
+            self._next_id = max(self._next_id, next_id)
+            self._write_index()
+            return sum(item["count"] for item in self._segments)
+
+    def count(self):
+        """日志总数"""
+        with self._lock:
+            self._refresh()
+            return sum(item["count"] for item in self._segments)
@@ -0,0 +1,553 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+from app.utils.data_manager import DataManager, MAX_LOG_ENTRIES, ACTIVE_INSTANCE_STATUSES, FINISHED_INSTANCE_STATUSES
+from app.utils.log_store import LogStore
+
+# 数据库结构版本
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS connections (
+    connection_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS task_instances (
+    task_instances_id INTEGER PRIMARY KEY,
+    task_id INTEGER,
+    start_time INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_task_instances_task ON task_instances (task_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_task_instances_start ON task_instances (start_time);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL DEFAULT 0,
+    task_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+CREATE INDEX IF NOT EXISTS idx_logs_task ON logs (task_id, timestamp);
+"""
+
+
+class SQLiteDataManager(DataManager):
+    """
+    SQLite 存储后端的数据管理器
+
+    任务、连接、任务实例和系统日志各存一张表并按主键/常用查询建立索引，用户和设置作为文档保存。
+    数据库使用 WAL 模式，每个线程一个连接，写操作在事务中完成。
+    首次打开数据库时自动从现有的JSON文件迁移数据，JSON文件保留不动。
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, data_dir=None):
+        self._local = threading.local()
+        super().__init__(data_dir)
+
+    def _init_storage(self):
+        """创建数据库表并执行一次性迁移"""
+        self.db_file = os.path.join(self.config_dir, "alist_sync.db")
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._set_meta("schema_version", SCHEMA_VERSION)
+        if self._get_meta("json_migrated_at") is None:
+            self.migrate_from_json()
+        self._migrate_task_instance_files()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """写事务，BEGIN IMMEDIATE 保证读-改-写期间不被其他连接修改"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _get_meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._connect().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _next_id(self, conn, table, column):
+        """
+        在写事务中分配表的下一个ID
+
+        已分配的最大ID记录在 meta 表中，删除记录（如清理旧任务实例）后ID也不会被重复使用。
+        """
+        key = f"next_{table}_id"
+        max_id = conn.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}").fetchone()[0]
+        next_id = max(int(self._get_meta(key) or 1), max_id + 1)
+        self._set_meta(key, next_id + 1)
+        return next_id
+
+    @staticmethod
+    def _dumps(data):
+        return json.dumps(data, ensure_ascii=False)
+
+    # 迁移
+    def migrate_from_json(self):
+        """从JSON文件导入全部数据，覆盖数据库中的已有数据，返回各类数据的条数"""
+        collections = {}
+        for file_path in self._table_files():
+            if os.path.exists(file_path):
+                collections[file_path] = DataManager._read_json(self, file_path)
+        # 任务实例已拆分到日期分区时从分区中读取
+        if self.task_instances_file not in collections and os.path.isdir(self.task_instances_dir):
+            collections[self.task_instances_file] = self._load_all_task_instances()
+        # 系统日志已迁移到日志分段存储时从分段中读取
+        if self.logs_file not in collections and os.path.isdir(self.system_logs_dir):
+            collections[self.logs_file] = LogStore(self.system_logs_dir).query(limit=None)
+        counts = {}
+        with self._transaction() as conn:
+            for file_path, data in collections.items():
+                self._replace_collection(conn, file_path, data)
+                counts[os.path.basename(file_path)] = len(data) if isinstance(data, list) else 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         ("json_migrated_at", str(int(time.time()))))
+        logging.info(f"已从JSON文件迁移数据到SQLite: {counts}")
+        return counts
+
+    def _table_files(self):
+        return [self.users_file, self.settings_file, self.connections_file, self.tasks_file,
+                self.task_instances_file, self.logs_file]
+
+    # 按原JSON文件路径读写整个集合，导入导出等功能无需区分存储后端
+    def _read_cached(self, file_path):
+        """数据表直接查询数据库，不经过JSON文件缓存"""
+        if file_path in self._table_files():
+            return self._read_json(file_path)
+        return super()._read_cached(file_path)
+
+    def _read_json(self, file_path):
+        """读取文件路径对应的集合，非数据表文件仍按JSON文件读取"""
+        conn = self._connect()
+        if file_path == self.users_file:
+            return self._get_document("users", self._get_default_users)
+        if file_path == self.settings_file:
+            return self._get_document("settings", self._get_default_settings)
+        if file_path == self.connections_file:
+            rows = conn.execute("SELECT data FROM connections ORDER BY connection_id")
+        elif file_path == self.tasks_file:
+            rows = conn.execute("SELECT data FROM tasks ORDER BY id")
+        elif file_path == self.task_instances_file:
+            rows = conn.execute("SELECT data FROM task_instances ORDER BY task_instances_id")
+        elif file_path == self.logs_file:
+            rows = conn.execute("SELECT data FROM logs ORDER BY timestamp DESC, id DESC")
+        else:
+            return super()._read_json(file_path)
+        return [json.loads(row[0]) for row in rows]
+
+    def _write_json(self, file_path, data):
+        """替换文件路径对应的整个集合，非数据表文件仍写入JSON文件"""
+        if file_path not in self._table_files():
+            return super()._write_json(file_path, data)
+        try:
+            with self._transaction() as conn:
+                self._replace_collection(conn, file_path, data)
+        except Exception as e:
+            print(f"写入数据库时出错 ({os.path.basename(file_path)}): {str(e)}")
+
+    @contextmanager
+    def transaction(self, name):
+        """原子的读-改-写，在一个 BEGIN IMMEDIATE 事务内读取并替换整个集合，嵌套时共用外层事务"""
+        file_path = self._collection_file(name)
+        active = self._transaction_data()
+        if file_path in active:
+            yield active[file_path]
+            return
+        conn = self._connect()
+        nested = conn.in_transaction
+        if not nested:
+            conn.execute("BEGIN IMMEDIATE")
+        active[file_path] = data = self._read_json(file_path)
+        try:
+            yield data
+            self._replace_collection(conn, file_path, data)
+            if not nested:
+                conn.execute("COMMIT")
+        except BaseException:
+            if not nested:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            del active[file_path]
+
+    def _get_document(self, name, default_factory):
+        row = self._connect().execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        data = default_factory()
+        self._connect().execute("INSERT OR IGNORE INTO documents (name, data) VALUES (?, ?)", (name, self._dumps(data)))
+        return data
+
+    def _replace_collection(self, conn, file_path, data):
+        """在事务中替换整个集合"""
+        if file_path == self.users_file:
+            conn.execute("INSERT OR REPLACE INTO documents (name, data) VALUES ('users', ?)", (self._dumps(data),))
+        elif file_path == self.settings_file:
+            conn.execute("INSERT OR REPLACE INTO documents (name, data) VALUES ('settings', ?)", (self._dumps(data),))
+        elif file_path == self.connections_file:
+            conn.execute("DELETE FROM connections")
+            conn.executemany("INSERT OR REPLACE INTO connections (connection_id, data) VALUES (?, ?)",
+                             [(item.get("connection_id"), self._dumps(item)) for item in data or []])
+        elif file_path == self.tasks_file:
+            conn.execute("DELETE FROM tasks")
+            conn.executemany("INSERT OR REPLACE INTO tasks (id, data) VALUES (?, ?)",
+                             [(item.get("id"), self._dumps(item)) for item in data or []])
+        elif file_path == self.task_instances_file:
+            conn.execute("DELETE FROM task_instances")
+            conn.executemany(
+                "INSERT OR REPLACE INTO task_instances (task_instances_id, task_id, start_time, data) VALUES (?, ?, ?, ?)",
+                [(item.get("task_instances_id"), item.get("task_id"), item.get("start_time", 0), self._dumps(item))
+                 for item in data or []])
+        elif file_path == self.logs_file:
+            conn.execute("DELETE FROM logs")
+            # 按时间从旧到新写入，自增ID与时间顺序一致
+            logs = sorted(data or [], key=lambda x: x.get("timestamp", 0))
+            conn.executemany("INSERT INTO logs (timestamp, task_id, data) VALUES (?, ?, ?)",
+                             [(item.get("timestamp", 0), item.get("task_id"), self._dumps(item)) for item in logs])
+
+    # 连接管理
+    def get_connection(self, conn_id):
+        """获取单个连接"""
+        row = self._connect().execute("SELECT data FROM connections WHERE connection_id = ?", (conn_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_connection(self, connection_data):
+        """添加连接"""
+        with self._transaction() as conn:
+            next_id = self._next_id(conn, "connections", "connection_id")
+            connection_data["connection_id"] = next_id
+            connection_data["created_at"] = self.format_timestamp(int(time.time()))
+            connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+            conn.execute("INSERT INTO connections (connection_id, data) VALUES (?, ?)",
+                         (next_id, self._dumps(connection_data)))
+        return next_id
+
+    def update_connection(self, conn_id, connection_data):
+        """更新连接"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM connections WHERE connection_id = ?", (conn_id,)).fetchone()
+            if not row:
+                return False
+            connection_data["connection_id"] = conn_id
+            connection_data["created_at"] = json.loads(row[0]).get("created_at")
+            connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+            conn.execute("UPDATE connections SET data = ? WHERE connection_id = ?",
+                         (self._dumps(connection_data), conn_id))
+        return True
+
+    def delete_connection(self, conn_id):
+        """删除连接"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM connections WHERE connection_id = ?", (conn_id,))
+
+    # 任务管理
+    def get_task(self, task_id):
+        """获取单个任务"""
+        row = self._connect().execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_task(self, task_data):
+        """添加任务"""
+        with self._transaction() as conn:
+            next_id = self._next_id(conn, "tasks", "id")
+            task_data["id"] = next_id
+            task_data["created_at"] = self.format_timestamp(int(time.time()))
+            task_data["updated_at"] = self.format_timestamp(int(time.time()))
+            task_data["status"] = "pending"
+            task_data["last_run"] = ""
+            task_data["next_run"] = ""
+            conn.execute("INSERT INTO tasks (id, data) VALUES (?, ?)", (next_id, self._dumps(task_data)))
+        return next_id
+
+    def update_task(self, task_id, task_data):
+        """更新任务"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if not row:
+                return False
+            task = json.loads(row[0])
+            task_data["id"] = task_id
+            task_data["created_at"] = task.get("created_at")
+            task_data["updated_at"] = self.format_timestamp(int(time.time()))
+            # 保留其他状态字段
+            for field in ["status", "last_run", "next_run"]:
+                if field in task and field not in task_data:
+                    task_data[field] = task[field]
+            conn.execute("UPDATE tasks SET data = ? WHERE id = ?", (self._dumps(task_data), task_id))
+        return True
+
+    def delete_task(self, task_id):
+        """删除任务"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def update_task_status(self, task_id, status, last_run=None, next_run=None):
+        """更新任务状态"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if not row:
+                return False
+            task = json.loads(row[0])
+            task["status"] = status
+            if last_run:
+                task["last_run"] = self.format_timestamp(last_run)
+            if next_run:
+                task["next_run"] = self.format_timestamp(next_run)
+            conn.execute("UPDATE tasks SET data = ? WHERE id = ?", (self._dumps(task), task_id))
+        return True
+
+    # 日志管理
+    def get_logs(self, limit=100, task_id=None, since=None, until=None):
+        """获取最新日志，可以按任务ID和时间范围筛选"""
+        try:
+            conditions, params = [], []
+            if task_id is not None:
+                conditions.append("task_id = ?")
+                params.append(task_id)
+            if since is not None:
+                conditions.append("timestamp >= ?")
+                params.append(since)
+            if until is not None:
+                conditions.append("timestamp <= ?")
+                params.append(until)
+            where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+            rows = self._connect().execute(
+                f"SELECT id, data FROM logs {where}ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit if limit is not None else -1]).fetchall()
+            logs = [self._log_from_row(row) for row in rows]
+            task_names = {}
+            for log in logs:
+                if "timestamp" in log:
+                    log["timestamp_formatted"] = self.format_timestamp(log["timestamp"])
+                # 补充缺失的任务名称，同一任务只查询一次
+                if "task_id" in log and not log.get("task_name"):
+                    task_id = log["task_id"]
+                    if task_id not in task_names:
+                        task = self.get_task(task_id)
+                        task_names[task_id] = task.get("name", f"任务 {task_id}") if task else f"任务 {task_id}"
+                    log["task_name"] = task_names[task_id]
+            return logs
+        except Exception as e:
+            print(f"获取日志时出错: {str(e)}")
+            return []
+
+    @staticmethod
+    def _log_from_row(row):
+        log = json.loads(row[1])
+        log["id"] = row[0]
+        return log
+
+    def get_log(self, log_id):
+        """按ID获取单条日志"""
+        row = self._connect().execute("SELECT id, data FROM logs WHERE id = ?", (log_id,)).fetchone()
+        if not row:
+            return None
+        log = self._log_from_row(row)
+        if "timestamp" in log:
+            log["timestamp_formatted"] = self.format_timestamp(log["timestamp"])
+        return log
+
+    def add_log(self, log_data):
+        """添加日志，只保留最新的 MAX_LOG_ENTRIES 条"""
+        try:
+            timestamp = int(time.time())
+            log_data["timestamp"] = timestamp
+            log_data["timestamp_formatted"] = self.format_timestamp(timestamp)
+            if "task_id" in log_data and "task_name" not in log_data:
+                task = self.get_task(log_data["task_id"])
+                if task:
+                    log_data["task_name"] = task.get("name", "未知任务")
+            with self._transaction() as conn:
+                conn.execute("INSERT INTO logs (timestamp, task_id, data) VALUES (?, ?, ?)",
+                             (timestamp, log_data.get("task_id"), self._dumps(log_data)))
+                conn.execute("DELETE FROM logs WHERE id <= (SELECT id FROM logs ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                             (MAX_LOG_ENTRIES,))
+        except Exception as e:
+            print(f"添加日志失败: {str(e)}")
+
+    def clear_old_logs(self, days=None):
+        """清理旧日志，返回 {"removed": 删除的日志条数, "bytes": 日志数据的字节数}"""
+        if days is None:
+            settings = self.get_settings()
+            days = settings.get("keep_log_days", 7)
+        cutoff_time = int(time.time()) - (days * 86400)
+        with self._transaction() as conn:
+            removed, reclaimed = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM logs WHERE timestamp <= ?",
+                (cutoff_time,)).fetchone()
+            conn.execute("DELETE FROM logs WHERE timestamp <= ?", (cutoff_time,))
+        return {"removed": removed, "bytes": reclaimed}
+
+    def clear_logs(self):
+        """清空全部日志"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM logs")
+
+    def repair_logs(self):
+        """数据库无需重建日志索引，返回日志条数"""
+        return self._connect().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    # 任务实例管理
+    def get_task_instances(self, task_id=None, limit=50, before=None, after=None):
+        """获取任务实例列表，按开始时间从新到旧排列，可以按任务ID筛选和按游标分页"""
+        conditions, params = [], []
+        if task_id:
+            conditions.append("task_id = ?")
+            params.append(task_id)
+        if before is not None:
+            conditions.append("(start_time, task_instances_id) < (?, ?)")
+            params.extend(self.parse_instance_cursor(before))
+        if after is not None:
+            conditions.append("(start_time, task_instances_id) > (?, ?)")
+            params.extend(self.parse_instance_cursor(after))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        # after 取紧接游标的 limit 条，再倒序返回
+        order = "ASC" if after is not None else "DESC"
+        rows = self._connect().execute(
+            f"SELECT data FROM task_instances {where}"
+            f"ORDER BY start_time {order}, task_instances_id {order} LIMIT ?", params + [limit]).fetchall()
+        instances = [json.loads(row[0]) for row in rows]
+        if after is not None:
+            instances.reverse()
+        return instances
+
+    def get_task_instance(self, instance_id):
+        """获取单个任务实例"""
+        row = self._connect().execute(
+            "SELECT data FROM task_instances WHERE task_instances_id = ?", (instance_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_active_task_instances(self):
+        """获取所有排队中和执行中的任务实例（状态保存在 data 中，只在启动时调用，逐行筛选）"""
+        rows = self._connect().execute("SELECT data FROM task_instances ORDER BY start_time").fetchall()
+        instances = (json.loads(row[0]) for row in rows)
+        return [instance for instance in instances if instance.get("status") in ACTIVE_INSTANCE_STATUSES]
+
+    def add_task_instance(self, task_id, start_params=None, status="running"):
+        """添加新的任务实例记录，排队等待执行的实例状态为 queued"""
+        task = self.get_task(task_id)
+        if not task:
+            return None
+
+        start_time = int(time.time())
+        instance = {
+            "task_instances_id": None,
+            "task_id": task_id,
+            "task_name": task.get("name", f"任务 {task_id}"),
+            "start_time": start_time,
+            "start_time_formatted": self.format_timestamp(start_time),
+            "end_time": 0,
+            "end_time_formatted": "",
+            "status": status,
+            "params": start_params or {},
+            "result": {},
+            # 创建实例的进程，重启后据此判断排队中和执行中的实例是否已中断
+            "owner_pid": os.getpid()
+        }
+        with self._transaction() as conn:
+            next_id = self._next_id(conn, "task_instances", "task_instances_id")
+            instance["task_instances_id"] = next_id
+            conn.execute("INSERT INTO task_instances (task_instances_id, task_id, start_time, data) VALUES (?, ?, ?, ?)",
+                         (next_id, task_id, start_time, self._dumps(instance)))
+
+        # 创建任务日志文件
+        self._create_task_log_file(task_id, instance["task_instances_id"], f"{'开始执行任务' if status == 'running' else '任务已加入执行队列'}: {instance['task_name']}")
+        return instance
+
+    def update_task_instance(self, instance_id, status, result=None, end_time=None):
+        """更新任务实例状态"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM task_instances WHERE task_instances_id = ?",
+                               (instance_id,)).fetchone()
+            if not row:
+                return False
+            instance = json.loads(row[0])
+            instance["status"] = status
+            if result:
+                instance["result"] = result
+            if end_time or status in FINISHED_INSTANCE_STATUSES:
+                end_time = end_time or int(time.time())
+                instance["end_time"] = end_time
+                instance["end_time_formatted"] = self.format_timestamp(end_time)
+            conn.execute("UPDATE task_instances SET data = ? WHERE task_instances_id = ?",
+                         (self._dumps(instance), instance_id))
+
+        # 更新任务日志
+        self._append_task_log(
+            instance.get("task_id"),
+            instance_id,
+            f"任务状态更新为: {status}" + (f", 结果: {json.dumps(result, ensure_ascii=False)}" if result else "")
+        )
+        return True
+
+    def _update_task_instance_fields(self, instance_id, **fields):
+        """更新任务实例记录中的字段，值为 None 时删除该字段"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM task_instances WHERE task_instances_id = ?",
+                               (instance_id,)).fetchone()
+            if not row:
+                return False
+            instance = json.loads(row[0])
+            for key, value in fields.items():
+                if value is None:
+                    instance.pop(key, None)
+                else:
+                    instance[key] = value
+            conn.execute("UPDATE task_instances SET data = ? WHERE task_instances_id = ?",
+                         (self._dumps(instance), instance_id))
+        return True
+
+    def clear_old_task_instances(self, days=None):
+        """
+        清理旧的任务实例记录，日志和计划文件按日期分区目录整体删除
+
+        返回:
+            {"removed": 删除的实例数, "bytes": 释放的字节数}
+        """
+        if days is None:
+            settings = self.get_settings()
+            days = settings.get("keep_log_days", 7)
+        cutoff_time = int(time.time()) - (days * 86400)
+        with self._transaction() as conn:
+            removed, reclaimed = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM task_instances WHERE start_time <= ?",
+                (cutoff_time,)).fetchone()
+            conn.execute("DELETE FROM task_instances WHERE start_time <= ?", (cutoff_time,))
+        reclaimed += self._clear_old_task_files(self._partition_of(cutoff_time))
+        return {"removed": removed, "bytes": reclaimed}
@@ -12,6 +12,27 @@ from pytz import timezone
 import logging
 import traceback
 from app.utils.notifier import Notifier
+from app.utils.task_executor import TaskExecutor, PRIORITY_MANUAL, PRIORITY_SCHEDULED
+from app.utils.sync_process_pool import SyncProcessPool, EXECUTION_MODES
+from app.utils.data_manager import ACTIVE_INSTANCE_STATUSES
+
+# 查找可继续的断点时最多检查的最近任务实例数
+RESUME_SEARCH_LIMIT = 20
+# 关闭时等待执行中的任务响应取消的时间（秒）
+SHUTDOWN_TIMEOUT = 10
+
+
+def _process_alive(pid):
+    """进程是否存在；Windows 上 os.kill 会结束目标进程，不做检查，视为已退出"""
+    if os.name == "nt":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
 class SyncManager:
     """同步管理器，负责执行同步任务"""
@@ -21,9 +42,37 @@ class SyncManager:
         self.scheduler = BackgroundScheduler(timezone=timezone('Asia/Shanghai'))
         self.scheduler.start()
         self.running_tasks = {}
+        # 排队和执行中的任务实例的取消标记: 任务实例ID -> (任务ID, CancelToken)
+        self.cancel_tokens = {}
         self.lock = threading.Lock()
         self.is_initialized = False
+        self.is_shutdown = False
         self.notifier = Notifier()
+        # 定时和手动运行都先进入执行器队列，由执行器的工作线程按优先级和连接并发限制执行
+        self.executor = TaskExecutor(name="sync-task")
+        # 执行方式由环境变量 TASK_EXECUTION_MODE 选择: thread（默认）在本进程中执行同步，
+        # process 在独立的工作进程中执行（不支持 Windows）
+        self.execution_mode = (os.environ.get("TASK_EXECUTION_MODE") or "thread").lower()
+        if self.execution_mode not in EXECUTION_MODES:
+            logging.warning(f"未知的任务执行方式: {self.execution_mode}，将使用默认值: thread")
+            self.execution_mode = "thread"
+        elif self.execution_mode == "process" and os.name == "nt":
+            logging.warning("Windows 不支持 process 执行方式，将使用 thread")
+            self.execution_mode = "thread"
+        self.process_pool = SyncProcessPool() if self.execution_mode == "process" else None
+    
+    def configure_executor(self):
+        """按设置中的 max_concurrent_tasks 和 max_tasks_per_connection 调整执行器"""
+        try:
+            settings = current_app.config['DATA_MANAGER'].get_settings()
+            max_workers = settings.get("max_concurrent_tasks") or current_app.config.get("MAX_CONCURRENT_TASKS", 3)
+            self.executor.resize(max_workers, settings.get("max_tasks_per_connection") or 1)
+            if self.process_pool:
+                self.process_pool.max_idle_workers = self.executor.max_workers
+            current_app.logger.info(f"任务执行器: 最大并发任务数 {self.executor.max_workers}, "
+                                    f"单连接并发任务数 {self.executor.per_connection_limit}")
+        except Exception as e:
+            current_app.logger.error(f"调整任务执行器失败: {str(e)}")
     
     def initialize_scheduler(self):
         """初始化调度器，加载所有任务"""
@@ -32,6 +81,8 @@ class SyncManager:
             return
             
         current_app.logger.info("开始初始化任务调度器...")
+        self.configure_executor()
+        self._recover_interrupted_instances()
         
         try:
             data_manager = current_app.config['DATA_MANAGER']
@@ -70,6 +121,37 @@ class SyncManager:
             current_app.logger.error(f"初始化调度器失败: {str(e)}")
             current_app.logger.error(traceback.format_exc())
             
+    def _recover_interrupted_instances(self):
+        """
+        结束上次运行中断的任务实例
+
+        执行队列只保存在内存中，服务重启后之前排队中和执行中的实例不会再执行，也无法取消。
+        创建实例的进程已退出（或就是本进程，说明进程号被重启后的本进程复用）时，
+        排队中的实例记为 cancelled，执行中的实例记为 failed，并更新对应任务的状态。
+        其他仍在运行的进程（如共享 data 目录的其他 worker）创建的实例不做处理。
+        """
+        try:
+            data_manager = current_app.config['DATA_MANAGER']
+            recovered = 0
+            for instance in data_manager.get_active_task_instances():
+                owner_pid = instance.get("owner_pid")
+                if owner_pid and owner_pid != os.getpid() and _process_alive(owner_pid):
+                    continue
+                instance_id, task_id = instance["task_instances_id"], instance.get("task_id")
+                if instance.get("status") == "queued":
+                    status, message = "cancelled", "服务重启，排队中的任务已取消"
+                else:
+                    status, message = "failed", "服务重启，执行中的任务已中断"
+                data_manager.update_task_instance(instance_id, status, {"status": status, "message": message})
+                task = data_manager.get_task(task_id)
+                if task and task.get("status") in ACTIVE_INSTANCE_STATUSES:
+                    data_manager.update_task_status(task_id, status)
+                recovered += 1
+            if recovered:
+                current_app.logger.warning(f"已结束 {recovered} 个上次运行中断的任务实例")
+        except Exception as e:
+            current_app.logger.error(f"结束中断的任务实例失败: {str(e)}")
+    
     def _update_all_next_run_times(self):
         """更新所有任务的下次运行时间"""
         try:
@@ -122,7 +204,7 @@ class SyncManager:
             
             # 添加新任务
             job = self.scheduler.add_job(
-                self.run_task,
+                self.submit_task,
                 'cron',
                 id=job_id,
                 args=[task_id],
@@ -172,14 +254,129 @@ class SyncManager:
         current_app.logger.debug(f"解析 cron 表达式: {cron_expr} -> {result}")
         return result
     
-    def run_task(self, task_id):
-        """运行同步任务"""
+    def submit_task(self, task_id, full_rescan=False, dry_run=False, apply_instance_id=None,
+                    priority=PRIORITY_SCHEDULED):
+        """
+        将任务加入执行队列，立即返回任务实例ID
+
+        参数:
+            task_id: 任务ID
+            full_rescan/dry_run/apply_instance_id: 同 run_task
+            priority: 优先级，数值越小越先执行，手动运行使用 PRIORITY_MANUAL
+        """
+        from app.alist_sync import CancelToken
+        
+        try:
+            app = self._get_app()
+        except Exception as e:
+            print(f"创建应用上下文失败: {str(e)}")
+            return {"status": "error", "message": f"无法创建应用上下文: {str(e)}"}
+        
+        with app.app_context():
+            data_manager = app.config['DATA_MANAGER']
+            task = data_manager.get_task(task_id)
+            if not task:
+                return {"status": "error", "message": "任务不存在"}
+            
+            apply_plan_file, error = self._get_apply_plan_file(data_manager, task_id, apply_instance_id)
+            if error:
+                return {"status": "error", "message": error}
+            
+            if self.executor.is_queued(task_id) or self.executor.is_running(task_id):
+                return {"status": "error", "message": "任务已在运行或排队中"}
+            
+            start_params = self._get_start_params(task, dry_run, apply_plan_file, apply_instance_id)
+            task_instance = data_manager.add_task_instance(task_id, start_params, status="queued")
+            instance_id = task_instance["task_instances_id"]
+            with self.lock:
+                self.cancel_tokens[instance_id] = (task_id, CancelToken())
+            
+            if not self.executor.submit(task_id, self._run_queued_task, app, task_id, instance_id, full_rescan,
+                                        dry_run, apply_instance_id, priority=priority,
+                                        connection_id=task.get("connection_id")):
+                with self.lock:
+                    self.cancel_tokens.pop(instance_id, None)
+                error_result = {"status": "error", "message": "任务已在运行或排队中"}
+                data_manager.update_task_instance(instance_id, "failed", error_result)
+                return error_result
+            
+            data_manager.update_task_status(task_id, "queued")
+            return {"status": "success", "message": "任务已加入执行队列", "instance_id": instance_id}
+    
+    def _run_queued_task(self, app, task_id, instance_id, full_rescan, dry_run, apply_instance_id):
+        """在执行器工作线程中运行排队的任务实例"""
+        with app.app_context():
+            try:
+                result = self.run_task(task_id, full_rescan=full_rescan, dry_run=dry_run,
+                                       apply_instance_id=apply_instance_id, instance_id=instance_id)
+            finally:
+                with self.lock:
+                    self.cancel_tokens.pop(instance_id, None)
+            # 未开始执行就返回的错误（如任务已被删除），结束排队中的实例
+            if result.get("status") not in ("success", "cancelled"):
+                data_manager = app.config['DATA_MANAGER']
+                instance = data_manager.get_task_instance(instance_id)
+                if instance and instance.get("status") == "queued":
+                    data_manager.update_task_instance(instance_id, "failed", result)
+            return result
+    
+    def _get_app(self):
+        """获取当前 Flask 应用，调度器和执行器线程中没有应用上下文时使用全局应用实例"""
+        try:
+            return current_app._get_current_object()
+        except RuntimeError:
+            from app import flask_app
+            if flask_app:
+                return flask_app
+            from app import create_app
+            return create_app()
+    
+    @staticmethod
+    def _get_apply_plan_file(data_manager, task_id, apply_instance_id):
+        """返回 (计划文件路径, 错误信息)，不执行计划时返回 (None, None)"""
+        if apply_instance_id is None:
+            return None, None
+        plan_instance = data_manager.get_task_instance(apply_instance_id)
+        if not plan_instance or plan_instance.get("task_id") != task_id:
+            return None, f"任务实例不存在: {apply_instance_id}"
+        apply_plan_file = data_manager._get_task_plan_file_path(task_id, apply_instance_id)
+        if not os.path.exists(apply_plan_file):
+            return None, f"任务实例 {apply_instance_id} 没有同步计划"
+        return apply_plan_file, None
+    
+    @staticmethod
+    def _get_start_params(task, dry_run, apply_plan_file, apply_instance_id):
+        """任务实例记录的启动参数"""
+        start_params = {
+            "sync_type": task.get("sync_type", "file_sync"),
+            "source_path": task.get("source_path", "/"),
+            "target_path": task.get("target_path", "/")
+        }
+        if dry_run:
+            start_params["dry_run"] = True
+        if apply_plan_file:
+            start_params["apply_instance_id"] = apply_instance_id
+        return start_params
+    
+    def run_task(self, task_id, full_rescan=False, dry_run=False, apply_instance_id=None, instance_id=None):
+        """
+        运行同步任务
+        
+        参数:
+            task_id: 任务ID
+            full_rescan: 为True时忽略目录快照完整比较
+            dry_run: 为True时只生成同步计划，写入本次任务实例的计划文件，不执行
+            apply_instance_id: 执行该任务实例 dry-run 生成的计划，不再列出目录
+            instance_id: submit_task 创建的排队中的任务实例，为空时新建实例
+        """
         # 获取Flask应用实例
         from flask import current_app, Flask
+        from app.alist_sync import CancelToken, SyncCancelled
         
         # 如果当前没有应用上下文，尝试创建一个
         app = None
         app_context = None
+        registered = False
         
         try:
             # 尝试获取当前应用
@@ -215,21 +412,34 @@ class SyncManager:
             if not task:
                 return {"status": "error", "message": "任务不存在"}
             
+            # 执行计划时检查计划文件
+            apply_plan_file, error = self._get_apply_plan_file(data_manager, task_id, apply_instance_id)
+            if error:
+                return {"status": "error", "message": error}
+            
             # 检查任务是否正在运行
             with self.lock:
                 if task_id in self.running_tasks:
                     return {"status": "error", "message": "任务已在运行中"}
                 self.running_tasks[task_id] = time.time()
+                registered = True
             
             try:
-                # 创建任务实例记录
-                task_instance = data_manager.add_task_instance(task_id, {
-                    "sync_type": task.get("sync_type", "file_sync"),
-                    "source_path": task.get("source_path", "/"),
-                    "target_path": task.get("target_path", "/")
-                })
+                if instance_id is not None:
+                    # 排队中的实例开始执行
+                    data_manager.update_task_instance(instance_id, "running")
+                else:
+                    # 创建任务实例记录
+                    start_params = self._get_start_params(task, dry_run, apply_plan_file, apply_instance_id)
+                    task_instance = data_manager.add_task_instance(task_id, start_params)
+                    instance_id = task_instance["task_instances_id"]
+                
+                # 排队时登记的取消标记，排队到开始执行之间收到的取消在第一次请求前生效
+                with self.lock:
+                    cancel_token = self.cancel_tokens.setdefault(instance_id, (task_id, CancelToken()))[1]
                 
-                instance_id = task_instance["task_instances_id"]
+                # 实例运行期间的日志由后台线程批量写入，结束时关闭
+                data_manager.open_task_log_writer(task_id, instance_id)
                 
                 # 更新任务状态
                 current_time = int(time.time())
@@ -248,7 +458,8 @@ class SyncManager:
                 data_manager._append_task_log(task_id, instance_id, "准备执行任务")
                 
                 # 执行同步操作
-                result = self._execute_task_with_alist_sync(task, task_id, instance_id)
+                result = self._execute_task_with_alist_sync(task, task_id, instance_id, full_rescan,
+                                                            dry_run, apply_plan_file, cancel_token)
                 
                 # 更新任务状态
                 status = "completed" if result.get("status") == "success" else "failed"
@@ -297,6 +508,37 @@ class SyncManager:
                     "result": result
                 }
                 
+            except SyncCancelled as e:
+                # 同步在两次请求之间停止，已完成的部分保留，记录取消前的进度
+                cancel_result = {"status": "cancelled", "message": e.reason or "任务已取消", "progress": e.progress}
+                data_manager.update_task_status(task_id, "cancelled", last_run=current_time)
+                data_manager.update_task_instance(instance_id, "cancelled", cancel_result)
+                data_manager.add_log({
+                    "task_id": task_id,
+                    "instance_id": instance_id,
+                    "level": "WARNING",
+                    "message": f"任务已取消: {task.get('name', f'任务 {task_id}')}",
+                    "details": cancel_result
+                })
+                data_manager._append_task_log(
+                    task_id, instance_id, f"任务已取消: {json.dumps(cancel_result, ensure_ascii=False)}")
+                
+                task_info = {
+                    "id": task_id,
+                    "name": task.get('name', f'任务 {task_id}'),
+                    "status": "cancelled",
+                    "duration": f"{int(time.time()) - current_time}秒",
+                    "instance_id": instance_id
+                }
+                self.notifier.send_notification("任务已取消", cancel_result["message"], task_info)
+                
+                return {
+                    "status": "cancelled",
+                    "message": "任务已取消",
+                    "instance_id": instance_id,
+                    "result": cancel_result
+                }
+                
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
@@ -305,7 +547,7 @@ class SyncManager:
                 data_manager.update_task_status(task_id, "failed", last_run=int(time.time()))
                 
                 # 如果已创建实例，更新实例状态
-                if 'instance_id' in locals():
+                if instance_id is not None:
                     error_result = {"status": "error", "message": str(e)}
                     data_manager.update_task_instance(instance_id, "failed", error_result)
                     data_manager._append_task_log(task_id, instance_id, f"任务执行异常: {str(e)}\n{error_details}")
@@ -332,13 +574,19 @@ class SyncManager:
                     "name": task.get('name', f'任务 {task_id}'),
                     "status": "failed",
                     "duration": f"{task_duration}秒",
-                    "instance_id": instance_id if 'instance_id' in locals() else None
+                    "instance_id": instance_id
                 }
                 
                 # 发送通知
                 self.notifier.send_notification(notification_title, notification_content, task_info)
                 
                 return {"status": "error", "message": str(e)}
+            
+            finally:
+                if instance_id is not None:
+                    data_manager.close_task_log_writer(task_id, instance_id, archive=True)
+                    with self.lock:
+                        self.cancel_tokens.pop(instance_id, None)
                 
         except Exception as e:
             import traceback
@@ -347,18 +595,24 @@ class SyncManager:
             return {"status": "error", "message": f"任务执行时发生未捕获的异常: {str(e)}"}
             
         finally:
-            # 任务完成，从运行列表中移除
-            with self.lock:
-                if task_id in self.running_tasks:
-                    del self.running_tasks[task_id]
+            # 任务完成，从运行列表中移除（只移除本次执行登记的）
+            if registered:
+                with self.lock:
+                    self.running_tasks.pop(task_id, None)
             
             # 如果创建了新的应用上下文，需要释放它
             if app_context:
                 app_context.pop()
     
-    def _execute_task_with_alist_sync(self, task, task_id, instance_id):
-        """使用AlistSync执行任务"""
-        from app.alist_sync import main as alist_sync_main
+    def _execute_task_with_alist_sync(self, task, task_id, instance_id, full_rescan=False, dry_run=False,
+                                      apply_plan_file=None, cancel_token=None):
+        """
+        使用AlistSync执行任务，dry_run 时只生成同步计划，apply_plan_file 不为空时执行该计划
+
+        cancel_token 被取消时同步在下一次请求前停止，抛出 SyncCancelled
+        """
+        from app.alist_sync import (SyncJobConfig, JobLogFilter, run_sync, DEFAULT_MAX_WORKERS, DEFAULT_MAX_RETRY,
+                                    DEFAULT_BATCH_SIZE)
         from app.alist_sync import logger as alist_sync_logger
         
         # 获取数据管理器
@@ -383,25 +637,18 @@ class SyncManager:
             source_path = task.get("source_path", "/")
             target_path = task.get("target_path", "/")
             
-            # 设置环境变量，确保使用正确的连接信息
-            os.environ["BASE_URL"] = connection.get("server", "")
-            os.environ["USERNAME"] = connection.get("username", "")
-            os.environ["PASSWORD"] = connection.get("password", "")
-            os.environ["TOKEN"] = connection.get("token", "")
-            
-            data_manager._append_task_log(task_id, instance_id, f"设置连接: 服务器={os.environ['BASE_URL']}, 用户名={os.environ['USERNAME']}")
+            data_manager._append_task_log(task_id, instance_id, f"设置连接: 服务器={connection.get('server', '')}, 用户名={connection.get('username', '')}")
             
             # 根据任务类型决定操作
-            if sync_type == "file_move":
-                os.environ["MOVE_FILE"] = "true"
+            move_file = sync_type == "file_move"
+            if move_file:
                 data_manager._append_task_log(task_id, instance_id, "设置为文件移动模式")
             else:
-                os.environ["MOVE_FILE"] = "false"
                 data_manager._append_task_log(task_id, instance_id, "设置为文件同步模式")
             
             # 设置删除差异项行为
-            os.environ["SYNC_DELETE_ACTION"] = task.get("sync_diff_action", "none")
-            data_manager._append_task_log(task_id, instance_id, f"设置差异项处理方式: {os.environ['SYNC_DELETE_ACTION']}")
+            sync_delete_action = task.get("sync_diff_action", "none")
+            data_manager._append_task_log(task_id, instance_id, f"设置差异项处理方式: {sync_delete_action}")
             
             # 设置同步目录
             dir_pairs = []
@@ -435,27 +682,72 @@ class SyncManager:
                         exclude_dirs.append(exclude_dir)
             
             if dir_pairs:
-                os.environ["DIR_PAIRS"] = ";".join(dir_pairs)
-                data_manager._append_task_log(task_id, instance_id, f"设置同步目录对: {os.environ['DIR_PAIRS']}")
+                data_manager._append_task_log(task_id, instance_id, f"设置同步目录对: {';'.join(dir_pairs)}")
                 
                 # 设置排除目录
                 if exclude_dirs:
-                    os.environ["EXCLUDE_DIRS"] = ",".join(exclude_dirs)
-                    data_manager._append_task_log(task_id, instance_id, f"设置排除目录: {os.environ['EXCLUDE_DIRS']}")
+                    data_manager._append_task_log(task_id, instance_id, f"设置排除目录: {','.join(exclude_dirs)}")
                 
                 # 设置排除文件
                 if task.get("file_filter"):
-                    os.environ["REGEX_PATTERNS"] = task.get("file_filter")
-                    data_manager._append_task_log(task_id, instance_id, f"设置文件过滤: {os.environ['REGEX_PATTERNS']}")
+                    data_manager._append_task_log(task_id, instance_id, f"设置文件过滤: {task.get('file_filter')}")
                 
                 # 设置最小/最大文件大小
-                if task.get("size_min"):
-                    os.environ["SIZE_MIN"] = str(task.get("size_min"))
-                    data_manager._append_task_log(task_id, instance_id, f"设置最小文件大小: {os.environ['SIZE_MIN']}")
-
-                if task.get("size_max"):
-                    os.environ["SIZE_MAX"] = str(task.get("size_max"))
-                    data_manager._append_task_log(task_id, instance_id, f"设置最大文件大小: {os.environ['SIZE_MAX']}")
+                size_min = self._parse_int(task.get("size_min"))
+                size_max = self._parse_int(task.get("size_max"))
+                if size_min is not None:
+                    data_manager._append_task_log(task_id, instance_id, f"设置最小文件大小: {size_min}")
+                if size_max is not None:
+                    data_manager._append_task_log(task_id, instance_id, f"设置最大文件大小: {size_max}")
+                
+                # 连接未设置重试次数时使用设置中的默认重试次数
+                default_retry_count = self._parse_int(data_manager.get_settings().get("default_retry_count"))
+                if default_retry_count is None:
+                    default_retry_count = DEFAULT_MAX_RETRY
+                
+                # 普通同步从最近一次中断的运行保存的断点继续，dry-run 和执行计划时不使用断点
+                resume_checkpoint = None
+                if not dry_run and not apply_plan_file:
+                    resume_instance_id, resume_checkpoint = self._find_resume_checkpoint(data_manager, task_id,
+                                                                                         instance_id)
+                    if resume_checkpoint:
+                        data_manager._append_task_log(task_id, instance_id,
+                                                      f"找到任务实例 {resume_instance_id} 保存的断点")
+                
+                # 每个任务实例的配置只属于本次执行，不写入进程环境变量，多个任务可以同时执行
+                job_id = f"task_{task_id}_instance_{instance_id}"
+                env_config = SyncJobConfig.from_env()
+                config = SyncJobConfig(
+                    base_url=connection.get("server", ""),
+                    username=connection.get("username") or None,
+                    password=connection.get("password") or None,
+                    token=connection.get("token") or None,
+                    dir_pairs=tuple(dir_pairs),
+                    sync_delete_action=sync_delete_action,
+                    exclude_dirs=tuple(exclude_dirs),
+                    move_file=move_file,
+                    regex_patterns=task.get("file_filter") or None,
+                    size_min=size_min,
+                    size_max=size_max,
+                    max_workers=self._parse_int(connection.get("max_workers")) or DEFAULT_MAX_WORKERS,
+                    max_retry=self._parse_int(connection.get("max_retry")) or default_retry_count,
+                    batch_size=self._parse_int(connection.get("batch_size")) or DEFAULT_BATCH_SIZE,
+                    sync_engine=connection.get("sync_engine") or "thread",
+                    max_concurrency=self._parse_int(connection.get("max_concurrency")),
+                    snapshot_enabled=bool(connection.get("snapshot_cache")),
+                    # 快照容量和有效期是部署级配置，仍从进程环境变量读取
+                    snapshot_max_age=self._parse_int(os.environ.get("SNAPSHOT_MAX_AGE")),
+                    snapshot_max_entries=self._parse_int(os.environ.get("SNAPSHOT_MAX_ENTRIES")),
+                    full_rescan=full_rescan,
+                    dry_run=bool(dry_run and not apply_plan_file),
+                    plan_file=data_manager._get_task_plan_file_path(task_id, instance_id) if dry_run else None,
+                    apply_plan=apply_plan_file or None,
+                    job_id=job_id,
+                    resume_checkpoint=resume_checkpoint,
+                    # 断点保存间隔和有效期是部署级配置，与命令行运行方式一样由 SyncJobConfig.from_env 读取
+                    checkpoint_interval=env_config.checkpoint_interval,
+                    checkpoint_max_age=env_config.checkpoint_max_age
+                )
                 
                 # 执行主函数
                 data_manager._append_task_log(task_id, instance_id, "开始执行同步...")
@@ -466,20 +758,45 @@ class SyncManager:
                         log_message = self.format(record)
                         data_manager._append_task_log(task_id, instance_id, log_message)
                 
-                # 获取alist_sync的logger并添加自定义处理器
-                if alist_sync_logger:
-                    task_log_handler = TaskLogHandler()
-                    formatter = logging.Formatter('%(message)s')
-                    task_log_handler.setFormatter(formatter)
-                    alist_sync_logger.addHandler(task_log_handler)
+                # 获取alist_sync的logger并添加自定义处理器，只接收本次执行产生的日志
+                task_log_handler = TaskLogHandler()
+                task_log_handler.setFormatter(logging.Formatter('%(message)s'))
+                task_log_handler.addFilter(JobLogFilter(job_id))
+                alist_sync_logger.addHandler(task_log_handler)
                 
-                # 执行主函数
-                alist_sync_main()
+                # 断点写入任务实例记录，服务重启或任务失败后下次运行从断点继续
+                def save_checkpoint(checkpoint):
+                    try:
+                        data_manager.update_task_instance_checkpoint(instance_id, checkpoint)
+                    except Exception as e:
+                        logging.error(f"保存任务实例 {instance_id} 的断点失败: {str(e)}")
                 
-                # 如果有添加自定义处理器，需要移除
-                if alist_sync_logger and 'task_log_handler' in locals():
+                on_checkpoint = save_checkpoint if not dry_run and not apply_plan_file else None
+                try:
+                    if self.process_pool:
+                        main_result = self._run_sync_in_process(config, data_manager, task_id, instance_id,
+                                                                cancel_token, on_checkpoint)
+                    else:
+                        main_result = run_sync(config, cancel_token, on_checkpoint)
+                finally:
                     alist_sync_logger.removeHandler(task_log_handler)
                 
+                if apply_plan_file:
+                    if not main_result:
+                        return {"status": "error", "message": "同步计划执行失败", "plan_file": apply_plan_file}
+                    return {"status": "success", "message": "同步计划执行成功", "plan_file": apply_plan_file}
+                if dry_run:
+                    if not main_result:
+                        return {"status": "error", "message": "同步计划生成失败"}
+                    from app.sync_plan import read_plan_summary
+                    summary = read_plan_summary(main_result) or {}
+                    return {"status": "success", "message": "同步计划已生成", "dir_pairs": dir_pairs,
+                            "plan_file": main_result, "plan_summary": summary.get("summary", {}),
+                            "plan_complete": summary.get("result", False)}
+                
+                # 全部目录对同步成功后不再需要断点
+                if main_result:
+                    data_manager.update_task_instance_checkpoint(instance_id, None)
                 return {"status": "success", "message": "同步任务执行成功", "dir_pairs": dir_pairs}
             else:
                 return {"status": "error", "message": "未配置有效的目录对"}
@@ -490,6 +807,52 @@ class SyncManager:
             data_manager._append_task_log(task_id, instance_id, f"执行出错: {str(e)}\n{error_details}")
             raise
     
+    def _run_sync_in_process(self, config, data_manager, task_id, instance_id, cancel_token=None,
+                             on_checkpoint=None):
+        """在工作进程中执行同步，工作进程发回的日志以本作业的身份写入系统日志和任务日志"""
+        from app.alist_sync import current_job_id, logger as alist_sync_logger
+        
+        def on_started(pid):
+            data_manager._append_task_log(task_id, instance_id, f"在工作进程 {pid} 中执行同步")
+        
+        token = current_job_id.set(config.job_id)
+        try:
+            return self.process_pool.run(config, on_log=alist_sync_logger.log, on_started=on_started,
+                                         cancel_token=cancel_token, on_checkpoint=on_checkpoint)
+        finally:
+            current_job_id.reset(token)
+    
+    @staticmethod
+    def _find_resume_checkpoint(data_manager, task_id, instance_id):
+        """
+        查找最近一次未完成的同步运行保存的断点
+
+        从新到旧检查任务的实例，跳过本次实例、排队中的实例和 dry-run / 执行计划的实例；
+        遇到带断点的实例时返回其断点，先遇到没有断点的已完成实例时说明之后已完整同步过，不再继续。
+
+        返回:
+            (任务实例ID, 断点)，没有可用断点时返回 (None, None)
+        """
+        for instance in data_manager.get_task_instances(task_id, limit=RESUME_SEARCH_LIMIT):
+            if instance.get("task_instances_id") == instance_id or instance.get("status") == "queued":
+                continue
+            params = instance.get("params") or {}
+            if params.get("dry_run") or params.get("apply_instance_id"):
+                continue
+            if instance.get("has_checkpoint"):
+                checkpoint = data_manager.get_task_instance_checkpoint(instance["task_instances_id"])
+                if checkpoint:
+                    return instance["task_instances_id"], checkpoint
+            if instance.get("status") == "completed":
+                break
+        return None, None
+    
+    @staticmethod
+    def _parse_int(value):
+        """解析任务或连接中的非负整数配置，未设置或格式错误时返回None"""
+        value = str(value).strip() if value is not None else ""
+        return int(value) if value.isdigit() else None
+    
     def _one_way_sync(self, source_conn, target_conn, source_path, target_path, task):
         """执行单向同步"""
         # 模拟同步过程
@@ -616,25 +979,54 @@ class SyncManager:
         
         return {"status": "success", "message": f"文件同步成功: {source_path} -> {target_path}"}
     
+    def cancel_instance(self, instance_id):
+        """
+        取消任务实例
+
+        排队中的实例直接从队列中移除；执行中的实例设置取消标记，同步在当前请求完成后停止，
+        实例状态由执行线程更新为 cancelled 并记录进度。执行线程结束前任务仍占用运行位置，同一任务不会重复启动。
+        """
+        data_manager = current_app.config['DATA_MANAGER']
+        instance = data_manager.get_task_instance(instance_id)
+        if not instance:
+            return {"status": "error", "message": f"任务实例不存在: {instance_id}"}
+        
+        with self.lock:
+            entry = self.cancel_tokens.get(instance_id)
+        if entry is None or instance.get("status") not in ACTIVE_INSTANCE_STATUSES:
+            return {"status": "error", "message": "任务实例未在运行或排队中"}
+        task_id, cancel_token = entry
+        
+        # 执行器队列以任务ID为键，同一任务只有一个排队中的实例
+        if instance.get("status") == "queued" and self.executor.cancel(task_id):
+            with self.lock:
+                self.cancel_tokens.pop(instance_id, None)
+            data_manager.update_task_instance(instance_id, "cancelled", {"status": "cancelled", "message": "任务已取消"})
+            data_manager.update_task_status(task_id, "cancelled")
+            return {"status": "success", "message": "已从执行队列中移除任务", "instance_id": instance_id}
+        
+        cancel_token.cancel()
+        data_manager._append_task_log(task_id, instance_id, "收到取消请求，当前请求完成后停止同步")
+        return {"status": "success", "message": "已请求取消任务，当前请求完成后停止", "instance_id": instance_id}
+    
     def stop_task(self, task_id):
-        """停止正在运行的任务"""
+        """取消任务排队中和执行中的实例"""
         with self.lock:
-            if task_id in self.running_tasks:
-                # 实际项目中，应该有机制中断正在运行的任务
-                del self.running_tasks[task_id]
-                
-                # 更新任务状态
-                data_manager = current_app.config['DATA_MANAGER']
-                data_manager.update_task_status(task_id, "stopped")
-                
-                return {"status": "success", "message": "任务已停止"}
-            else:
-                return {"status": "error", "message": "任务未在运行"}
+            instance_ids = [instance_id for instance_id, (entry_task_id, _) in self.cancel_tokens.items()
+                            if entry_task_id == task_id]
+        if not instance_ids:
+            return {"status": "error", "message": "任务未在运行"}
+        
+        result = None
+        for instance_id in instance_ids:
+            result = self.cancel_instance(instance_id)
+        return result
     
     def reload_scheduler(self):
         """重新加载调度器中的所有任务"""
         try:
             current_app.logger.info("开始重新加载调度器...")
+            self.configure_executor()
             
             # 获取数据管理器
             data_manager = current_app.config['DATA_MANAGER']
@@ -690,5 +1082,42 @@ class SyncManager:
         return self.reload_scheduler()
     
     def shutdown(self):
-        """关闭调度器"""
-        self.scheduler.shutdown() 
\ No newline at end of file
+        """
+        关闭调度器和执行器
+
+        队列中丢弃的实例记为 cancelled；执行中的实例设置取消标记，最多等待 SHUTDOWN_TIMEOUT 秒，
+        由执行线程记为 cancelled，仍未结束的实例在下次启动时结束。
+        """
+        from app.alist_sync import close_connection_pools
+        with self.lock:
+            if self.is_shutdown:
+                return
+            self.is_shutdown = True
+        self.scheduler.shutdown(wait=False)
+        
+        with self.lock:
+            entries = list(self.cancel_tokens.items())
+        dropped = set(self.executor.shutdown())
+        for _, (task_id, cancel_token) in entries:
+            if task_id not in dropped:
+                cancel_token.cancel("服务关闭")
+        
+        app = self._get_app()
+        with app.app_context():
+            data_manager = app.config['DATA_MANAGER']
+            for instance_id, (task_id, _) in entries:
+                if task_id not in dropped:
+                    continue
+                with self.lock:
+                    self.cancel_tokens.pop(instance_id, None)
+                try:
+                    data_manager.update_task_instance(instance_id, "cancelled",
+                                                      {"status": "cancelled", "message": "服务关闭，排队中的任务已取消"})
+                    data_manager.update_task_status(task_id, "cancelled")
+                except Exception as e:
+                    logging.error(f"更新任务实例 {instance_id} 状态失败: {str(e)}")
+        
+        self.executor.shutdown(wait=True, timeout=SHUTDOWN_TIMEOUT)
+        if self.process_pool:
+            self.process_pool.shutdown()
+        close_connection_pools()
\ No newline at end of file
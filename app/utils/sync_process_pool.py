@@ -0,0 +1,251 @@
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection, Pipe
+
+# 任务执行方式: thread 在 Web 服务进程的线程中执行，process 在独立的工作进程中执行
+EXECUTION_MODES = ("thread", "process")
+# 空闲的工作进程最多保留的数量
+DEFAULT_MAX_IDLE_WORKERS = 3
+# 等待工作进程消息时检查进程是否存活的间隔（秒）
+POLL_INTERVAL = 1.0
+# 发出取消后等待工作进程停止的时间（秒），超时后结束工作进程
+CANCEL_TIMEOUT = 30
+
+
+class WorkerCrashedError(RuntimeError):
+    """工作进程在返回结果前异常退出"""
+
+
+class _PipeLogHandler(logging.Handler):
+    """工作进程中的日志处理器，把日志通过管道发回主进程"""
+
+    def __init__(self, conn):
+        super().__init__()
+        self.conn = conn
+
+    def emit(self, record):
+        try:
+            self.conn.send(("log", record.levelno, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+    def send(self, message):
+        """发送日志以外的消息，与日志共用处理器的锁，避免多个线程同时写管道"""
+        with self.lock:
+            self.conn.send(message)
+
+
+def _worker_main(conn):
+    """工作进程入口: 循环接收同步配置并执行，日志和结果通过管道发回主进程"""
+    from app.alist_sync import CancelToken, SyncCancelled, close_connection_pools, run_sync
+
+    # 日志只发回主进程，由主进程写入系统日志文件和任务日志，避免多个进程同时写同一个文件
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    handler = _PipeLogHandler(conn)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
+
+    # 接收线程: 作业执行期间也要能收到取消消息。每个配置在收到时创建取消标记，
+    # 取消消息总是作用于在它之前收到的配置，不会误取消之后复用本进程的作业
+    jobs = queue.Queue()
+
+    def receive():
+        token = None
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = None
+            if isinstance(message, tuple) and message[0] == "cancel":
+                if token is not None:
+                    token.cancel(message[1])
+                continue
+            if message is None:
+                jobs.put(None)
+                return
+            _, config, with_checkpoint = message
+            token = CancelToken()
+            jobs.put((config, token, with_checkpoint))
+
+    threading.Thread(target=receive, name="sync-worker-receiver", daemon=True).start()
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        config, token, with_checkpoint = job
+        on_checkpoint = (lambda checkpoint: handler.send(("checkpoint", checkpoint))) if with_checkpoint else None
+        handler.send(("started", os.getpid()))
+        try:
+            handler.send(("result", run_sync(config, token, on_checkpoint)))
+        except SyncCancelled as e:
+            handler.send(("cancelled", e.reason, e.progress))
+        except Exception as e:
+            handler.send(("error", f"{type(e).__name__}: {str(e)}"))
+        finally:
+            # 主进程修改或删除连接时无法通知工作进程，作业结束后关闭本进程的连接池
+            close_connection_pools()
+
+
+class _Worker:
+    """
+    以 python -m app.utils.sync_process_pool 启动的工作进程，通过继承的管道通信
+
+    不使用 multiprocessing 的 spawn，因为它会在子进程中重新导入入口脚本（startup.py 等在导入时就创建应用和调度器）。
+    """
+
+    def __init__(self):
+        self.conn, child_conn = Pipe()
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.process = subprocess.Popen([sys.executable, "-m", "app.utils.sync_process_pool", str(child_conn.fileno())],
+                                        pass_fds=(child_conn.fileno(),), cwd=project_root)
+        child_conn.close()
+
+    @property
+    def exitcode(self):
+        return self.process.poll()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+
+class SyncProcessPool:
+    """
+    同步任务的工作进程池
+
+    每个任务在一个独立的工作进程中执行 run_sync，目录比较等 CPU 密集的计算不再占用 Web 服务进程的 GIL。
+    工作进程是新启动的 Python 解释器，不继承主进程的线程和锁；执行结束后放回池中复用。
+
+    每个工作进程有自己的管道，依次发回 started（进程号）、log（日志级别和内容）、checkpoint（断点）
+    和 result / error / cancelled 消息。
+    工作进程异常退出时只有它正在执行的任务失败（WorkerCrashedError），Web 服务进程和其他任务不受影响。
+    取消标记被设置后向工作进程发送 cancel 消息，工作进程在下一次请求前停止；超过 CANCEL_TIMEOUT 仍未停止时结束该进程。
+    """
+
+    def __init__(self, max_idle_workers=DEFAULT_MAX_IDLE_WORKERS):
+        self.max_idle_workers = max_idle_workers
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def run(self, config, on_log=None, on_started=None, cancel_token=None, on_checkpoint=None):
+        """
+        在工作进程中执行同步作业，阻塞到作业结束
+
+        参数:
+            config: SyncJobConfig
+            on_log: 收到日志时调用 on_log(级别, 内容)
+            on_started: 工作进程开始执行时调用 on_started(进程号)
+            cancel_token: 取消标记（CancelToken），设置后通知工作进程停止作业
+            on_checkpoint: 工作进程保存断点时调用 on_checkpoint(断点)，为空时不记录断点
+
+        返回:
+            run_sync 的返回值，作业抛出异常时抛出 RuntimeError，工作进程异常退出时抛出 WorkerCrashedError，
+            作业被取消时抛出 SyncCancelled
+        """
+        from app.alist_sync import SyncCancelled
+
+        worker = self._acquire()
+        cancel_sent_at = None
+        try:
+            worker.conn.send(("run", config, on_checkpoint is not None))
+            while True:
+                if cancel_token is not None and cancel_token.cancelled:
+                    if cancel_sent_at is None:
+                        worker.conn.send(("cancel", cancel_token.reason))
+                        cancel_sent_at = time.monotonic()
+                    elif time.monotonic() - cancel_sent_at > CANCEL_TIMEOUT:
+                        # 工作进程没有响应取消（如卡在一次长时间的请求中），结束该进程
+                        raise SyncCancelled(cancel_token.reason)
+                if not worker.conn.poll(POLL_INTERVAL):
+                    if not worker.is_alive():
+                        raise WorkerCrashedError(f"同步工作进程异常退出，退出码: {worker.exitcode}")
+                    continue
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    try:
+                        worker.process.wait(POLL_INTERVAL)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    raise WorkerCrashedError(f"同步工作进程异常退出，退出码: {worker.exitcode}")
+                kind = message[0]
+                if kind == "log":
+                    if on_log:
+                        on_log(message[1], message[2])
+                elif kind == "started":
+                    if on_started:
+                        on_started(message[1])
+                elif kind == "checkpoint":
+                    if on_checkpoint:
+                        on_checkpoint(message[1])
+                elif kind == "result":
+                    return message[1]
+                elif kind == "cancelled":
+                    # 作业在请求之间停止，工作进程本身正常，可以继续复用
+                    self._release(worker)
+                    worker = None
+                    raise SyncCancelled(message[1], message[2])
+                elif kind == "error":
+                    # 作业抛出异常，工作进程本身正常，可以继续复用
+                    self._release(worker)
+                    worker = None
+                    raise RuntimeError(message[1])
+        except BaseException:
+            # 中途出错的工作进程状态未知，不再复用
+            if worker is not None:
+                worker.stop(timeout=0)
+                worker = None
+            raise
+        finally:
+            if worker is not None:
+                self._release(worker)
+
+    def shutdown(self):
+        """停止所有空闲的工作进程，执行中的工作进程在任务结束后退出"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("同步工作进程池已关闭")
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.is_alive():
+                    return worker
+                worker.stop(timeout=0)
+        return _Worker()
+
+    def _release(self, worker):
+        with self._lock:
+            if not self._closed and worker.is_alive() and len(self._idle) < self.max_idle_workers:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+
+if __name__ == "__main__":
+    _worker_main(Connection(int(sys.argv[1])))
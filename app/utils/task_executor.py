@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# 任务优先级，数值越小越先执行: 手动运行优先于定时运行
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+# 默认的工作线程数
+DEFAULT_MAX_WORKERS = 3
+# 同一连接（AList 服务器）默认最多同时执行的任务数
+DEFAULT_PER_CONNECTION_LIMIT = 1
+
+
+class TaskExecutor:
+    """
+    有界的任务执行器
+
+    提交的任务按 (优先级, 提交顺序) 进入优先队列，由 max_workers 个工作线程取出执行。
+    同一连接同时执行的任务数不超过 per_connection_limit，该连接已满时先执行队列中其他连接的任务，
+    避免多个任务同时压在同一个 AList 服务器上。
+
+    每个任务有一个唯一的 key（如任务ID），同一 key 在排队或执行期间不能重复提交。
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, per_connection_limit=DEFAULT_PER_CONNECTION_LIMIT,
+                 name="task-executor"):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.per_connection_limit = max(1, int(per_connection_limit))
+        self._cond = threading.Condition()
+        self._queue = []  # 堆: [优先级, 提交序号, key, 连接ID, 函数, 参数, 关键字参数, 提交时间]
+        self._seq = itertools.count()
+        self._queued = {}  # key -> 队列项
+        self._running = {}  # key -> (连接ID, 开始时间)
+        self._connection_running = {}  # 连接ID -> 执行中的任务数
+        self._worker_count = 0
+        self._shutdown = False
+
+    def submit(self, key, func, *args, priority=PRIORITY_SCHEDULED, connection_id=None, **kwargs):
+        """
+        提交任务
+
+        参数:
+            key: 任务唯一标识，排队或执行中时重复提交会被拒绝
+            func: 在工作线程中执行的函数
+            priority: 优先级，数值越小越先执行
+            connection_id: 任务使用的连接，用于限制同一连接的并发数，None 表示不限制
+
+        返回:
+            是否已加入队列
+        """
+        with self._cond:
+            if self._shutdown or key in self._queued or key in self._running:
+                return False
+            entry = [priority, next(self._seq), key, connection_id, func, args, kwargs, time.time()]
+            heapq.heappush(self._queue, entry)
+            self._queued[key] = entry
+            self._start_workers()
+            self._cond.notify_all()
+            return True
+
+    def cancel(self, key):
+        """从队列中移除尚未开始的任务，返回是否移除成功"""
+        with self._cond:
+            entry = self._queued.pop(key, None)
+            if entry is None:
+                return False
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            return True
+
+    def is_queued(self, key):
+        with self._cond:
+            return key in self._queued
+
+    def is_running(self, key):
+        with self._cond:
+            return key in self._running
+
+    def resize(self, max_workers=None, per_connection_limit=None):
+        """调整工作线程数和单连接并发数，多余的线程在当前任务结束后退出"""
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if per_connection_limit is not None:
+                self.per_connection_limit = max(1, int(per_connection_limit))
+            self._start_workers()
+            self._cond.notify_all()
+
+    def status(self):
+        """执行器状态: 配置、执行中和排队中的任务"""
+        with self._cond:
+            queued = sorted(self._queue)
+            return {
+                "max_workers": self.max_workers,
+                "per_connection_limit": self.per_connection_limit,
+                "running": [{"key": key, "connection_id": connection_id, "started_at": int(started_at)}
+                            for key, (connection_id, started_at) in self._running.items()],
+                "queued": [{"key": entry[2], "priority": entry[0], "connection_id": entry[3],
+                            "submitted_at": int(entry[7])} for entry in queued]
+            }
+
+    def shutdown(self, wait=False, timeout=None):
+        """
+        停止接收任务并丢弃队列中的任务，wait 为 True 时等待执行中的任务结束（最多 timeout 秒）
+
+        返回:
+            被丢弃的任务 key 列表，调用方负责更新它们的状态
+        """
+        with self._cond:
+            self._shutdown = True
+            dropped = [entry[2] for entry in sorted(self._queue)]
+            self._queue.clear()
+            self._queued.clear()
+            self._cond.notify_all()
+            if wait:
+                self._cond.wait_for(lambda: not self._running, timeout)
+            return dropped
+
+    # 调度
+    def _start_workers(self):
+        """在锁内调用，按需补足工作线程，不超过 max_workers 和待执行任务数"""
+        while self._worker_count < min(self.max_workers, len(self._running) + len(self._queue)):
+            self._worker_count += 1
+            threading.Thread(target=self._worker, name=f"{self.name}-{self._worker_count}", daemon=True).start()
+
+    def _has_capacity(self, connection_id):
+        return connection_id is None or self._connection_running.get(connection_id, 0) < self.per_connection_limit
+
+    def _pop_runnable(self):
+        """在锁内调用，取出优先级最高且连接未满的任务"""
+        if not self._queue:
+            return None
+        if self._has_capacity(self._queue[0][3]):
+            entry = heapq.heappop(self._queue)
+        else:
+            entry = next((item for item in sorted(self._queue) if self._has_capacity(item[3])), None)
+            if entry is None:
+                return None
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        del self._queued[entry[2]]
+        return entry
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._shutdown or self._worker_count > self.max_workers:
+                        self._worker_count -= 1
+                        return
+                    entry = self._pop_runnable()
+                    if entry is not None:
+                        break
+                    if not self._queue:
+                        # 没有待执行任务时退出，下次提交时重新创建
+                        self._worker_count -= 1
+                        return
+                    self._cond.wait()
+                _, _, key, connection_id, func, args, kwargs, _ = entry
+                self._running[key] = (connection_id, time.time())
+                if connection_id is not None:
+                    self._connection_running[connection_id] = self._connection_running.get(connection_id, 0) + 1
+
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"执行任务 {key} 时出错: {str(e)}")
+            finally:
+                with self._cond:
+                    del self._running[key]
+                    if connection_id is not None:
+                        self._connection_running[connection_id] -= 1
+                        if not self._connection_running[connection_id]:
+                            del self._connection_running[connection_id]
+                    self._cond.notify_all()
@@ -0,0 +1,113 @@
+import os
+import queue
+import threading
+import time
+
+# 队列最多缓存的日志行数
+DEFAULT_QUEUE_SIZE = 10000
+# 累计到该行数后立即写入
+DEFAULT_BATCH_SIZE = 200
+# 最长写入间隔（秒）
+DEFAULT_FLUSH_INTERVAL = 1.0
+# 队列满时 block 模式的最长等待时间（秒），超时后丢弃
+DEFAULT_PUT_TIMEOUT = 5.0
+# 队列满时的处理方式: block 等待写入线程（背压），drop 直接丢弃
+OVERFLOW_POLICIES = ("block", "drop")
+
+
+class TaskLogWriter:
+    """
+    任务实例日志的缓冲写入器
+
+    调用方只把日志行放入有界队列，后台线程持有打开的日志文件，攒够 batch_size 行或
+    距上次写入超过 flush_interval 秒时批量写入，避免每条日志都打开、追加、关闭文件。
+
+    队列满时按 overflow 处理: block 最多等待 put_timeout 秒后丢弃，drop 直接丢弃；
+    丢弃的行数在下次写入时记录到日志文件中。
+    """
+
+    def __init__(self, log_file, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, overflow="block", put_timeout=DEFAULT_PUT_TIMEOUT):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的队列溢出处理方式: {overflow}")
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"task-log-{os.path.basename(log_file)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, line):
+        """写入一行日志（不含换行符），队列满时按溢出策略丢弃，返回 False 表示写入器已关闭"""
+        if self._closed:
+            return False
+        try:
+            if self.overflow == "block":
+                self._queue.put(line, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+        return True
+
+    def flush(self, timeout=None):
+        """等待队列中已有的日志写入文件，返回是否在超时前完成"""
+        if self._closed or not self._thread.is_alive():
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """写入剩余日志并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        lines = []
+        waiters = []
+        last_write = time.time()
+        stop = False
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            while not stop:
+                timeout = max(0.0, self.flush_interval - (time.time() - last_write))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        lines.append(item)
+                except queue.Empty:
+                    pass
+
+                if (stop or waiters or len(lines) >= self.batch_size
+                        or time.time() - last_write >= self.flush_interval):
+                    self._write_lines(f, lines)
+                    lines = []
+                    last_write = time.time()
+                    for waiter in waiters:
+                        waiter.set()
+                    waiters = []
+
+    def _write_lines(self, f, lines):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append(f"[日志队列已满，丢弃了 {dropped} 行日志]")
+        if not lines:
+            return
+        try:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+        except OSError as e:
+            print(f"写入任务日志失败 ({self.log_file}): {str(e)}")